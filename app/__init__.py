@@ -1,5 +1,5 @@
 import os
-from flask import Flask
+from flask import Flask, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from flask_migrate import Migrate
@@ -53,7 +53,8 @@ def create_app(*args, **kwargs):
     # Add after_request handler to prevent caching of authenticated pages
     @app.after_request
     def add_cache_headers(response):
-        if current_user.is_authenticated:
+        # Conditional API responses (ETag + revalidation) set their own Cache-Control
+        if current_user.is_authenticated and not g.get('conditional_response'):
             # Tell browsers not to cache authenticated pages
             response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
             response.headers['Pragma'] = 'no-cache'
@@ -72,24 +73,19 @@ def create_app(*args, **kwargs):
     app.register_blueprint(student)
     app.register_blueprint(admin)
     
+    # Maintenance commands (flask rebuild-gradebook, ...)
+    from app.cli import register_commands
+    register_commands(app)
+    
     # Add context processor for section teachers
     @app.context_processor
     def section_teachers():
         from flask_login import current_user
-        from app.models.user import User
+        from app.services.enrollments import get_section_teachers
         
         if current_user.is_authenticated and current_user.is_student():
-            # Get active sections
-            active_sections = current_user.get_active_sections()
-            
-            # Get teachers for each section
-            section_teachers = {}
-            for section in active_sections:
-                teacher = User.query.get(section.creator_id)
-                if teacher:
-                    section_teachers[section.id] = teacher
-            
-            return {'section_teachers': section_teachers}
+            # Section -> teacher map, cached per student (see ENROLLMENT_CACHE_TTL)
+            return {'section_teachers': get_section_teachers(current_user.id)}
         return {'section_teachers': {}}
     
     # Add context processor for current year
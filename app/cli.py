@@ -0,0 +1,51 @@
+"""
+Maintenance commands, run with ``flask <command>`` (FLASK_APP=run.py).
+"""
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('rebuild-gradebook')
+@click.option('--assignment', 'assignment_ids', type=int, multiple=True,
+              help='Only rebuild this assignment (may be repeated).')
+@with_appcontext
+def rebuild_gradebook_command(assignment_ids):
+    """Recompute the gradebook (latest result per student and question) from the submissions."""
+    from app.services.gradebook import rebuild_gradebook
+
+    totals = rebuild_gradebook(list(assignment_ids) or None)
+    click.echo(f"Rebuilt {totals['entries']} gradebook entries for {totals['assignments']} assignments.")
+
+
+@click.command('check-query-plans')
+@click.option('--seed', 'seed_rows', type=int, default=None,
+              help='Check against an in-memory SQLite copy of the schema seeded with this many rows.')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query.')
+@with_appcontext
+def check_query_plans_command(seed_rows, verbose):
+    """EXPLAIN the hot-path queries and fail if any of them reads a whole table."""
+    from app.services.query_plans import check_query_plans, seeded_sqlite_session
+
+    session = seeded_sqlite_session(seed_rows) if seed_rows else None
+    try:
+        results = check_query_plans(session)
+    finally:
+        if session is not None:
+            session.close()
+
+    for result in results:
+        click.echo(f"{'ok  ' if result.ok else 'SCAN'}  {result.name}")
+        if verbose or not result.ok:
+            for line in result.plan:
+                click.echo(f"        {line}")
+    failed = [result for result in results if not result.ok]
+    if failed:
+        raise click.ClickException(f"{len(failed)} of {len(results)} hot-path queries fall back to a full scan.")
+    click.echo(f"All {len(results)} hot-path queries use an index.")
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the app's CLI."""
+    app.cli.add_command(rebuild_gradebook_command)
+    app.cli.add_command(check_query_plans_command)
@@ -5,3 +5,8 @@ from app.models.submission import Submission
 from app.models.section import Section
 from app.models.section_assignment import SectionAssignment
 from app.models.allowed_database import AllowedDatabase 
+from app.models.answer_key import AnswerKeySnapshot
+from app.models.background_job import BackgroundJob
+from app.models.version_stamp import VersionStamp
+from app.models.gradebook_entry import GradebookEntry
+from app.models.daily_counter import DailyCounter
@@ -0,0 +1,33 @@
+from app import db
+from datetime import datetime
+from sqlalchemy.dialects.mysql import LONGTEXT
+import json
+
+class AnswerKeySnapshot(db.Model):
+    """Precomputed result of a question's correct_answer query, used for grading"""
+    __tablename__ = 'answer_key_snapshots'
+    __table_args__ = {'mysql_auto_increment': 100000}
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, unique=True)
+    source_hash = db.Column(db.String(64), nullable=False)  # Fingerprint of the inputs the snapshot was computed from
+    column_names = db.Column(db.Text, nullable=False)  # JSON list of column names
+    column_types = db.Column(db.Text, nullable=True)  # JSON list of driver type codes
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    ordered_hash = db.Column(db.String(64), nullable=False)  # Depends on row order
+    unordered_hash = db.Column(db.String(64), nullable=False)  # Same for any row order
+    rows_json = db.Column(db.Text().with_variant(LONGTEXT, 'mysql'), nullable=True)  # Rows, only kept for small results
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def get_column_names(self):
+        return json.loads(self.column_names) if self.column_names else []
+
+    def get_column_types(self):
+        return json.loads(self.column_types) if self.column_types else []
+
+    def get_rows(self):
+        """Return the stored rows, or None if the result was too large to keep"""
+        return json.loads(self.rows_json) if self.rows_json is not None else None
+
+    def __repr__(self):
+        return f"AnswerKeySnapshot(question_id: {self.question_id}, rows: {self.row_count})"
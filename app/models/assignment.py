@@ -22,7 +22,10 @@ class Assignment(db.Model):
 
 class AssignmentQuestion(db.Model):
     __tablename__ = 'assignment_questions'
-    __table_args__ = {'mysql_auto_increment': 100000}
+    __table_args__ = (
+        db.Index('ix_assignment_questions_assignment_order', 'assignment_id', 'order', 'question_id', 'score'),
+        {'mysql_auto_increment': 100000}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
@@ -0,0 +1,56 @@
+from app import db
+from datetime import datetime
+import json
+
+class BackgroundJob(db.Model):
+    """Long-running work (schema deploys, table drops) executed outside the request thread"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = (
+        db.Index('ix_background_jobs_type_target_status', 'job_type', 'target_id', 'status'),
+        {'mysql_auto_increment': 100000}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'schema_deploy', 'schema_drop', ...
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    phase = db.Column(db.String(50), nullable=True)  # Current step reported by the job
+    progress = db.Column(db.Text, nullable=True)  # JSON counters (statements processed, rows loaded, ...)
+    result = db.Column(db.Text, nullable=True)  # JSON result of a finished job
+    error = db.Column(db.Text, nullable=True)
+    target_id = db.Column(db.Integer, nullable=True)  # e.g. the SchemaImport being deployed
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    def __repr__(self):
+        return f"BackgroundJob('{self.job_type}', status: {self.status})"
+    
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+    
+    def get_progress(self):
+        return json.loads(self.progress) if self.progress else {}
+    
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'phase': self.phase,
+            'progress': self.get_progress(),
+            'result': self.get_result(),
+            'error': self.error,
+            'target_id': self.target_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
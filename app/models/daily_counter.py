@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+class DailyCounter(db.Model):
+    """Running count of an event (e.g. submissions) for one UTC day"""
+    __tablename__ = 'daily_counters'
+    __table_args__ = (
+        db.UniqueConstraint('name', 'day', name='unique_daily_counter'),
+        {'mysql_auto_increment': 100000}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # 'submissions', ...
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"DailyCounter({self.name} {self.day}: {self.count})"
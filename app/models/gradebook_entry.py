@@ -0,0 +1,26 @@
+from app import db
+from datetime import datetime
+
+class GradebookEntry(db.Model):
+    """A student's latest result on one question of an assignment, kept in step with their submissions"""
+    __tablename__ = 'gradebook_entries'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'assignment_id', 'question_id', name='unique_gradebook_entry'),
+        db.Index('ix_gradebook_entries_assignment_student', 'assignment_id', 'student_id'),
+        {'mysql_auto_increment': 100000}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
+    submission_id = db.Column(db.Integer, nullable=False)  # The latest submission
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)  # Result of the latest submission
+    points_earned = db.Column(db.Integer, nullable=False, default=0)  # Question score if correct, else 0
+    attempts = db.Column(db.Integer, nullable=False, default=1)  # Submissions for this question
+    correct_attempts = db.Column(db.Integer, nullable=False, default=0)  # ... of which were correct
+    submitted_at = db.Column(db.DateTime, nullable=True)  # Time of the latest submission
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"GradebookEntry(student_id: {self.student_id}, question_id: {self.question_id}, is_correct: {self.is_correct})"
@@ -12,7 +12,7 @@ class Question(db.Model):
     question_type = db.Column(db.String(50), nullable=False)  # 'multiple_choice', 'free_response', 'fill_in_blank'
     difficulty = db.Column(db.Integer, nullable=False)  # 1-5 scale
     correct_answer = db.Column(db.Text, nullable=False)  # SQL query or answer
-    sample_db_schema = db.Column(db.Text, nullable=True)  # SQL schema to load (optional if using existing DB)
+    sample_db_schema = db.deferred(db.Column(db.Text, nullable=True))  # SQL schema to load (optional if using existing DB); loaded on first access
     db_type = db.Column(db.String(20), default='sqlite', nullable=False)  # 'sqlite', 'mysql', or 'imported_schema'
     mysql_db_name = db.Column(db.String(100), nullable=True)  # Name of MySQL database if using existing DB
     schema_import_id = db.Column(db.Integer, db.ForeignKey('schema_imports.id'), nullable=True)  # Reference to imported schema
@@ -24,6 +24,8 @@ class Question(db.Model):
     submissions = db.relationship('Submission', backref='question', lazy=True)
     assignment_questions = db.relationship('AssignmentQuestion', backref='question', lazy=True)
     schema_import = db.relationship('SchemaImport', backref='questions', lazy=True)
+    answer_key_snapshot = db.relationship('AnswerKeySnapshot', backref='question', lazy=True,
+                                          uselist=False, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f"Question('{self.title}', '{self.question_type}', difficulty: {self.difficulty})"
@@ -1,6 +1,9 @@
 from app import db
 from datetime import datetime
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT
+import hashlib
+import json
+import zlib
 
 class SchemaImport(db.Model):
     __tablename__ = 'schema_imports'
@@ -9,11 +12,47 @@ class SchemaImport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    schema_content = db.Column(LONGTEXT, nullable=False)  # Use LONGTEXT for large schema files (up to 4GB)
+    # The uploaded dump is stored zlib-compressed; both content columns are deferred so that
+    # loading a schema (e.g. through Question.schema_import) only reads its metadata
+    legacy_schema_content = db.deferred(db.Column('schema_content', db.Text().with_variant(LONGTEXT, 'mysql'), nullable=True))  # Uncompressed content of rows imported before compression
+    content_compressed = db.deferred(db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'), nullable=True))
+    content_size = db.Column(db.BigInteger, nullable=True)  # Uncompressed size in bytes
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the uncompressed content
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     is_template = db.Column(db.Boolean, default=False)  # Whether this is a template schema
     active_schema_name = db.Column(db.String(100), nullable=True)  # The name of the schema where this is currently deployed
+    table_names = db.Column(db.Text, nullable=True)  # JSON list of table names, recorded when the schema is deployed
+    table_hashes = db.Column(db.Text, nullable=True)  # JSON map of table name -> content hash of the deployed statements
     
     def __repr__(self):
         return f"SchemaImport('{self.name}', created_at: {self.created_at})" 
+    
+    @property
+    def schema_content(self):
+        """The uploaded SQL dump (decompressed on every access, so keep a local copy)"""
+        if self.content_compressed is not None:
+            return zlib.decompress(self.content_compressed).decode('utf-8')
+        return self.legacy_schema_content
+    
+    @schema_content.setter
+    def schema_content(self, content):
+        data = content.encode('utf-8')
+        self.content_compressed = zlib.compress(data, 6)
+        self.content_size = len(data)
+        self.content_hash = hashlib.sha256(data).hexdigest()
+        self.legacy_schema_content = None
+    
+    def get_table_names(self):
+        """Return the recorded table names, or None if they have not been indexed yet"""
+        return json.loads(self.table_names) if self.table_names else None
+    
+    def set_table_names(self, names):
+        self.table_names = json.dumps(list(names))
+    
+    def get_table_hashes(self):
+        """Return the per-table hashes of the last deployment, or None if none were recorded"""
+        return json.loads(self.table_hashes) if self.table_hashes else None
+    
+    def set_table_hashes(self, hashes):
+        self.table_hashes = json.dumps(dict(hashes))
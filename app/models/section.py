@@ -50,21 +50,9 @@ class Section(db.Model):
     
     @classmethod
     def find_by_token(cls, token):
-        """Find a section by its invitation token"""
-        if not token:
-            logging.debug("Empty token provided")
-            return None
-            
-        # Get all sections to check for token match
-        sections = cls.query.all()
-        for section in sections:
-            logging.debug(f"Comparing: '{token}' with '{section.invitation_token}'")
-            if section.invitation_token and section.invitation_token == token:
-                logging.debug(f"Found matching section: {section.name}")
-                return section
-
-        logging.debug(f"No section found with token: {token}")
-        return cls.query.filter_by(invitation_token=token).first()
+        """Find a section by its invitation token (indexed lookup, cached per process)"""
+        from app.services.invitations import find_section_by_token
+        return find_section_by_token(token)
     
     def __repr__(self):
         return f'<Section {self.name}>' 
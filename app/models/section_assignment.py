@@ -5,6 +5,7 @@ class SectionAssignment(db.Model):
     __tablename__ = 'section_assignments'
     __table_args__ = (
         db.UniqueConstraint('section_id', 'assignment_id', name='unique_section_assignment'),
+        db.Index('ix_section_assignments_section_active', 'section_id', 'is_active', 'assignment_id'),
         {'mysql_auto_increment': 100000}
     )
     
@@ -3,7 +3,13 @@ from datetime import datetime
 
 class Submission(db.Model):
     __tablename__ = 'submissions'
-    __table_args__ = {'mysql_auto_increment': 100000}
+    __table_args__ = (
+        db.Index('ix_submissions_student_assignment', 'student_id', 'assignment_id', 'question_id', 'submitted_at'),
+        db.Index('ix_submissions_assignment_student', 'assignment_id', 'student_id', 'question_id'),
+        db.Index('ix_submissions_question', 'question_id'),
+        db.Index('ix_submissions_submitted_at', 'submitted_at'),
+        {'mysql_auto_increment': 100000}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -16,3 +22,8 @@ class Submission(db.Model):
     
     def __repr__(self):
         return f"Submission(student_id: {self.student_id}, question_id: {self.question_id}, is_correct: {self.is_correct})" 
+    
+    @classmethod
+    def summary_query(cls):
+        """Query that leaves out the answer and feedback text, for views that only count or grade"""
+        return cls.query.options(db.defer(cls.submitted_answer), db.defer(cls.feedback))
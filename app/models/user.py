@@ -1,12 +1,15 @@
 from app import db, login_manager
+from app.services.passwords import HASH_COLUMN_LENGTH, hash_password, verify_password
+from flask import g, has_request_context
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 class StudentEnrollment(db.Model):
     __tablename__ = 'student_enrollments'
     __table_args__ = (
         db.UniqueConstraint('student_id', 'section_id', name='unique_student_section'),
+        db.Index('ix_student_enrollments_student_active', 'student_id', 'is_active', 'section_id'),
+        db.Index('ix_student_enrollments_section_active', 'section_id', 'is_active', 'student_id'),
         {'mysql_auto_increment': 100000}
     )
     
@@ -26,7 +29,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(HASH_COLUMN_LENGTH), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'student', 'teacher', or 'admin'
     first_name = db.Column(db.String(50), nullable=False, default='User')
     last_name = db.Column(db.String(50), nullable=False, default='Account')
@@ -50,10 +53,10 @@ class User(UserMixin, db.Model):
         return f"{self.first_name} {self.last_name}"
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def is_teacher(self):
         return self.role == 'teacher'
@@ -76,11 +79,18 @@ class User(UserMixin, db.Model):
         return []
     
     def get_active_sections(self):
-        """Get all sections the student is actively enrolled in"""
+        """Get all sections the student is actively enrolled in (kept for the rest of the request)"""
         from app.models.section import Section
-        enrollments = self.get_active_enrollments()
-        section_ids = [enrollment.section_id for enrollment in enrollments]
-        return Section.query.filter(Section.id.in_(section_ids)).all() if section_ids else []
+        if not self.is_student():
+            return []
+        cache = g.setdefault('_active_sections', {}) if has_request_context() else {}
+        if self.id not in cache:
+            cache[self.id] = (Section.query
+                              .join(StudentEnrollment, StudentEnrollment.section_id == Section.id)
+                              .filter(StudentEnrollment.student_id == self.id,
+                                      StudentEnrollment.is_active == True)
+                              .all())
+        return list(cache[self.id])
     
     def get_section_teachers(self):
         """Get all teachers whose sections this student is enrolled in"""
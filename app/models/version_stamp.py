@@ -0,0 +1,20 @@
+from app import db
+from datetime import datetime
+
+class VersionStamp(db.Model):
+    """Change counter for a section or a student, used to validate cached responses"""
+    __tablename__ = 'version_stamps'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_id', name='unique_version_stamp'),
+        {'mysql_auto_increment': 100000}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # 'section' or 'student'
+    scope_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    next_due_at = db.Column(db.DateTime, nullable=True)  # Sections: earliest upcoming due date of an active assignment
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"VersionStamp({self.scope} {self.scope_id}: {self.version})"
@@ -1,14 +1,14 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, session
 from flask_login import login_required, current_user
 from app import db
-from app.models import User, Section, Assignment, Question, Submission, StudentEnrollment, AllowedDatabase
+from app.models import User, Section, Submission, StudentEnrollment, AllowedDatabase
 from functools import wraps
 import mysql.connector
 import os
 import sys
 import pymysql
 from datetime import datetime, timedelta
-from sqlalchemy import text, func
+from sqlalchemy import text
 
 admin = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -38,50 +38,10 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Admin dashboard with system overview"""
+    from app.services.admin_stats import get_dashboard_stats
     
-    # Get user statistics
-    total_users = User.query.count()
-    total_students = User.query.filter_by(role='student').count()
-    total_teachers = User.query.filter_by(role='teacher').count()
-    total_admins = User.query.filter_by(role='admin').count()
-    
-    # Get section statistics
-    total_sections = Section.query.count()
-    active_enrollments = StudentEnrollment.query.filter_by(is_active=True).count()
-    
-    # Get assignment statistics
-    total_assignments = Assignment.query.count()
-    total_questions = Question.query.count()
-    total_submissions = Submission.query.count()
-    
-    # Get recent activities (last 7 days)
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_users = User.query.filter(User.created_at >= week_ago).count()
-    recent_submissions = Submission.query.filter(Submission.submitted_at >= week_ago).count()
-    
-    # Get database information
-    db_info = get_database_info()
-    
-    stats = {
-        'users': {
-            'total': total_users,
-            'students': total_students,
-            'teachers': total_teachers,
-            'admins': total_admins,
-            'recent': recent_users
-        },
-        'sections': {
-            'total': total_sections,
-            'enrollments': active_enrollments
-        },
-        'assignments': {
-            'total': total_assignments,
-            'questions': total_questions,
-            'submissions': total_submissions,
-            'recent_submissions': recent_submissions
-        },
-        'database': db_info
-    }
+    # Counts come from a snapshot refreshed in the background (see ADMIN_STATS_TTL)
+    stats = get_dashboard_stats()
     
     return render_template('admin/dashboard.html', stats=stats)
 
@@ -135,7 +95,7 @@ def user_detail(user_id):
         enrollments = []
     
     # Get user's submissions
-    submissions = Submission.query.filter_by(student_id=user.id).order_by(
+    submissions = Submission.summary_query().filter_by(student_id=user.id).order_by(
         Submission.submitted_at.desc()
     ).limit(10).all()
     
@@ -231,7 +191,7 @@ def manage_database():
     db_stats = get_detailed_database_stats()
     
     # Get recent database activities
-    recent_submissions = Submission.query.order_by(
+    recent_submissions = Submission.summary_query().order_by(
         Submission.submitted_at.desc()
     ).limit(20).all()
     
@@ -277,48 +237,61 @@ def system_info():
     
     system_info['database_status'] = db_status
     
-    return render_template('admin/system.html', system_info=system_info)
+    # Sandbox connection pools are per worker process
+    from app.services.sandbox import get_pool_stats
+    from app.services.sqlite_sandbox import get_template_cache_stats
+    from app.services.query_rewrite import get_rewrite_cache_stats
+    from app.services.progress import get_progress_cache_stats
+    from app.services.events import get_event_bus_stats
+    from app.services.enrollments import get_enrollment_cache_stats
+    sandbox_stats = get_pool_stats()
+    sandbox_stats['sqlite_templates'] = get_template_cache_stats()
+    sandbox_stats['query_rewrites'] = get_rewrite_cache_stats()
+    sandbox_stats['student_progress'] = get_progress_cache_stats()
+    sandbox_stats['event_bus'] = get_event_bus_stats()
+    sandbox_stats['enrollments'] = get_enrollment_cache_stats()
+    
+    return render_template('admin/system.html', system_info=system_info, sandbox_stats=sandbox_stats)
 
 @admin.route('/api/stats')
 @login_required
 @admin_required
 def api_stats():
     """API endpoint for dashboard statistics"""
+    from app.services.admin_stats import SUBMISSIONS, get_counter, get_dashboard_stats
     
-    # Get real-time statistics
+    snapshot = get_dashboard_stats()
     stats = {
-        'active_users': User.query.count(),
+        'active_users': snapshot['users']['total'],
         'active_sessions': 1,  # This would need session tracking
-        'total_submissions_today': Submission.query.filter(
-            func.date(Submission.submitted_at) == datetime.utcnow().date()
-        ).count(),
-        'database_size': get_database_size()
+        'total_submissions_today': get_counter(SUBMISSIONS),
+        'database_size': snapshot['database']['size_mb']
     }
     
     return jsonify(stats)
 
-def get_database_info():
-    """Get basic database information"""
-    try:
-        # Get database name
-        result = db.session.execute(text('SELECT DATABASE() as db_name'))
-        db_name = result.fetchone()[0]
-        
-        # Get table count
-        result = db.session.execute(text('SHOW TABLES'))
-        table_count = len(result.fetchall())
-        
-        return {
-            'name': db_name,
-            'tables': table_count,
-            'status': 'Connected'
-        }
-    except Exception as e:
-        return {
-            'name': 'Unknown',
-            'tables': 0,
-            'status': f'Error: {str(e)}'
-        }
+@admin.route('/api/sandbox-pools')
+@login_required
+@admin_required
+def api_sandbox_pools():
+    """API endpoint for sandbox pool, cache and event bus statistics (this worker process)"""
+    from app.services.sandbox import get_pool_stats
+    from app.services.sqlite_sandbox import get_template_cache_stats
+    from app.services.query_rewrite import get_rewrite_cache_stats
+    from app.services.progress import get_progress_cache_stats
+    from app.services.events import get_event_bus_stats
+    from app.services.enrollments import get_enrollment_cache_stats
+    from app.services.invitations import get_invitation_cache_stats
+    from app.services.passwords import get_password_pool_stats
+    stats = get_pool_stats()
+    stats['sqlite_templates'] = get_template_cache_stats()
+    stats['query_rewrites'] = get_rewrite_cache_stats()
+    stats['student_progress'] = get_progress_cache_stats()
+    stats['event_bus'] = get_event_bus_stats()
+    stats['enrollments'] = get_enrollment_cache_stats()
+    stats['invitations'] = get_invitation_cache_stats()
+    stats['password_hashing'] = get_password_pool_stats()
+    return jsonify(stats)
 
 def get_detailed_database_stats():
     """Get detailed database statistics"""
@@ -356,6 +329,8 @@ def get_detailed_database_stats():
 @admin_required
 def database_cleanup():
     """Perform database cleanup operations"""
+    from app.services.gradebook import refresh_entries
+    
     try:
         # Clean up old temporary data
         cutoff_date = datetime.utcnow() - timedelta(days=30)
@@ -369,6 +344,7 @@ def database_cleanup():
         cleanup_count = len(old_submissions)
         for submission in old_submissions:
             db.session.delete(submission)
+        refresh_entries({(s.student_id, s.assignment_id, s.question_id) for s in old_submissions})
         
         # Clean up inactive enrollments (older than 90 days)
         old_enrollments = StudentEnrollment.query.filter(
@@ -614,7 +590,7 @@ def view_system_logs():
             })
         
         # Get recent submissions
-        recent_submissions = Submission.query.order_by(Submission.submitted_at.desc()).limit(10).all()
+        recent_submissions = Submission.summary_query().order_by(Submission.submitted_at.desc()).limit(10).all()
         for submission in recent_submissions:
             status = 'CORRECT' if submission.is_correct else 'INCORRECT' if submission.is_correct is not None else 'PENDING'
             log_entries.append({
@@ -633,19 +609,6 @@ def view_system_logs():
         flash(f'Error loading system logs: {str(e)}', 'danger')
         return redirect(url_for('admin.system_info'))
 
-def get_database_size():
-    """Get total database size in MB"""
-    try:
-        result = db.session.execute(text("""
-            SELECT ROUND(SUM((DATA_LENGTH + INDEX_LENGTH) / 1024 / 1024), 2) as size_mb
-            FROM information_schema.TABLES 
-            WHERE TABLE_SCHEMA = DATABASE()
-        """))
-        size = result.fetchone()[0]
-        return size or 0
-    except Exception:
-        return 0
-
 @admin.route('/database/allowed', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -722,6 +685,10 @@ def manage_allowed_databases():
             
             flash(f'Database "{database_name}" has been removed from the allowed list.', 'success')
         
+        # Forget this worker's cached database name lookups (other workers refresh after SANDBOX_DB_CACHE_TTL)
+        from app.services.sandbox import invalidate_resolved_database
+        invalidate_resolved_database()
+        
         return redirect(url_for('admin.manage_allowed_databases'))
     
     # GET request - show the management page
@@ -799,6 +766,8 @@ def scan_and_add_databases():
         conn.close()
         
         if added_count > 0:
+            from app.services.sandbox import invalidate_resolved_database
+            invalidate_resolved_database()
             flash(f'Added {added_count} common databases to the allowed list.', 'success')
         else:
             flash('No new common databases found to add.', 'info')
@@ -3,6 +3,8 @@ from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlparse
 from app import db
 from app.models import User, Section, StudentEnrollment
+from app.services.enrollments import invalidate_enrollments
+from app.services.passwords import PasswordHashBusy, upgrade_hash
 from flask_login import user_logged_in
 from flask import current_app, jsonify
 import os
@@ -27,11 +29,21 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            password_ok = user is not None and user.check_password(password)
+        except PasswordHashBusy:
+            flash('Too many people are signing in right now. Please try again in a few seconds.', 'warning')
+            return render_template('auth/login.html'), 503
+        
+        if password_ok:
             if not user.is_active:
                 flash('Access denied. Your account has been deactivated. Please contact an administrator.', 'danger')
                 return render_template('auth/login.html')
             
+            # Move the stored hash to the current PASSWORD_HASH_METHOD while the password is at hand
+            if upgrade_hash(user, password):
+                db.session.commit()
+            
             login_user(user, remember=request.form.get('remember_me'))
             next_page = request.args.get('next')
             if not next_page or urlparse(next_page).netloc != '':
@@ -117,7 +129,11 @@ def register():
             last_name=last_name, 
             role=role
         )
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordHashBusy:
+            flash('Too many people are signing in right now. Please try again in a few seconds.', 'warning')
+            return render_template('auth/register.html'), 503
         
         db.session.add(new_user)
         db.session.commit()
@@ -178,7 +194,11 @@ def register_with_token(token):
             last_name=last_name,
             role=role
         )
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordHashBusy:
+            flash('Too many people are signing in right now. Please try again in a few seconds.', 'warning')
+            return render_template('auth/register_with_token.html', section=section, token=token), 503
         
         # Add the user first to get an ID
         db.session.add(new_user)
@@ -247,6 +267,7 @@ def join_section(token):
             # Reactivate the enrollment
             existing_enrollment.is_active = True
             db.session.commit()
+            invalidate_enrollments(student_ids=[current_user.id])
             flash(f'Your enrollment in the {section.name} section has been reactivated!', 'success')
     else:
         # Create new enrollment
@@ -257,6 +278,7 @@ def join_section(token):
         )
         db.session.add(enrollment)
         db.session.commit()
+        invalidate_enrollments(student_ids=[current_user.id])
         flash(f'You have successfully joined the {section.name} section!', 'success')
     
     return redirect(url_for('student.dashboard'))
@@ -300,6 +322,7 @@ def process_invitation(sender, user):
                     # Reactivate the enrollment
                     existing_enrollment.is_active = True
                     db.session.commit()
+                    invalidate_enrollments(student_ids=[user.id])
                     flash(f'Your enrollment in the {section.name} section has been reactivated!', 'success')
             else:
                 # Create new enrollment
@@ -310,6 +333,7 @@ def process_invitation(sender, user):
                 )
                 db.session.add(enrollment)
                 db.session.commit()
+                invalidate_enrollments(student_ids=[user.id])
                 flash(f'You have successfully joined the {section.name} section!', 'success')
 
 # Register the callback with Flask-Login
@@ -324,7 +348,12 @@ def change_password():
         confirm_password = request.form.get('confirm_password')
         
         # Validate current password
-        if not current_user.check_password(current_password):
+        try:
+            password_ok = current_user.check_password(current_password)
+        except PasswordHashBusy:
+            flash('The server is busy. Please try again in a few seconds.', 'warning')
+            return redirect(url_for('auth.change_password'))
+        if not password_ok:
             flash('Current password is incorrect', 'danger')
             return redirect(url_for('auth.change_password'))
         
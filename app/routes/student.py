@@ -2,16 +2,26 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import current_user, login_required
 from app import db, csrf
 from app.models import User, Question, Assignment, AssignmentQuestion, Submission, Section, SectionAssignment, StudentEnrollment
-from sqlalchemy import text, create_engine
 from datetime import datetime
 import sqlite3
 import pymysql
-import pandas as pd
 import json
 import uuid
 import os
-from flask import session
+from contextlib import closing
+from flask import session, Response, stream_with_context
 import logging
+import time
+from app.services.sandbox import get_sandbox_connection, get_question_connection
+from app.services.sqlite_sandbox import get_sqlite_connection
+from app.services.query_rewrite import rewrite_for_schema_import
+from app.services.grading import ResultFingerprint, comparator_for, get_answer_key, open_streaming_cursor
+from app.services.progress import get_section_progress, invalidate_student_progress
+from app.services.events import (close_stream, events_enabled, format_sse, open_stream, publish_event,
+                                 section_channel, student_channel, subscribe)
+from app.services.gradebook import load_entries, record_submission
+from app.services.admin_stats import count_submission
+from app.services.version_stamps import bump_versions, conditional_json, get_versions, make_etag
 # logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 student = Blueprint('student', __name__, url_prefix='/student')
@@ -84,69 +94,18 @@ def dashboard():
     # Get the teacher for the current section
     teacher = User.query.get(current_section.creator_id) if current_section else None
     
-    # Get all assignments for this student's current section that are active
-    section_assignments = SectionAssignment.query.filter_by(section_id=current_section.id, is_active=True).all()
-    assignment_ids = [sa.assignment_id for sa in section_assignments]
-    
-    # Make sure assignments have questions
-    valid_assignment_ids = db.session.query(AssignmentQuestion.assignment_id)\
-        .filter(AssignmentQuestion.assignment_id.in_(assignment_ids))\
-        .distinct()
+    # Question, answered and correct counts for every active assignment in one (cached) query;
+    # assignments without questions are left out
+    assignment_stats = get_section_progress(current_user.id, current_section.id)
     
     # Get the assignments
-    assignments = Assignment.query.filter(Assignment.id.in_(valid_assignment_ids)).all()
+    assignments = Assignment.query.filter(Assignment.id.in_(list(assignment_stats))).all() if assignment_stats else []
 
     logging.debug(f"Total assignments found for section {current_section.id}: {len(assignments)}")
 
-    # Get submission stats for each assignment
-    assignment_stats = {}
-    completed_assignments = 0
-    
-    for assignment in assignments:
-        # Find all questions in the assignment
-        assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).all()
-        question_count = len(assignment_questions)
-        question_ids = [aq.question_id for aq in assignment_questions]
-        
-        # Find all submissions by this student for this assignment
-        submissions = Submission.query.filter_by(
-            student_id=current_user.id, 
-            assignment_id=assignment.id
-        ).all()
-        
-        # Only count submissions for questions that are still part of the assignment
-        valid_submissions = [s for s in submissions if s.question_id in question_ids]
-        
-        # For each question, keep only the most recent submission
-        latest_submissions_by_question = {}
-        for submission in valid_submissions:
-            question_id = submission.question_id
-            if question_id not in latest_submissions_by_question or submission.submitted_at > latest_submissions_by_question[question_id].submitted_at:
-                latest_submissions_by_question[question_id] = submission
-        
-        # Get unique questions that have been submitted with the latest submission
-        submitted_question_ids = set(latest_submissions_by_question.keys())
-        
-        # Count correct submissions
-        correct_count = sum(1 for s in latest_submissions_by_question.values() if s.is_correct)
-        
-        # Store the stats
-        assignment_stats[assignment.id] = {
-            'question_count': question_count,
-            'submitted_count': len(submitted_question_ids),
-            'correct_count': correct_count
-        }
-        
-        # Check if this assignment is completed - all questions must have submissions
-        if question_count > 0 and len(submitted_question_ids) == question_count:
-            completed_assignments += 1
-            logging.debug(f"Assignment {assignment.id} '{assignment.title}' is COMPLETED")
-        else:
-            logging.debug(f"Assignment {assignment.id} '{assignment.title}' is NOT completed:")
-            logging.debug(f"  Question count: {question_count}")
-            logging.debug(f"  Unique submitted questions: {len(submitted_question_ids)}")
-            logging.debug(f"  Question IDs: {question_ids}")
-            logging.debug(f"  Submitted Question IDs: {submitted_question_ids}")
+    # An assignment is completed once every question has a submission
+    completed_assignments = sum(1 for stats in assignment_stats.values()
+                                if stats['question_count'] > 0 and stats['submitted_count'] == stats['question_count'])
 
     logging.debug(f"Total completed assignments: {completed_assignments}")
 
@@ -226,7 +185,6 @@ def view_assignment(assignment_id):
     # Get all questions for this assignment ordered by their order field
     assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).order_by(AssignmentQuestion.order).all()
     questions = [aq.question for aq in assignment_questions]
-    question_ids = [aq.question_id for aq in assignment_questions]
     
     # Debug: Print assignment questions and scores
     logging.debug(f"Assignment {assignment.id} '{assignment.title}' questions:")
@@ -236,45 +194,14 @@ def view_assignment(assignment_id):
     # Create a mapping of question_id to assignment_question for easy access to scores
     question_assignment_map = {aq.question_id: aq for aq in assignment_questions}
     
-    # Get all submissions for this assignment by this student
-    submissions = Submission.query.filter_by(
-        assignment_id=assignment.id, 
-        student_id=current_user.id
-    ).all()
-    
-    # Debug: Print all submissions found
-    logging.debug(f"Found {len(submissions)} submissions for student {current_user.id} on assignment {assignment.id}:")
-    for sub in submissions:
-        logging.debug(f"  Submission ID: {sub.id}, Question ID: {sub.question_id}, is_correct: {sub.is_correct}")
-            # Only keep submissions for questions that are still part of the assignment
-    valid_submissions = [s for s in submissions if s.question_id in question_ids]
-    
-    # For each question, keep only the most recent submission
-    submissions_by_question = {}
-    for submission in valid_submissions:
-        question_id = submission.question_id
-        if question_id not in submissions_by_question or submission.submitted_at > submissions_by_question[question_id].submitted_at:
-            submissions_by_question[question_id] = submission
-    
-    # Debug: Print submissions_by_question
-    logging.debug(f"Final submissions_by_question for calculating points:")
-    for q_id, sub in submissions_by_question.items():
-        logging.debug(f"  Question ID: {q_id}, is_correct: {sub.is_correct}, score in map: {question_assignment_map[q_id].score if q_id in question_assignment_map else 'N/A'}")
-    
-    # Calculate earned points for debugging
-    debug_earned_points = 0
-    for aq in assignment_questions:
-        if aq.question_id in submissions_by_question and submissions_by_question[aq.question_id].is_correct:
-            debug_earned_points += aq.score
-            logging.debug(f"  Adding {aq.score} points for correct question {aq.question_id}")
-
-    logging.debug(f"Total debug earned points: {debug_earned_points} out of {sum(aq.score for aq in assignment_questions)} possible")
-
+    # The latest result for each question still in the assignment, from the gradebook
+    entries = load_entries([current_user.id], [assignment.id]).get((current_user.id, assignment.id), {})
+    submissions_by_question = {question_id: entry for question_id, entry in entries.items()
+                               if question_id in question_assignment_map}
+    
     # Pre-calculate earned points to pass to template
-    earned_points = 0
-    for aq in assignment_questions:
-        if aq.question_id in submissions_by_question and submissions_by_question[aq.question_id].is_correct:
-            earned_points += aq.score
+    earned_points = sum(entry.points_earned for entry in submissions_by_question.values())
+    logging.debug(f"Earned points: {earned_points} out of {sum(aq.score for aq in assignment_questions)} possible")
     
     return render_template(
         'student/view_assignment.html',
@@ -380,80 +307,6 @@ def view_question(question_id):
         assignment_question=assignment_question
     )
 
-def get_student_db_connection(question):
-    """Create a restricted database connection for student query execution"""
-    if not question:
-        raise ValueError("Invalid question")
-        
-    if question.db_type == 'imported_schema':
-        if not question.schema_import or not question.schema_import.active_schema_name:
-            raise ValueError("Question's imported schema is not properly configured")
-            
-        # Connect to the sql_classroom database using root user
-        conn = pymysql.connect(
-            host=os.getenv('MYSQL_HOST', ''),
-            user=os.getenv('MYSQL_USER', ''),
-            password=os.getenv('MYSQL_PASSWORD', ''),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            # database='sql_classroom',
-            database=os.getenv('APP_DB_NAME', ''),
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        
-        return conn
-        
-    elif question.db_type == 'mysql':
-        if not question.mysql_db_name:
-            raise ValueError("Invalid question or missing database name")
-            
-        try:
-            # Get database prefixes from environment
-            assignments_prefix = os.getenv('ASSIGNMENTS_DB_PREFIX', 'student_assignment_')
-            template_prefix = os.getenv('TEMPLATE_DB_PREFIX', 'template_assignment_')
-            
-            # Connect using root user
-            conn = pymysql.connect(
-                host=os.getenv('MYSQL_HOST', ''),
-                user=os.getenv('MYSQL_USER', ''),
-                password=os.getenv('MYSQL_PASSWORD', ''),
-                port=int(os.getenv('MYSQL_PORT', 3306)),
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            with conn.cursor() as cursor:
-                # Check if database exists
-                cursor.execute("SHOW DATABASES")
-                databases = [row['Database'] for row in cursor.fetchall()]
-                
-                # Check both with and without prefixes
-                possible_names = [
-                    question.mysql_db_name,
-                    f"{assignments_prefix}{question.mysql_db_name}",
-                    f"{template_prefix}{question.mysql_db_name}"
-                ]
-                
-                db_name = None
-                for name in possible_names:
-                    if name in databases:
-                        db_name = name
-                        break
-                        
-                if not db_name:
-                    raise ValueError(f"Database '{question.mysql_db_name}' (or its prefixed versions) does not exist")
-                
-                # Use the found database
-                cursor.execute(f"USE {db_name}")
-            
-            return conn
-            
-        except Exception as e:
-            logging.error(f"Error connecting to database: {str(e)}")
-            if "Access denied" in str(e):
-                raise ValueError(f"Access denied to database. Please contact your teacher.")
-            raise
-    else:
-        raise ValueError(f"Unsupported database type: {question.db_type}")
-
 def validate_student_query(query):
     """Validate student query for potential harmful operations - DEPRECATED
     
@@ -496,36 +349,9 @@ def execute_query():
         logging.debug(f"Schema Import - Table prefix: {table_prefix}")
 
         if table_prefix:
-            # Get all table names from the schema content
-            schema_content = question.schema_import.schema_content
-            logging.debug(f"Schema content length: {len(schema_content)}")
-            logging.debug(f"Schema content preview: {schema_content[:200]}...")
-            
-            table_names = []
-            
-            # Parse CREATE TABLE statements to extract table names using utility function
-            from app.utils import parse_schema_statements
-            statements = parse_schema_statements(schema_content)
-            logging.debug(f"Parsed {len(statements)} statements")
-
-            for i, stmt in enumerate(statements):
-                logging.debug(f"Statement {i}: {stmt[:100]}...")
-                if stmt.upper().strip().startswith('CREATE TABLE'):
-                    logging.debug(f"Found CREATE TABLE statement")
-                    # Extract table name using the same logic as import
-                    table_start = stmt.upper().find('TABLE') + 5
-                    table_part = stmt[table_start:].strip()
-                    logging.debug(f"Table part after 'TABLE': '{table_part[:50]}...'")
-                    table_name = table_part.split()[0].strip('`').rstrip('(').strip('`')
-                    logging.debug(f"Extracted table name: '{table_name}'")
-                    table_names.append(table_name)
-
-            logging.debug(f"Found table names: {table_names}")
+            # Replace table names with prefixed versions (cached per schema and query)
             logging.debug(f"Original query: {query}")
-
-            # Replace table names with prefixed versions in the query using word boundaries
-            from app.utils import rewrite_query_for_schema
-            query = rewrite_query_for_schema(query, schema_content, table_prefix)
+            query = rewrite_for_schema_import(query, question.schema_import, table_prefix)
         else:
             logging.debug("No table prefix found - schema may not be deployed")
     else:
@@ -540,85 +366,83 @@ def execute_query():
 
                 logging.debug(f"Executing MySQL query: {query}")
 
-                # Get restricted connection
-                conn = get_student_db_connection(question)
-                
-                # Execute query and fetch results
-                with conn.cursor() as cursor:
-                    # Execute the query
-                    cursor.execute(query)
+                # Check out a pooled sandbox connection
+                with get_question_connection(question) as conn:
+                    # Execute query and fetch results
+                    with conn.cursor() as cursor:
+                        # Execute the query
+                        cursor.execute(query)
                     
-                    # Check if this is a SELECT query by looking for a result set
-                    if cursor.description:
-                        # For SELECT queries, get the results
-                        data = cursor.fetchall()
+                        # Check if this is a SELECT query by looking for a result set
+                        if cursor.description:
+                            # For SELECT queries, get the results
+                            data = cursor.fetchall()
                         
-                        # Get column names directly from cursor description
-                        columns = [col[0] for col in cursor.description]
+                            # Get column names directly from cursor description
+                            columns = [col[0] for col in cursor.description]
                         
-                        # Convert dictionary data to lists for JSON response
-                        rows = []
-                        for row in data:
-                            # Convert any non-JSON serializable objects to strings
-                            serializable_row = {}
-                            for key, value in row.items():
-                                if isinstance(value, (dict, list, str, int, float, bool, type(None))):
-                                    serializable_row[key] = value
-                                else:
-                                    serializable_row[key] = str(value)
+                            # Convert dictionary data to lists for JSON response
+                            rows = []
+                            for row in data:
+                                # Convert any non-JSON serializable objects to strings
+                                serializable_row = {}
+                                for key, value in row.items():
+                                    if isinstance(value, (dict, list, str, int, float, bool, type(None))):
+                                        serializable_row[key] = value
+                                    else:
+                                        serializable_row[key] = str(value)
                             
-                            # Ensure values are in the same order as columns
-                            row_values = [serializable_row.get(col) for col in columns]
-                            rows.append(row_values)
+                                # Ensure values are in the same order as columns
+                                row_values = [serializable_row.get(col) for col in columns]
+                                rows.append(row_values)
                         
-                        # Check if this is a SHOW TABLES query on an imported schema
-                        from app.utils import is_show_tables_query, is_show_databases_query
-                        if is_show_tables_query(query) and question.db_type == 'imported_schema':
-                            # For imported schema questions, filter the SHOW TABLES results
-                            # to only show the relevant tables without prefixes
-                            if question.schema_import and question.schema_import.active_schema_name:
-                                prefix = question.schema_import.active_schema_name
+                            # Check if this is a SHOW TABLES query on an imported schema
+                            from app.utils import is_show_tables_query, is_show_databases_query
+                            if is_show_tables_query(query) and question.db_type == 'imported_schema':
+                                # For imported schema questions, filter the SHOW TABLES results
+                                # to only show the relevant tables without prefixes
+                                if question.schema_import and question.schema_import.active_schema_name:
+                                    prefix = question.schema_import.active_schema_name
                                 
-                                # Filter tables that match this schema's prefix
-                                schema_tables = []
-                                for row in rows:
-                                    table_name = row[0]  # First column is table name
-                                    if table_name.startswith(prefix):
-                                        # Remove prefix to get clean table name
-                                        clean_name = table_name[len(prefix):]
-                                        schema_tables.append([clean_name])
+                                    # Filter tables that match this schema's prefix
+                                    schema_tables = []
+                                    for row in rows:
+                                        table_name = row[0]  # First column is table name
+                                        if table_name.startswith(prefix):
+                                            # Remove prefix to get clean table name
+                                            clean_name = table_name[len(prefix):]
+                                            schema_tables.append([clean_name])
                                 
-                                # Update the results to show only the clean table names
-                                if schema_tables:
-                                    rows = schema_tables
-                                    # Update column header to be cleaner
-                                    columns = ["Tables"]
-                        elif is_show_databases_query(query):
-                            # For SHOW DATABASES in question context, only show the database for this specific question
-                            question_database = None
+                                    # Update the results to show only the clean table names
+                                    if schema_tables:
+                                        rows = schema_tables
+                                        # Update column header to be cleaner
+                                        columns = ["Tables"]
+                            elif is_show_databases_query(query):
+                                # For SHOW DATABASES in question context, only show the database for this specific question
+                                question_database = None
                             
-                            if question.db_type == 'imported_schema':
-                                # For imported schemas, show the schema name
-                                if question.schema_import:
-                                    question_database = question.schema_import.name
-                            elif question.db_type == 'mysql':
-                                # For MySQL questions, show the configured database name
-                                question_database = question.mysql_db_name
+                                if question.db_type == 'imported_schema':
+                                    # For imported schemas, show the schema name
+                                    if question.schema_import:
+                                        question_database = question.schema_import.name
+                                elif question.db_type == 'mysql':
+                                    # For MySQL questions, show the configured database name
+                                    question_database = question.mysql_db_name
                             
-                            # Filter to only show the relevant database
-                            if question_database:
-                                rows = [[question_database]]
-                                columns = ["Database"]
+                                # Filter to only show the relevant database
+                                if question_database:
+                                    rows = [[question_database]]
+                                    columns = ["Database"]
                         
-                        result = {
-                            'columns': columns,
-                            'data': rows
-                        }
-                    else:
-                        # This shouldn't happen due to validation, but just in case
-                        return jsonify({'error': 'Only SELECT queries are allowed'}), 400
+                            result = {
+                                'columns': columns,
+                                'data': rows
+                            }
+                        else:
+                            # This shouldn't happen due to validation, but just in case
+                            return jsonify({'error': 'Only SELECT queries are allowed'}), 400
                 
-                conn.close()
                 return jsonify(result)
                 
             except ValueError as e:
@@ -632,35 +456,16 @@ def execute_query():
                 return jsonify({'error': str(e)}), 400
             
         elif question.db_type == 'sqlite':
-            # SQLite - Create a fresh in-memory database for each query execution
+            # SQLite - Each query execution gets a private copy of the cached schema template
             try:
-                logging.debug("Creating fresh SQLite in-memory database for query execution")
-                # Create SQLAlchemy in-memory engine with thread safety settings
-                engine = create_engine('sqlite:///:memory:', 
-                                       connect_args={'check_same_thread': False})
-                
-                # Create a new connection and load the schema
-                with engine.connect() as conn:
-                    # Load schema
-                    logging.debug(f"Loading schema: {question.sample_db_schema[:100]}...")
-                    schema_statements = question.sample_db_schema.split(';')
-                    trans = conn.begin()
-                    try:
-                        for statement in schema_statements:
-                            if statement.strip():
-                                try:
-                                    conn.execute(text(statement))
-                                except Exception as e:
-                                    logging.error(f"Error executing schema statement: {statement}\nError: {str(e)}")
-                                    trans.rollback()
-                                    return jsonify({'error': f'Error in schema: {str(e)}'}), 500
-                        trans.commit()
-                    except Exception as e:
-                        trans.rollback()
-                        logging.error(f"Error in schema transaction: {str(e)}")
-                        return jsonify({'error': f'Error in schema: {str(e)}'}), 500
+                try:
+                    conn = get_sqlite_connection(question.sample_db_schema)
+                except Exception as e:
+                    logging.error(f"Error loading SQLite schema: {str(e)}")
+                    return jsonify({'error': f'Error in schema: {str(e)}'}), 500
                 
-                    # Execute the query in a separate transaction
+                try:
+                    # Execute the query
                     logging.debug(f"Executing SQLite query: {query}")
 
                     # Check if it's a PRAGMA query
@@ -668,39 +473,34 @@ def execute_query():
                     # Check if it's a SELECT query
                     is_select = query.strip().upper().startswith('SELECT')
                     
-                    try:
-                        result_set = conn.execute(text(query))
+                    cursor = conn.execute(query)
+                    
+                    if is_pragma or is_select:
+                        # For PRAGMA and SELECT queries, return the result set
+                        columns = [col[0] for col in cursor.description] if cursor.description else []
+                        data = [list(row) for row in cursor.fetchall()]
                         
-                        if is_pragma or is_select:
-                            # For PRAGMA and SELECT queries, return the result set
-                            columns = list(result_set.keys())
-                            data = [list(row) for row in result_set]
-                            
-                            result = {
-                                'columns': columns,
-                                'data': data
-                            }
-                            logging.debug(f"Query returned {len(data)} rows with {len(columns)} columns")
-                            return jsonify(result)
-                        else:
-                            # Execute non-SELECT query
-                            trans = conn.begin()
-                            try:
-                                result_proxy = conn.execute(text(query))
-                                rowcount = result_proxy.rowcount
-                                trans.commit()
-                                result = {
-                                    'columns': ['Result'],
-                                    'data': [[f"{rowcount} row(s) affected"]]
-                                }
-                                logging.debug(f"Non-SELECT query affected {rowcount} rows")
-                                return jsonify(result)
-                            except Exception as e:
-                                trans.rollback()
-                                raise e
-                    except Exception as e:
-                        logging.error(f"Error executing query: {str(e)}")
-                        raise e
+                        result = {
+                            'columns': columns,
+                            'data': data
+                        }
+                        logging.debug(f"Query returned {len(data)} rows with {len(columns)} columns")
+                        return jsonify(result)
+                    else:
+                        # Non-SELECT query: changes only affect this request's private copy
+                        rowcount = cursor.rowcount
+                        conn.commit()
+                        result = {
+                            'columns': ['Result'],
+                            'data': [[f"{rowcount} row(s) affected"]]
+                        }
+                        logging.debug(f"Non-SELECT query affected {rowcount} rows")
+                        return jsonify(result)
+                except Exception as e:
+                    logging.error(f"Error executing query: {str(e)}")
+                    raise e
+                finally:
+                    conn.close()
                     
             except sqlite3.OperationalError as e:
                 error_msg = str(e).replace('\n', ' ')
@@ -752,29 +552,19 @@ def submit_answer():
     if assignment.due_date and assignment.due_date < now:
         return jsonify({'error': 'This assignment has passed its due date. You can no longer submit solutions.'}), 403
 
-    # For imported schemas, modify both queries to use prefixed table names
+    # For imported schemas, modify the student query to use prefixed table names
+    # (the teacher query is only rewritten if the answer key has to be recomputed)
     student_query = query
-    teacher_query = question.correct_answer
     
     if question.db_type == 'imported_schema':
         table_prefix = question.get_table_prefix()
         logging.debug(f"Submit Answer - Schema Import - Table prefix: {table_prefix}")
 
         if table_prefix:
-            # Get all table names from the schema content
-            schema_content = question.schema_import.schema_content
-            logging.debug(f"Submit Answer - Schema content length: {len(schema_content)}")
-
-            # Replace table names with prefixed versions in both queries
-            from app.utils import rewrite_query_for_schema
-
+            # Replace table names with prefixed versions in the student query
             logging.debug(f"Submit Answer - Original student query: {student_query}")
-            student_query = rewrite_query_for_schema(student_query, schema_content, table_prefix)
+            student_query = rewrite_for_schema_import(student_query, question.schema_import, table_prefix)
             logging.debug(f"Submit Answer - Rewritten student query: {student_query}")
-
-            logging.debug(f"Submit Answer - Original teacher query: {teacher_query}")
-            teacher_query = rewrite_query_for_schema(teacher_query, schema_content, table_prefix)
-            logging.debug(f"Submit Answer - Rewritten teacher query: {teacher_query}")
         else:
             logging.debug("Submit Answer - No table prefix found - schema may not be deployed")
     else:
@@ -787,58 +577,19 @@ def submit_answer():
                 # Validate the query first (use original query for validation)
                 validate_student_query(query)
                 
-                # Get restricted connection
-                conn = get_student_db_connection(question)
-                
-                # Execute student query (use rewritten query)
-                with conn.cursor() as cursor:
-                    cursor.execute(student_query)
-                    student_data = cursor.fetchall()
-                
-                # Execute teacher's correct query (use rewritten query)
-                with conn.cursor() as cursor:
-                    cursor.execute(teacher_query)
-                    teacher_data = cursor.fetchall()
-                
-                # Convert data to JSON-serializable format
-                def ensure_serializable(data_list):
-                    result = []
-                    for item in data_list:
-                        serializable_item = {}
-                        for key, value in item.items():
-                            if isinstance(value, (dict, list, str, int, float, bool, type(None))):
-                                serializable_item[key] = value
-                            else:
-                                serializable_item[key] = str(value)
-                        result.append(serializable_item)
-                    return result
-                
-                student_data = ensure_serializable(student_data)
-                teacher_data = ensure_serializable(teacher_data)
-                
-                # Convert to DataFrames for comparison
-                student_result = pd.DataFrame(student_data) if student_data else pd.DataFrame()
-                teacher_result = pd.DataFrame(teacher_data) if teacher_data else pd.DataFrame()
-                
-                # Compare results
-                is_correct = student_result.equals(teacher_result)
-                
-                # Generate feedback
-                if is_correct:
-                    feedback = "Correct! Your query produces the expected result."
-                else:
-                    feedback = "Incorrect. Your query does not produce the expected result."
-                    if student_result.shape != teacher_result.shape:
-                        feedback += f" Expected result has {teacher_result.shape[0]} rows and {teacher_result.shape[1]} columns, but your query returned {student_result.shape[0]} rows and {student_result.shape[1]} columns."
-                    elif len(student_result.columns) > 0 and len(teacher_result.columns) > 0 and set(student_result.columns) != set(teacher_result.columns):
-                        missing = set(teacher_result.columns) - set(student_result.columns)
-                        extra = set(student_result.columns) - set(teacher_result.columns)
-                        if missing:
-                            feedback += f" Missing columns: {', '.join(missing)}."
-                        if extra:
-                            feedback += f" Extra columns: {', '.join(extra)}."
+                # Check out a pooled sandbox connection
+                with get_question_connection(question) as conn:
+                    # Expected result from the stored answer key (computed on this connection if stale)
+                    answer_key = get_answer_key(question, conn)
+                    
+                    # Execute student query (use rewritten query), streaming rows into the fingerprint
+                    comparator = comparator_for(question)
+                    with closing(open_streaming_cursor(conn)) as cursor:
+                        cursor.execute(student_query)
+                        student_result = ResultFingerprint.from_cursor(cursor, float_places=comparator.float_places)
                 
-                conn.close()
+                # Compare results (row order matters)
+                is_correct, feedback = comparator.compare(answer_key, student_result)
                 
                 # Save submission
                 try:
@@ -867,7 +618,12 @@ def submit_answer():
                         )
                         db.session.add(submission)
                     
+                    record_submission(submission)
+                    count_submission()
                     db.session.commit()
+                    invalidate_student_progress(student_id=current_user.id)
+                    bump_versions(student_ids=[current_user.id])
+                    publish_event(student_channel(current_user.id), 'progress', assignment_id=assignment_id)
                     
                     # Return response with success status
                     return jsonify({
@@ -888,65 +644,25 @@ def submit_answer():
                 return jsonify({'error': str(e)}), 400
                 
         elif question.db_type == 'sqlite':
-            # SQLite grading using SQLAlchemy
+            # SQLite grading on a private copy of the cached schema template
             try:
                 logging.debug(f"Grading SQLite query: student={query[:50]}..., teacher={question.correct_answer[:50]}...")
-                engine = create_engine('sqlite:///:memory:', 
-                                     connect_args={'check_same_thread': False})
+                try:
+                    sqlite_conn = get_sqlite_connection(question.sample_db_schema)
+                except Exception as e:
+                    logging.error(f"Error in database schema: {str(e)}")
+                    return jsonify({'error': f'Error in database schema: {str(e)}'}), 400
                 
-                with engine.connect() as conn:
-                    # Load schema with transaction handling
-                    trans = conn.begin()
-                    try:
-                        schema_statements = question.sample_db_schema.split(';')
-                        for statement in schema_statements:
-                            if statement.strip():
-                                try:
-                                    conn.execute(text(statement))
-                                except Exception as e:
-                                    logging.error(f"Error in schema: {statement}\nError: {str(e)}")
-                                    trans.rollback()
-                                    return jsonify({'error': f'Error in database schema: {str(e)}'}), 400
-                        trans.commit()
-                    except Exception as e:
-                        trans.rollback()
-                        logging.error(f"Error in schema transaction: {str(e)}")
-                        return jsonify({'error': f'Error in database schema: {str(e)}'}), 400
+                with closing(sqlite_conn) as conn:
+                    # Expected result from the stored answer key (computed on this copy if stale)
+                    answer_key = get_answer_key(question, conn)
                     
                     # Execute student query
-                    student_result_proxy = conn.execute(text(query))
-                    student_columns = list(student_result_proxy.keys())
-                    student_data = [list(row) for row in student_result_proxy]
-                    
-                    # Execute teacher's query
-                    teacher_result_proxy = conn.execute(text(question.correct_answer))
-                    teacher_columns = list(teacher_result_proxy.keys())
-                    teacher_data = [list(row) for row in teacher_result_proxy]
-                    
-                    # Compare results
-                    columns_match = student_columns == teacher_columns
+                    comparator = comparator_for(question)
+                    student_result = ResultFingerprint.from_cursor(conn.execute(query), float_places=comparator.float_places)
                     
-                    # Sort data for proper comparison regardless of order
-                    sorted_student_data = sorted([tuple(row) for row in student_data])
-                    sorted_teacher_data = sorted([tuple(row) for row in teacher_data])
-                    data_match = sorted_student_data == sorted_teacher_data
-                    
-                    is_correct = columns_match and data_match
-                    
-                    # Generate feedback
-                    if is_correct:
-                        feedback = "Correct! Your query produces the expected result."
-                    else:
-                        feedback = "Incorrect. Your query does not produce the expected result."
-                        if len(student_columns) != len(teacher_columns) or len(student_data) != len(teacher_data):
-                            feedback += f" Expected result has {len(teacher_data)} rows and {len(teacher_columns)} columns, but your query returned {len(student_data)} rows and {len(student_columns)} columns."
-                        elif not columns_match:
-                            missing = set(teacher_columns) - set(student_columns)
-                            extra = set(student_columns) - set(teacher_columns)
-                            if missing:
-                                feedback += f" Missing columns: {', '.join(missing)}."
-                            if extra:
-                                feedback += f" Extra columns: {', '.join(extra)}."
+                    # Compare results regardless of row order
+                    is_correct, feedback = comparator.compare(answer_key, student_result)
                     
                     # Save submission
                     try:
@@ -975,7 +691,12 @@ def submit_answer():
                             )
                             db.session.add(submission)
                         
+                        record_submission(submission)
+                        count_submission()
                         db.session.commit()
+                        invalidate_student_progress(student_id=current_user.id)
+                        bump_versions(student_ids=[current_user.id])
+                        publish_event(student_channel(current_user.id), 'progress', assignment_id=assignment_id)
                         
                         # Return response with success status
                         return jsonify({
@@ -1010,26 +731,110 @@ def check_assignment_status(assignment_id):
     if not current_section_id:
         return jsonify({'active': False, 'message': 'No active section'})
     
+    # The answer only changes with the section's version (which also covers due dates passing)
+    section_version, _ = get_versions(current_section_id)
+    etag = make_etag('assignment-status', current_section_id, section_version, assignment_id)
+    return conditional_json(etag, lambda: _assignment_status(current_section_id, assignment_id))
+
+def _assignment_status(section_id, assignment_id):
     # Check if assignment exists and is active
     section_assignment = SectionAssignment.query.filter_by(
-        section_id=current_section_id,
+        section_id=section_id,
         assignment_id=assignment_id
     ).first()
     
     if not section_assignment:
-        return jsonify({'active': False, 'message': 'Assignment not found for this section'})
+        return {'active': False, 'message': 'Assignment not found for this section'}
     
     # Check if the assignment is still active
     if not section_assignment.is_active:
-        return jsonify({'active': False, 'message': 'Assignment has been disabled by your teacher'})
+        return {'active': False, 'message': 'Assignment has been disabled by your teacher'}
     
     # Check if assignment is past due
     assignment = Assignment.query.get_or_404(assignment_id)
     now = datetime.now()
     if assignment.due_date and assignment.due_date < now:
-        return jsonify({'active': False, 'message': 'Assignment has passed its due date'})
+        return {'active': False, 'message': 'Assignment has passed its due date'}
     
-    return jsonify({'active': True})
+    return {'active': True}
+
+def _upcoming_due_dates(section_id):
+    """Due dates of the section's active assignments that have not passed yet."""
+    rows = db.session.query(Assignment.id, Assignment.due_date)\
+        .join(SectionAssignment, SectionAssignment.assignment_id == Assignment.id)\
+        .filter(SectionAssignment.section_id == section_id,
+                SectionAssignment.is_active == True,
+                Assignment.due_date.isnot(None),
+                Assignment.due_date > datetime.now())\
+        .all()
+    return dict(rows)
+
+@student.route('/api/events', methods=['GET'])
+@login_required
+def event_stream():
+    """
+    Server-Sent Events stream of changes to the current section's assignments,
+    the student's enrollment and progress. Due dates passing are reported by
+    the stream itself.
+    """
+    if not events_enabled() or not open_stream():
+        # No content: the page falls back to polling
+        return '', 204
+    
+    try:
+        response = _event_stream_response()
+    except Exception:
+        close_stream()
+        raise
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(close_stream)
+    return response
+
+def _event_stream_response():
+    """Build the event stream for the current student; the caller holds a stream slot."""
+    section_id = session.get('current_section_id')
+    channels = [student_channel(current_user.id)]
+    if section_id:
+        channels.append(section_channel(section_id))
+    max_seconds = int(os.getenv('EVENT_STREAM_MAX_SECONDS', 300))
+    heartbeat = int(os.getenv('EVENT_STREAM_HEARTBEAT', 15))
+    
+    due_dates = _upcoming_due_dates(section_id) if section_id else {}
+    # Do not hold a database connection for the lifetime of the stream
+    db.session.close()
+    
+    def generate():
+        with subscribe(channels) as subscription:
+            yield 'retry: 5000\n\n'
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                now = datetime.now()
+                next_due = min(due_dates.values(), default=None)
+                timeout = heartbeat if next_due is None else min(heartbeat, max((next_due - now).total_seconds(), 0))
+                event = subscription.get(timeout)
+                
+                if event is not None:
+                    yield format_sse(event['event'], event['data'], event['id'])
+                    if event['channel'] != channels[0] and section_id:
+                        # The section's assignments changed: reload the due dates
+                        due_dates.clear()
+                        due_dates.update(_upcoming_due_dates(section_id))
+                        db.session.close()
+                elif subscription.overflowed:
+                    subscription.overflowed = False
+                    yield format_sse('resync', {})
+                else:
+                    yield ': keep-alive\n\n'
+                
+                now = datetime.now()
+                for assignment_id, due_date in list(due_dates.items()):
+                    if due_date <= now:
+                        del due_dates[assignment_id]
+                        yield format_sse('assignment_due', {'assignment_id': assignment_id})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
 
 @student.route('/api/active-assignments', methods=['GET'])
 @login_required
@@ -1043,6 +848,13 @@ def get_active_assignments():
         return jsonify({'assignments': [], 'stats': {}, 'message': 'No active section', 'now': datetime.now().isoformat()})
     
     try:
+        # Nothing to do if the section and the student are unchanged since the client's copy;
+        # enrollment changes bump the student's version, so this also covers the check below
+        section_version, student_version = get_versions(current_section_id, current_user.id)
+        etag = make_etag('active-assignments', current_user.id, current_section_id, section_version, student_version)
+        if etag in request.if_none_match:
+            return conditional_json(etag, None)
+        
         # First, check if the student is still enrolled in this section
         enrollment = StudentEnrollment.query.filter_by(
             student_id=current_user.id,
@@ -1060,89 +872,42 @@ def get_active_assignments():
                 # Set the first available active section as current
                 session['current_section_id'] = active_sections[0].id
                 current_section_id = active_sections[0].id
+                section_version, student_version = get_versions(current_section_id, current_user.id)
+                etag = make_etag('active-assignments', current_user.id, current_section_id,
+                                 section_version, student_version)
             else:
                 # No active sections available
                 return jsonify({'assignments': [], 'stats': {}, 'message': 'No active section', 'now': datetime.now().isoformat()})
         
-        # Get all active assignments for this section
-        section_assignments = SectionAssignment.query.filter_by(
-            section_id=current_section_id, 
-            is_active=True
-        ).all()
-        
-        assignment_ids = [sa.assignment_id for sa in section_assignments]
-        
-        # Make sure assignments have questions
-        valid_assignment_ids = db.session.query(AssignmentQuestion.assignment_id)\
-            .filter(AssignmentQuestion.assignment_id.in_(assignment_ids))\
-            .distinct() if assignment_ids else []
-        
-        # Get the assignments
-        if not assignment_ids:
-            return jsonify({'assignments': [], 'stats': {}, 'now': datetime.now().isoformat()})
-            
-        assignments = Assignment.query.filter(Assignment.id.in_(valid_assignment_ids)).all()
-        
-        # Collect all necessary data for frontend rendering
-        assignment_data = []
-        assignment_stats = {}
-        
-        for assignment in assignments:
-            # Find all questions in the assignment
-            assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).all()
-            question_count = len(assignment_questions)
-            question_ids = [aq.question_id for aq in assignment_questions]
-            
-            # Find all submissions by this student for this assignment
-            submissions = Submission.query.filter_by(
-                student_id=current_user.id, 
-                assignment_id=assignment.id
-            ).all()
-            
-            # Only count submissions for questions that are still part of the assignment
-            valid_submissions = [s for s in submissions if s.question_id in question_ids]
-            
-            # For each question, keep only the most recent submission
-            latest_submissions_by_question = {}
-            for submission in valid_submissions:
-                question_id = submission.question_id
-                if question_id not in latest_submissions_by_question or submission.submitted_at > latest_submissions_by_question[question_id].submitted_at:
-                    latest_submissions_by_question[question_id] = submission
-            
-            # Get unique questions that have been submitted with the latest submission
-            submitted_question_ids = set(latest_submissions_by_question.keys())
-            
-            # Count correct submissions
-            correct_count = sum(1 for s in latest_submissions_by_question.values() if s.is_correct)
-            
-            # Store the stats
-            stats = {
-                'question_count': question_count,
-                'submitted_count': len(submitted_question_ids),
-                'correct_count': correct_count
-            }
-            
-            # Add to results
-            assignment_stats[assignment.id] = stats
-            
-            # Format assignment data
-            assignment_data.append({
-                'id': assignment.id,
-                'title': assignment.title,
-                'due_date': assignment.due_date.isoformat() if assignment.due_date else None,
-                'question_count': question_count
-            })
-        
-        return jsonify({
-            'assignments': assignment_data,
-            'stats': assignment_stats,
-            'now': datetime.now().isoformat()
-        })
+        return conditional_json(etag, lambda: _active_assignments(current_section_id,
+                                                                  (section_version, student_version)))
         
     except Exception as e:
         logging.error(f"Error fetching active assignments: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _active_assignments(section_id, version):
+    # Question, answered and correct counts for every active assignment (cached per student, section and version)
+    assignment_stats = get_section_progress(current_user.id, section_id, version)
+    if not assignment_stats:
+        return {'assignments': [], 'stats': {}, 'now': datetime.now().isoformat()}
+        
+    assignments = Assignment.query.filter(Assignment.id.in_(list(assignment_stats))).all()
+    
+    # Collect all necessary data for frontend rendering
+    assignment_data = [{
+        'id': assignment.id,
+        'title': assignment.title,
+        'due_date': assignment.due_date.isoformat() if assignment.due_date else None,
+        'question_count': assignment_stats[assignment.id]['question_count']
+    } for assignment in assignments]
+    
+    return {
+        'assignments': assignment_data,
+        'stats': assignment_stats,
+        'now': datetime.now().isoformat()
+    }
+
 @student.route('/switch_section/<int:section_id>')
 @login_required
 def switch_section(section_id):
@@ -1282,88 +1047,77 @@ def playground_execute():
         if selected_schema:
             # Use the selected schema for query rewriting
             table_prefix = selected_schema.active_schema_name
-            schema_content = selected_schema.schema_content
 
             logging.debug(f"Playground - Using selected schema: {selected_schema.name}, prefix: {table_prefix}")
 
-            # Apply query rewriting using utility function
-            from app.utils import rewrite_query_for_schema
-            query = rewrite_query_for_schema(query, schema_content, table_prefix)
+            # Apply cached query rewriting
+            query = rewrite_for_schema_import(query, selected_schema, table_prefix)
         
         try:
-            # Connect to MySQL using the provided database name (actual_database_name)
-            conn = pymysql.connect(
-                host=os.getenv('MYSQL_HOST', ''),
-                user=os.getenv('MYSQL_USER', ''),
-                password=os.getenv('MYSQL_PASSWORD', ''),
-                port=int(os.getenv('MYSQL_PORT', 3306)),
-                database=actual_database_name,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            # Execute query and fetch results
-            with conn.cursor() as cursor:
-                # Execute the query
-                cursor.execute(query)
+            # Check out a pooled connection to the requested database (actual_database_name)
+            with get_sandbox_connection(actual_database_name) as conn:
+                # Execute query and fetch results
+                with conn.cursor() as cursor:
+                    # Execute the query
+                    cursor.execute(query)
                 
-                # Check if this is a SELECT query by looking for a result set
-                if cursor.description:
-                    # For SELECT queries, get the results
-                    data = cursor.fetchall()
+                    # Check if this is a SELECT query by looking for a result set
+                    if cursor.description:
+                        # For SELECT queries, get the results
+                        data = cursor.fetchall()
                     
-                    # Get column names directly from cursor description
-                    columns = [col[0] for col in cursor.description]
+                        # Get column names directly from cursor description
+                        columns = [col[0] for col in cursor.description]
                     
-                    # Convert dictionary data to lists for JSON response
-                    rows = []
-                    for row in data:
-                        # Convert any non-JSON serializable objects to strings
-                        serializable_row = {}
-                        for key, value in row.items():
-                            if isinstance(value, (dict, list, str, int, float, bool, type(None))):
-                                serializable_row[key] = value
-                            else:
-                                serializable_row[key] = str(value)
+                        # Convert dictionary data to lists for JSON response
+                        rows = []
+                        for row in data:
+                            # Convert any non-JSON serializable objects to strings
+                            serializable_row = {}
+                            for key, value in row.items():
+                                if isinstance(value, (dict, list, str, int, float, bool, type(None))):
+                                    serializable_row[key] = value
+                                else:
+                                    serializable_row[key] = str(value)
                         
-                        # Ensure values are in the same order as columns
-                        row_values = [serializable_row.get(col) for col in columns]
-                        rows.append(row_values)
+                            # Ensure values are in the same order as columns
+                            row_values = [serializable_row.get(col) for col in columns]
+                            rows.append(row_values)
                     
-                    # Check if this is a SHOW TABLES query on an imported schema
-                    from app.utils import is_show_tables_query, process_show_tables_result_for_schema, is_show_databases_query, filter_show_databases_result, filter_show_databases_result_for_user
-                    if is_show_tables_query(query):
-                        if selected_schema:
-                            # Filter tables for the specific selected schema
-                            prefix = selected_schema.active_schema_name
-                            # Filter tables to only show those belonging to this schema
-                            filtered_rows = []
-                            for row in rows:
-                                table_name = row[0]
-                                if table_name.startswith(prefix):
-                                    # Remove the prefix to show the original table name
-                                    original_name = table_name[len(prefix):]
-                                    filtered_rows.append([original_name])
-                            rows = filtered_rows
-                        else:
-                            # Get current section context for the student
-                            current_section_id = session.get('current_section_id')
-                            columns, rows = process_show_tables_result_for_schema(
-                                columns, rows, actual_database_name, current_user.id, section_id=current_section_id
-                            )
-                    elif is_show_databases_query(query):
-                        # Filter SHOW DATABASES result to include allowed databases and accessible schemas
-                        from app.utils import filter_show_databases_result_for_user
-                        columns, rows = filter_show_databases_result_for_user(columns, rows, current_user)
+                        # Check if this is a SHOW TABLES query on an imported schema
+                        from app.utils import is_show_tables_query, process_show_tables_result_for_schema, is_show_databases_query, filter_show_databases_result, filter_show_databases_result_for_user
+                        if is_show_tables_query(query):
+                            if selected_schema:
+                                # Filter tables for the specific selected schema
+                                prefix = selected_schema.active_schema_name
+                                # Filter tables to only show those belonging to this schema
+                                filtered_rows = []
+                                for row in rows:
+                                    table_name = row[0]
+                                    if table_name.startswith(prefix):
+                                        # Remove the prefix to show the original table name
+                                        original_name = table_name[len(prefix):]
+                                        filtered_rows.append([original_name])
+                                rows = filtered_rows
+                            else:
+                                # Get current section context for the student
+                                current_section_id = session.get('current_section_id')
+                                columns, rows = process_show_tables_result_for_schema(
+                                    columns, rows, actual_database_name, current_user.id, section_id=current_section_id
+                                )
+                        elif is_show_databases_query(query):
+                            # Filter SHOW DATABASES result to include allowed databases and accessible schemas
+                            from app.utils import filter_show_databases_result_for_user
+                            columns, rows = filter_show_databases_result_for_user(columns, rows, current_user)
                     
-                    result = {
-                        'columns': columns,
-                        'data': rows
-                    }
-                else:
-                    # This shouldn't happen due to validation, but just in case
-                    return jsonify({'error': 'Only SELECT queries are allowed'}), 400
+                        result = {
+                            'columns': columns,
+                            'data': rows
+                        }
+                    else:
+                        # This shouldn't happen due to validation, but just in case
+                        return jsonify({'error': 'Only SELECT queries are allowed'}), 400
             
-            conn.close()
             return jsonify(result)
             
         except pymysql.err.OperationalError as e:
@@ -1431,27 +1185,19 @@ def get_available_databases():
         
         # Fallback: if no allowed databases configured and no teacher schemas, 
         # return all databases except system ones (backward compatibility)
-        conn = pymysql.connect(
-            host=os.getenv('MYSQL_HOST', ''),
-            user=os.getenv('MYSQL_USER', ''),
-            password=os.getenv('MYSQL_PASSWORD', ''),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        
-        # Execute query to get databases
-        with conn.cursor() as cursor:
-            cursor.execute("SHOW DATABASES")
-            all_databases = [db['Database'] for db in cursor.fetchall()]
-            
-            # Filter out system databases that students shouldn't access
-            system_dbs = ['information_schema', 'mysql', 'performance_schema', 'sys']
-            user_databases = [db for db in all_databases if db not in system_dbs]
-            
-            # Sort alphabetically
-            user_databases.sort()
+        with get_sandbox_connection() as conn:
+            # Execute query to get databases
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW DATABASES")
+                all_databases = [db['Database'] for db in cursor.fetchall()]
+                
+                # Filter out system databases that students shouldn't access
+                system_dbs = ['information_schema', 'mysql', 'performance_schema', 'sys']
+                user_databases = [db for db in all_databases if db not in system_dbs]
+                
+                # Sort alphabetically
+                user_databases.sort()
         
-        conn.close()
         return jsonify({'databases': user_databases})
         
     except Exception as e:
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, after_this_request, abort, current_app, send_from_directory, make_response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort, current_app, send_from_directory, make_response
 from flask_login import current_user, login_required
 from functools import wraps
 from app import db
@@ -11,13 +11,34 @@ import bleach
 from bleach.css_sanitizer import CSSSanitizer
 import pymysql
 from app.models.schema_import import SchemaImport
-from sqlalchemy import create_engine, text, or_, asc, desc
+from app.models.background_job import BackgroundJob
+from app.services.sandbox import get_sandbox_connection, invalidate_resolved_database
+from app.services.sqlite_sandbox import get_sqlite_connection
+from app.services.grading import refresh_answer_key
+from app.services.query_rewrite import get_schema_table_names, invalidate_schema_rewrites, rewrite_for_schema_import
+from app.services.schema_deploy import run_deploy_job, run_drop_job
+from app.services.jobs import expire_if_stale, find_active_job, get_active_jobs, submit_job
+from app.services.progress import (get_assignment_section_ids, invalidate_assignment_progress,
+                                   invalidate_student_progress)
+from app.services.events import publish_event, section_channel, student_channel
+from app.services.version_stamps import bump_versions
+from app.services.enrollments import invalidate_enrollments
+from app.services.invitations import forget_token
+from app.services.passwords import PasswordHashBusy
+from app.services.roster_import import RosterError, import_roster
+from app.services.exports import FORMATS as EXPORT_FORMATS
+from app.services.export_jobs import artifact_response, export_artifact, is_cached, start_export
+from app.services.gradebook import (delete_assignment_entries, load_entries, refresh_assignment_points, refresh_entries,
+                                   summarize_assignment_students)
+from app.services.section_stats import get_section_statistics, load_question_sets
+from app.services.student_stats import SORT_FIELDS as STUDENT_SORT_FIELDS, get_student_page
 from flask_wtf import CSRFProtect
 from app import login_manager, csrf
 import secrets
 import string
 import pandas as pd
 from io import StringIO
+from contextlib import closing
 import logging
 
 def teacher_required(f):
@@ -163,6 +184,9 @@ def new_question():
             db.session.add(question)
             db.session.commit()
             
+            # Precompute the expected result so grading never re-runs the answer query
+            refresh_answer_key(question)
+            
             flash('Question created successfully!', 'success')
             return redirect(url_for('teacher.questions'))
             
@@ -265,7 +289,9 @@ def edit_question(question_id):
             
 
             db.session.commit()
-
+            
+            # Recompute the stored answer key for the updated question
+            refresh_answer_key(question)
             
             # Check if this is an AJAX request
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -370,63 +396,79 @@ def view_assignment(assignment_id):
         return redirect(url_for('teacher.assignments'))
     
     # Get all questions for this assignment ordered by their order field
-    assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).order_by(AssignmentQuestion.order).all()
+    assignment_questions = (AssignmentQuestion.query
+                            .options(db.joinedload(AssignmentQuestion.question))
+                            .filter_by(assignment_id=assignment.id)
+                            .order_by(AssignmentQuestion.order)
+                            .all())
     questions = [aq.question for aq in assignment_questions]
-    
-    # Create a mapping of question_id to assignment_question for easy access to scores
-    question_scores = {aq.question_id: aq.score for aq in assignment_questions}
-    
-    # Get all submissions for this assignment
-    submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
-    
-    # Group submissions by student
-    submissions_by_student = {}
-    for submission in submissions:
-        student_id = submission.student_id
-        if student_id not in submissions_by_student:
-            submissions_by_student[student_id] = []
-        submissions_by_student[student_id].append(submission)
-    
-    # Get student information
-    students = {}
-    student_scores = {}
     max_score = sum(aq.score for aq in assignment_questions)
     
-    for student_id in submissions_by_student:
-        student = User.query.get(student_id)
-        if student:
-            students[student_id] = student
-            
-            # Calculate student's score for this assignment
-            student_score = 0
-            student_subs = submissions_by_student[student_id]
-            
-            # Debug output
-            
-            # For each correct submission, add the points for that question
-            for submission in student_subs:
-                if submission.is_correct and submission.question_id in question_scores:
-                    question_score = question_scores[submission.question_id]
-                    student_score += question_score
-
-                else:
-                    logging.debug(f"Submission {submission.id} for student {student_id} is not correct or question score not found.")
-
-            
-            student_scores[student_id] = student_score
-
+    # Totals per student come from the gradebook (latest result per question);
+    # the submissions themselves are loaded per student when a row is expanded
+    student_totals = summarize_assignment_students(assignment.id)
+    students = (User.query
+                .options(db.load_only(User.id, User.username, User.first_name, User.last_name))
+                .filter(User.id.in_(list(student_totals)))
+                .order_by(User.last_name, User.first_name, User.id)
+                .all()) if student_totals else []
     
     return render_template(
         'teacher/view_assignment.html',
         assignment=assignment,
         questions=questions,
         assignment_questions=assignment_questions,
-        submissions_by_student=submissions_by_student,
         students=students,
-        student_scores=student_scores,
+        student_totals=student_totals,
         max_score=max_score
     )
 
+@teacher.route('/assignment/<int:assignment_id>/student/<int:student_id>/submissions')
+@login_required
+@teacher_required
+def assignment_student_submissions(assignment_id, student_id):
+    """One page of a student's submissions to an assignment, newest first, as JSON"""
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.creator_id != current_user.id:
+        abort(403)
+    
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    submissions = (Submission.query
+                   .filter_by(assignment_id=assignment.id, student_id=student_id)
+                   .order_by(Submission.submitted_at.desc(), Submission.id.desc())
+                   .paginate(page=page, per_page=per_page, error_out=False))
+    
+    # Question texts are sent once per page rather than with every submission
+    question_ids = {submission.question_id for submission in submissions.items}
+    scores = {aq.question_id: aq.score for aq in
+              AssignmentQuestion.query.filter_by(assignment_id=assignment.id)}
+    questions = Question.query.filter(Question.id.in_(question_ids)).all() if question_ids else []
+    latest_ids = {entry.submission_id for entries in
+                  load_entries([student_id], [assignment.id]).values() for entry in entries.values()}
+    
+    return jsonify({
+        'submissions': [{
+            'id': submission.id,
+            'question_id': submission.question_id,
+            'submitted_answer': submission.submitted_answer,
+            'feedback': submission.feedback,
+            'is_correct': submission.is_correct,
+            'is_latest': submission.id in latest_ids,
+            'score': scores.get(submission.question_id),
+            'submitted_at': submission.submitted_at.strftime('%Y-%m-%d %H:%M') if submission.submitted_at else None,
+        } for submission in submissions.items],
+        'questions': {question.id: {
+            'title': question.title,
+            'description': question.description,
+            'correct_answer': question.correct_answer,
+        } for question in questions},
+        'page': submissions.page,
+        'pages': submissions.pages,
+        'total': submissions.total,
+        'has_next': submissions.has_next,
+    })
+
 @teacher.route('/assignment/<int:assignment_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_assignment(assignment_id):
@@ -483,7 +525,14 @@ def edit_assignment(assignment_id):
             )
             db.session.add(assignment_question)
         
+        # Question scores may have changed
+        refresh_assignment_points(assignment.id)
         db.session.commit()
+        section_ids = get_assignment_section_ids(assignment.id)
+        invalidate_assignment_progress(assignment.id, section_ids)
+        bump_versions(section_ids=section_ids)
+        for section_id in section_ids:
+            publish_event(section_channel(section_id), 'assignments_changed', assignment_id=assignment.id)
         
         flash('Assignment updated successfully!', 'success')
         return redirect(url_for('teacher.assignments'))
@@ -560,83 +609,26 @@ def students():
     search_query = request.args.get('search', '')
     sort_field = request.args.get('sort', 'last_name')  # Default sort by last name
     sort_order = request.args.get('order', 'asc')  # Default ascending order
+    if sort_field not in STUDENT_SORT_FIELDS:
+        sort_field = 'last_name'
     
-    # Get only students enrolled in sections created by this teacher
-    teacher_sections = Section.query.filter_by(creator_id=current_user.id).all()
-    teacher_section_ids = [section.id for section in teacher_sections]
-    
-    # Find students from enrollments in these sections
-    students_query = db.session.query(User).join(
-        StudentEnrollment,
-        (StudentEnrollment.student_id == User.id) & (StudentEnrollment.is_active == True)
-    ).filter(
-        User.role == 'student',
-        StudentEnrollment.section_id.in_(teacher_section_ids) if teacher_section_ids else False
+    # One page of the students enrolled in this teacher's sections, with their stats
+    page = get_student_page(
+        current_user.id,
+        search=search_query,
+        sort_field=sort_field,
+        sort_order=sort_order,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
     
-    # Apply search filter if provided
-    if search_query:
-        students_query = students_query.filter(
-            or_(
-                User.first_name.ilike(f'%{search_query}%'),
-                User.last_name.ilike(f'%{search_query}%'),
-                User.email.ilike(f'%{search_query}%')
-            )
-        )
-    
-    # Apply sorting
-    if sort_field == 'first_name':
-        students_query = students_query.order_by(asc(User.first_name) if sort_order == 'asc' else desc(User.first_name))
-    elif sort_field == 'last_name':
-        students_query = students_query.order_by(asc(User.last_name) if sort_order == 'asc' else desc(User.last_name))
-    elif sort_field == 'email':
-        students_query = students_query.order_by(asc(User.email) if sort_order == 'asc' else desc(User.email))
-    
-    # Group by user ID and get all students
-    students_query = students_query.group_by(User.id)
-    students = students_query.all()
-    
-    # Get assignment stats for each student
-    stats = {}
-    
-    for student in students:
-        # Get the sections this student is enrolled in
-        student_enrollments = StudentEnrollment.query.filter_by(
-            student_id=student.id,
-            is_active=True
-        ).filter(StudentEnrollment.section_id.in_(teacher_section_ids)).all()
-        
-        student_section_ids = [enrollment.section_id for enrollment in student_enrollments]
-        
-        # Get assignments assigned to the student's sections
-        section_assignments = SectionAssignment.query.filter(
-            SectionAssignment.section_id.in_(student_section_ids)
-        ).all()
-        
-        assignment_ids = [sa.assignment_id for sa in section_assignments]
-        
-        # Get all submissions for this student on their assigned assignments
-        submissions = Submission.query.filter_by(student_id=student.id).filter(
-            Submission.assignment_id.in_(assignment_ids)
-        ).all() if assignment_ids else []
-        
-        # Get unique assignments that this student has submitted to
-        submitted_assignment_ids = set(s.assignment_id for s in submissions)
-        
-        # Count correct submissions
-        correct_submissions = [s for s in submissions if s.is_correct]
-        
-        stats[student.id] = {
-            'total_assignments': len(assignment_ids),
-            'started_assignments': len(submitted_assignment_ids),
-            'total_submissions': len(submissions),
-            'correct_submissions': len(correct_submissions)
-        }
-    
     return render_template(
         'teacher/students.html', 
-        students=students, 
-        stats=stats, 
+        students=page['students'], 
+        stats=page['stats'], 
+        total_students=page['total'],
+        next_cursor=page['next_cursor'],
+        prev_cursor=page['prev_cursor'],
         search_query=search_query,
         sort_field=sort_field,
         sort_order=sort_order
@@ -683,82 +675,37 @@ def view_student(student_id):
         Assignment.id.in_(assignment_ids)
     ).all()
     
-    # Get all submissions by this student for this teacher's assignments
-    student_submissions = {}
+    # Completion and scores per assignment, judged by the latest submission per question
+    assignment_ids = [assignment.id for assignment in teacher_assignments]
+    question_sets = load_question_sets(assignment_ids)
+    assignment_summaries = get_section_statistics([student.id], assignment_ids, question_sets)[student.id]['assignments']
+    
+    # Every submission of the student to these assignments, with its question, for the detail tables
+    submissions = Submission.query.options(db.joinedload(Submission.question)).filter(
+        Submission.student_id == student.id,
+        Submission.assignment_id.in_(list(assignment_summaries))
+    ).order_by(Submission.id).all() if assignment_summaries else []
+    
+    submissions_by_assignment = {}
+    for submission in submissions:
+        questions = question_sets[submission.assignment_id]
+        # Keep only submissions for questions that are still part of the assignment
+        if submission.question_id not in questions:
+            continue
+        submission.question_score = questions[submission.question_id]
+        submission.earned_score = submission.question_score if submission.is_correct else 0
+        submissions_by_assignment.setdefault(submission.assignment_id, []).append(submission)
     
+    student_submissions = {}
     for assignment in teacher_assignments:
-        # Get all questions for this assignment
-        assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).all()
-        question_ids = [aq.question_id for aq in assignment_questions]
-        
-        # Create a map of question_id to assignment_question for score lookup
-        question_to_aq = {aq.question_id: aq for aq in assignment_questions}
-        
-        # Skip if no questions
-        if not question_ids:
+        # Skip assignments without questions
+        if assignment.id not in assignment_summaries:
             continue
-        
-        # Get submissions for these questions
-        submissions = Submission.query.filter_by(
-            student_id=student.id,
-            assignment_id=assignment.id
-        ).all()
-        
-        # Keep only submissions for questions that are still part of the assignment
-        valid_submissions = [s for s in submissions if s.question_id in question_ids]
-        
-        # For each question, keep only the most recent submission
-        latest_submissions_by_question = {}
-        for submission in valid_submissions:
-            question_id = submission.question_id
-            if question_id not in latest_submissions_by_question or submission.submitted_at > latest_submissions_by_question[question_id].submitted_at:
-                latest_submissions_by_question[question_id] = submission
-        
-        # Add score information to each submission
-        for submission in valid_submissions:
-            if submission.question_id in question_to_aq:
-                aq = question_to_aq[submission.question_id]
-                submission.question_score = aq.score
-                submission.earned_score = aq.score if submission.is_correct else 0
-            else:
-                submission.question_score = 0
-                submission.earned_score = 0
-        
-        # Get unique submitted question IDs based on latest submissions
-        submitted_question_ids = set(latest_submissions_by_question.keys())
-        
-        # Calculate if assignment is completed - a student must have submitted to all questions
-        is_completed = len(submitted_question_ids) == len(question_ids)
-        
-        # Count correct submissions in the latest submissions
-        correct_count = sum(1 for s in latest_submissions_by_question.values() if s.is_correct)
-        
-        # Calculate total possible score for this assignment
-        total_possible_score = sum(aq.score for aq in assignment_questions)
-        
-        # Calculate earned score based on latest correct submissions
-        earned_score = 0
-        for qid, submission in latest_submissions_by_question.items():
-            if submission.is_correct and qid in question_to_aq:
-                earned_score += question_to_aq[qid].score
-        
-        # Calculate progress
-        if len(question_ids) > 0:
-            progress = len(submitted_question_ids) / len(question_ids) * 100
-        else:
-            progress = 0
-        
-        student_submissions[assignment.id] = {
-            'assignment': assignment,
-            'submissions': valid_submissions,
-            'question_count': len(question_ids),
-            'submitted_count': len(submitted_question_ids),
-            'correct_count': correct_count,
-            'progress': progress,
-            'total_possible_score': total_possible_score,
-            'earned_score': earned_score,
-            'is_completed': is_completed
-        }
+        student_submissions[assignment.id] = dict(
+            assignment_summaries[assignment.id],
+            assignment=assignment,
+            submissions=submissions_by_assignment.get(assignment.id, [])
+        )
     
     return render_template(
         'teacher/view_student.html',
@@ -831,72 +778,26 @@ def view_section(section_id):
     # Get all students in this section
     students = section.get_enrolled_students(active_only=True)
     
-    # Get all assignments for this section
-    section_assignments = SectionAssignment.query.filter_by(section_id=section.id).all()
+    # Get all assignments for this section, with their questions for the question counts
+    section_assignments = SectionAssignment.query.options(
+        db.joinedload(SectionAssignment.assignment).selectinload(Assignment.questions)
+    ).filter_by(section_id=section.id).all()
     assignments = [sa.assignment for sa in section_assignments]
     
     # Create a map of assignment_id to section_assignment for the template
     assignment_status = {sa.assignment_id: sa.is_active for sa in section_assignments}
     
-    # Get submission stats for each student
-    student_stats = {}
-    
-    for student in students:
-        assignment_ids = [sa.assignment_id for sa in section_assignments]
-        
-        # Skip if no assignments
-        if not assignment_ids:
-            student_stats[student.id] = {
-                'total_submissions': 0,
-                'correct_submissions': 0,
-                'completed_assignments': 0
-            }
-            continue
-        
-        # Get all submissions for this student for section assignments
-        submissions = Submission.query.filter_by(student_id=student.id).filter(
-            Submission.assignment_id.in_(assignment_ids)
-        ).all()
-        
-        # Get unique assignment IDs with submissions
-        submitted_assignment_ids = set(s.assignment_id for s in submissions)
-        
-        # Count completed assignments
-        completed_assignments = 0
-        for assignment_id in assignment_ids:
-            # Get all questions for this assignment
-            assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment_id).all()
-            question_ids = [aq.question_id for aq in assignment_questions]
-            
-            # Skip if no questions
-            if not question_ids:
-                continue
-            
-            # Get all submissions for this assignment
-            assignment_submissions = [s for s in submissions if s.assignment_id == assignment_id]
-            
-            # For each question, keep only the most recent submission
-            latest_submissions_by_question = {}
-            for submission in assignment_submissions:
-                question_id = submission.question_id
-                if question_id not in latest_submissions_by_question or submission.submitted_at > latest_submissions_by_question[question_id].submitted_at:
-                    latest_submissions_by_question[question_id] = submission
-            
-            # Get unique question IDs based on latest submissions
-            submitted_question_ids = set(latest_submissions_by_question.keys())
-            
-            # If all questions have submissions, count as completed
-            if len(submitted_question_ids) == len(question_ids):
-                completed_assignments += 1
-        
-        # Count correct submissions
-        correct_submissions = len([s for s in submissions if s.is_correct])
-        
-        student_stats[student.id] = {
-            'total_submissions': len(submissions),
-            'correct_submissions': correct_submissions,
-            'completed_assignments': completed_assignments
+    # Submission stats for every student, computed from two bulk queries
+    statistics = get_section_statistics([student.id for student in students],
+                                        [sa.assignment_id for sa in section_assignments])
+    student_stats = {
+        student_id: {
+            'total_submissions': stats['total_submissions'],
+            'correct_submissions': stats['correct_submissions'],
+            'completed_assignments': stats['completed_assignments']
         }
+        for student_id, stats in statistics.items()
+    }
     
     return render_template('teacher/view_section.html', 
                            section=section, 
@@ -919,9 +820,14 @@ def edit_section(section_id):
         section.name = request.form.get('name')
         section.description = sanitize_html(request.form.get('description'))
         database_name = request.form.get('database_name', '').strip()
+        previous_database = section.database_name
         section.database_name = database_name if database_name else None
         
         db.session.commit()
+        if section.database_name != previous_database:
+            for name in (previous_database, section.database_name):
+                if name:
+                    invalidate_resolved_database(name)
         
         flash('Section updated successfully!', 'success')
         return redirect(url_for('teacher.view_section', section_id=section.id))
@@ -963,6 +869,10 @@ def manage_section_students(section_id):
                 flash(f'Cannot add students that belong to other teachers\' sections: {", ".join(invalid_names)}', 'danger')
                 return redirect(url_for('teacher.manage_section_students', section_id=section.id))
         
+        # Remember who was enrolled, to notify the students that are removed
+        previously_enrolled = {student_id for (student_id,) in db.session.query(StudentEnrollment.student_id)
+                               .filter_by(section_id=section.id, is_active=True)}
+        
         # First, deactivate all existing enrollments for this section
         StudentEnrollment.query.filter_by(section_id=section.id).update({StudentEnrollment.is_active: False})
         
@@ -988,6 +898,11 @@ def manage_section_students(section_id):
                     db.session.add(new_enrollment)
         
         db.session.commit()
+        selected_ids = {int(student_id) for student_id in student_ids}
+        bump_versions(student_ids=previously_enrolled ^ selected_ids)
+        invalidate_enrollments(student_ids=previously_enrolled ^ selected_ids)
+        for student_id in previously_enrolled - selected_ids:
+            publish_event(student_channel(student_id), 'enrollment_removed', section_id=section.id)
         
         flash('Students updated successfully!', 'success')
         return redirect(url_for('teacher.view_section', section_id=section.id))
@@ -1027,6 +942,31 @@ def manage_section_students(section_id):
                            assigned_elsewhere_students=assigned_elsewhere_students,
                            current_student_ids=current_student_ids)
 
+@teacher.route('/section/<int:section_id>/students/import', methods=['POST'])
+@login_required
+def import_section_roster(section_id):
+    """Create and enroll the students listed in an uploaded CSV or XLSX roster"""
+    section = Section.query.get_or_404(section_id)
+    
+    # Make sure the teacher owns this section
+    if section.creator_id != current_user.id:
+        flash('You can only manage your own sections.', 'danger')
+        return redirect(url_for('teacher.sections'))
+    
+    file = request.files.get('roster_file')
+    if file is None or file.filename == '':
+        flash('No file selected', 'danger')
+        return redirect(url_for('teacher.manage_section_students', section_id=section.id))
+    
+    try:
+        result = import_roster(section, file.stream, file.filename)
+    except RosterError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('teacher.manage_section_students', section_id=section.id))
+    
+    # Temporary passwords are only ever shown on this page
+    return render_template('teacher/roster_import_result.html', section=section, result=result)
+
 @teacher.route('/section/<int:section_id>/assignments', methods=['GET', 'POST'])
 @login_required
 def manage_section_assignments(section_id):
@@ -1053,6 +993,9 @@ def manage_section_assignments(section_id):
             db.session.add(section_assignment)
         
         db.session.commit()
+        invalidate_student_progress(section_id=section.id)
+        bump_versions(section_ids=[section.id])
+        publish_event(section_channel(section.id), 'assignments_changed')
         
         flash('Assignments updated successfully!', 'success')
         return redirect(url_for('teacher.view_section', section_id=section.id))
@@ -1081,8 +1024,10 @@ def section_invitation(section_id):
     
     if request.method == 'POST':
         # Generate new invitation token
+        previous_token = section.invitation_token
         token = section.generate_invitation_token()
         db.session.commit()
+        forget_token(previous_token)
         flash('New invitation link generated successfully!', 'success')
     
     # Generate invitation URL if token exists
@@ -1106,8 +1051,10 @@ def revoke_invitation(section_id):
         flash('You can only manage your own sections.', 'danger')
         return redirect(url_for('teacher.sections'))
     
+    previous_token = section.invitation_token
     section.invitation_token = None
     db.session.commit()
+    forget_token(previous_token)
     
     flash('Invitation link has been revoked.', 'success')
     return redirect(url_for('teacher.section_invitation', section_id=section.id))
@@ -1131,6 +1078,9 @@ def delete_section(section_id):
         # so they will be automatically deleted
         db.session.delete(section)
         db.session.commit()
+        bump_versions(section_ids=[section_id])
+        invalidate_enrollments(section_id=section_id)
+        publish_event(section_channel(section_id), 'enrollment_removed', section_id=section_id)
         
         flash(f'Section "{section_name}" has been successfully deleted.', 'success')
     except Exception as e:
@@ -1139,10 +1089,50 @@ def delete_section(section_id):
     
     return redirect(url_for('teacher.sections'))
 
-@teacher.route('/section/<int:section_id>/export_results')
+def _export_results(section, assignment=None):
+    """
+    Answer an export request: send the file if the current export is cached,
+    otherwise start the background job that builds it.
+
+    POST requests (from the section page) get JSON with a download URL, or
+    the job to poll first; a plain GET that misses the cache starts the job
+    and returns to the section page.
+    """
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'xlsx'
+    assignment_id = assignment.id if assignment is not None else None
+    try:
+        artifact = export_artifact(section, assignment, export_format)
+        if is_cached(artifact.name):
+            if request.method == 'POST':
+                return jsonify({'success': True, 'download_url': request.url})
+            response = artifact_response(*artifact)
+            if response is not None:
+                return response
+        job = start_export(artifact, section.id, assignment_id, current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error exporting results of section {section.id} (assignment {assignment_id}): {e}")
+        if request.method == 'POST':
+            return jsonify({'success': False, 'error': 'Error generating the export. Please try again.'}), 500
+        flash('Error generating the export. Please try again.', 'danger')
+        return redirect(url_for('teacher.view_section', section_id=section.id))
+
+    if request.method == 'POST':
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': url_for('teacher.job_status', job_id=job.id),
+            'download_url': url_for('teacher.download_export', job_id=job.id),
+        }), 202
+    flash('Your export is being prepared. Click Export again in a moment to download it.', 'info')
+    return redirect(url_for('teacher.view_section', section_id=section.id))
+
+@teacher.route('/section/<int:section_id>/export_results', methods=['GET', 'POST'])
 @login_required
 def export_section_results(section_id):
-    """Export section results as Excel file with student scores for all assignments."""
+    """Export section results as an Excel or CSV file with student scores for all assignments."""
     section = Section.query.get_or_404(section_id)
     
     # Make sure the teacher owns this section
@@ -1150,195 +1140,24 @@ def export_section_results(section_id):
         flash('You can only export results from your own sections.', 'danger')
         return redirect(url_for('teacher.sections'))
     
-    # Get all students in this section
-    students = section.get_enrolled_students(active_only=True)
-    
-    # Get all assignments for this section
-    section_assignments = SectionAssignment.query.filter_by(section_id=section.id).all()
-    assignments = [sa.assignment for sa in section_assignments]
-    
-    # Sort assignments by ID or creation date
-    assignments.sort(key=lambda a: a.id)
-    
-    # Create Excel workbook
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill
-    from openpyxl.utils.cell import get_column_letter
-    from flask import send_file
-    import tempfile
-    import os
-    
-    # Create a workbook with proper properties
-    wb = Workbook()
-    
-    # Set workbook properties
-    wb.properties.creator = "SQL Classroom"
-    wb.properties.title = f"Section {section.name} Results"
-    wb.properties.description = f"Student results for section {section.name}"
-    
-    # Remove default sheet and create a new one with valid name
-    if "Sheet" in wb.sheetnames:
-        std = wb["Sheet"]
-        wb.remove(std)
-    
-    # Create worksheet with properly escaped name (limit to 31 chars, no special chars)
-    sheet_name = ''.join(c for c in section.name if c.isalnum() or c in ' _-')[:31]
-    if not sheet_name:
-        sheet_name = "Results"
-    ws = wb.create_sheet(title=sheet_name)
-    
-    # Create header row
-    headers = ["No.", "Last Name", "First Name", "Section"]
-    
-    # For each assignment, add both detailed score and raw score columns
-    for assignment in assignments:
-        # Limit title length to avoid Excel issues and remove invalid chars
-        title = ''.join(c for c in assignment.title if c not in '"*:<>?/\\|')
-        if len(title) > 100:
-            title = title[:100] + "..."
-            
-        # headers.append(f"Assignment {assignment.id}: {title}")
-        # headers.append(f"Raw Score {assignment.id}")
-        headers.append(f"{title}")
-        headers.append("Raw Score")
-
-    headers.append("Total Score")
-    headers.append("Raw Total")
-    
-    # Apply header styling
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-        cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-    
-    # Add data rows
-    for idx, student in enumerate(students, 1):
-        row_num = idx + 1
-        student_total_score = 0
-        student_total_possible = 0
-        
-        # Basic student info - ensure values are strings
-        ws.cell(row=row_num, column=1, value=idx)
-        ws.cell(row=row_num, column=2, value=str(student.last_name or ""))
-        ws.cell(row=row_num, column=3, value=str(student.first_name or ""))
-        ws.cell(row=row_num, column=4, value=str(section.name))
-        
-        # For each assignment, calculate and add the score
-        col_idx = 5
-        for assignment in assignments:
-            # Find all questions in the assignment
-            assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).all()
-            question_ids = [aq.question_id for aq in assignment_questions]
-            
-            # Create score mapping for each question
-            question_scores = {aq.question_id: aq.score for aq in assignment_questions}
-            
-            # Get all submissions for this student and assignment
-            submissions = Submission.query.filter_by(
-                student_id=student.id,
-                assignment_id=assignment.id
-            ).all()
-            
-            # Get the most recent submission for each question
-            latest_submissions = {}
-            for submission in submissions:
-                question_id = submission.question_id
-                if question_id not in latest_submissions or submission.submitted_at > latest_submissions[question_id].submitted_at:
-                    latest_submissions[question_id] = submission
-            
-            # Calculate earned points
-            earned_points = 0
-            for question_id in question_ids:
-                if question_id in latest_submissions and latest_submissions[question_id].is_correct:
-                    earned_points += question_scores.get(question_id, 0)
-            
-            # Calculate total possible points for this assignment
-            assignment_total_possible = sum(question_scores.values())
-            
-            # Update student totals
-            student_total_score += earned_points
-            student_total_possible += assignment_total_possible
-            
-            # Add the detailed score to the spreadsheet
-            if assignment_total_possible > 0:
-                percentage = round((earned_points / assignment_total_possible) * 100)
-                score_display = f"{earned_points}/{assignment_total_possible} ({percentage}%)"
-            else:
-                score_display = "N/A"
-            
-            # Add the score display
-            ws.cell(row=row_num, column=col_idx, value=score_display)
-            
-            # Add the raw score - ensure it's numeric
-            ws.cell(row=row_num, column=col_idx + 1, value=float(earned_points))
-            
-            # Move to next set of columns
-            col_idx += 2
-        
-        # Add total score
-        if student_total_possible > 0:
-            percentage = round((student_total_score / student_total_possible) * 100)
-            ws.cell(row=row_num, column=col_idx, value=f"{student_total_score}/{student_total_possible} ({percentage}%)")
-            ws.cell(row=row_num, column=col_idx + 1, value=float(student_total_score))
-        else:
-            ws.cell(row=row_num, column=col_idx, value="N/A")
-            ws.cell(row=row_num, column=col_idx + 1, value=0)
-    
-    # Adjust column widths
-    for col_idx, header in enumerate(headers, 1):
-        column_letter = get_column_letter(col_idx)
-        if col_idx == 1:  # Number column
-            ws.column_dimensions[column_letter].width = 5
-        elif col_idx in (2, 3):  # Name columns
-            ws.column_dimensions[column_letter].width = 15
-        elif col_idx == 4:  # Section column
-            ws.column_dimensions[column_letter].width = 20
-        elif "Raw Score" in header or header == "Raw Total":  # Raw score columns
-            ws.column_dimensions[column_letter].width = 12
-        else:  # Assignment and total columns
-            ws.column_dimensions[column_letter].width = 25
-    
-    # Save to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    temp_file.close()
-    
-    try:
-        # Set proper workbook protection options
-        wb.security.lockStructure = False
-        
-        # Save with explicit options
-        wb.save(temp_file.name)
-        
-        # Send the file
-        filename = f"{sheet_name}_results.xlsx"
-        return_data = send_file(
-            temp_file.name,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=filename
-        )
-        
-        # Schedule file for deletion after request
-        @after_this_request
-        def remove_file(response):
-            try:
-                os.unlink(temp_file.name)
-            except Exception as e:
-                logging.error(f"Error deleting temporary file {temp_file.name}: {e}")
-            return response
-        
-        return return_data
-        
-    except Exception as e:
+    return _export_results(section)
 
-        # Clean up temp file in case of error
-        try:
-            os.unlink(temp_file.name)
-        except:
-            logging.error(f"Error deleting temporary file {temp_file.name} after error: {e}")
-        flash(f'Error generating Excel file. Please try again.', 'danger')
-        return redirect(url_for('teacher.view_section', section_id=section.id))
+@teacher.route('/exports/<int:job_id>/download')
+@login_required
+@teacher_required
+def download_export(job_id):
+    """Download the file written by an export job of the current teacher"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if job.created_by != current_user.id:
+        abort(403)
+    result = job.get_result() or {}
+    if job.status != 'succeeded' or 'artifact' not in result:
+        abort(404)
+    response = artifact_response(result['artifact'], result['download_name'], result['format'])
+    if response is None:
+        flash('This export has expired. Please export the results again.', 'warning')
+        return redirect(url_for('teacher.sections'))
+    return response
 
 @teacher.route('/upload_image', methods=['POST'])
 @login_required
@@ -1388,18 +1207,26 @@ def delete_assignment(assignment_id):
         flash('You can only delete your own assignments.', 'danger')
         return redirect(url_for('teacher.assignments'))
     
+    # Remember where the assignment was used, to clear cached student progress afterwards
+    section_ids = get_assignment_section_ids(assignment.id)
+    
     # Delete all section assignments first (due to foreign key constraints)
     SectionAssignment.query.filter_by(assignment_id=assignment.id).delete()
     
     # Delete all assignment questions
     AssignmentQuestion.query.filter_by(assignment_id=assignment.id).delete()
     
-    # Delete all submissions for this assignment
+    # Delete all submissions for this assignment, and their gradebook entries
+    delete_assignment_entries(assignment.id)
     Submission.query.filter_by(assignment_id=assignment.id).delete()
     
     # Finally delete the assignment
     db.session.delete(assignment)
     db.session.commit()
+    invalidate_assignment_progress(assignment_id, section_ids)
+    bump_versions(section_ids=section_ids)
+    for section_id in section_ids:
+        publish_event(section_channel(section_id), 'assignments_changed', assignment_id=assignment_id)
     
     flash('Assignment deleted successfully!', 'success')
     return redirect(url_for('teacher.assignments'))
@@ -1460,10 +1287,14 @@ def import_schema():
     # Get all imported schemas
     schemas = SchemaImport.query.filter_by(created_by=current_user.id).order_by(SchemaImport.created_at.desc()).all()
     
+    # Deployments and table drops still running in the background
+    active_jobs = [job.to_dict() for job in get_active_jobs(current_user.id, ('schema_deploy', 'schema_drop'))]
+    
     return render_template('teacher/import_schema.html',
                          prefix_student=prefix_student,
                          prefix_template=prefix_template,
-                         schemas=schemas)
+                         schemas=schemas,
+                         active_jobs=active_jobs)
 
 @teacher.route('/schema/<int:schema_id>')
 @login_required
@@ -1478,208 +1309,28 @@ def get_schema(schema_id):
 @login_required
 @teacher_required
 def use_schema(schema_id):
-    from app.utils import generate_schema_prefix, parse_schema_statements, modify_create_table_statement, get_prefixed_table_name
+    from app.utils import generate_schema_prefix
     
     schema = SchemaImport.query.get_or_404(schema_id)
     if schema.created_by != current_user.id:
         abort(403)
-        
-    debug_log = []
-    debug_log.append(f"Starting schema deployment for schema ID: {schema_id}")
-    debug_log.append(f"Schema name: {schema.name}")
-    debug_log.append(f"Schema content length: {len(schema.schema_content) if schema.schema_content else 0}")
     
-    try:
-        # Connect to the sql_classroom database
-        connection = pymysql.connect(
-            host=os.getenv('MYSQL_HOST', ''),
-            user=os.getenv('MYSQL_USER', ''),
-            password=os.getenv('MYSQL_PASSWORD', ''),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            # database='sql_classroom',
-            database=os.getenv('APP_DB_NAME', ''),
-            connect_timeout=30
-        )
-        
-        debug_log.append("Successfully connected to sql_classroom database")
-        
-        with connection.cursor() as cursor:
-            # Generate a unique prefix for table names
-            table_prefix = generate_schema_prefix(current_user.id, schema.id)
-            debug_log.append(f"Generated table prefix: {table_prefix}")
-            
-            # First, drop any existing tables with this prefix
-            cursor.execute("SHOW TABLES")
-            all_tables = [row[0] for row in cursor.fetchall()]
-            tables_to_drop = [table for table in all_tables if table.startswith(table_prefix)]
-            debug_log.append(f"Found {len(tables_to_drop)} existing tables to drop: {tables_to_drop}")
-            
-            # Disable foreign key checks to allow dropping tables with foreign key constraints
-            if tables_to_drop:
-                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
-                debug_log.append("Disabled foreign key checks for table dropping")
-            
-            for table in tables_to_drop:
-                cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
-                debug_log.append(f"Dropped table: {table}")
-            
-            # Re-enable foreign key checks
-            if tables_to_drop:
-                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
-                debug_log.append("Re-enabled foreign key checks")
-            
-            # Parse schema statements
-            statements = parse_schema_statements(schema.schema_content)
-            debug_log.append(f"Parsed {len(statements)} statements from schema content")
-            
-            created_tables = []
-            table_mappings = {}  # Original table name -> prefixed table name
-            
-            # First pass: Create tables with prefixed names
-            create_table_statements = []
-            for i, stmt in enumerate(statements):
-                debug_log.append(f"Processing statement {i+1}: {stmt[:100]}...")
-                
-                if stmt.upper().strip().startswith('CREATE TABLE'):
-                    create_table_statements.append(stmt)
-                    debug_log.append(f"Found CREATE TABLE statement {len(create_table_statements)}")
-                    
-                    try:
-                        # Extract original table name for mapping
-                        table_start = stmt.upper().find('TABLE') + 5
-                        table_part = stmt[table_start:].strip()
-                        original_table = table_part.split()[0].strip('`').rstrip('(').strip('`')
-                        debug_log.append(f"Extracted original table name: '{original_table}'")
-                        
-                        # Create prefixed table name
-                        prefixed_table = get_prefixed_table_name(table_prefix, original_table)
-                        table_mappings[original_table] = prefixed_table
-                        debug_log.append(f"Mapped '{original_table}' -> '{prefixed_table}'")
-                        
-                        # Modify the CREATE TABLE statement
-                        modified_stmt = modify_create_table_statement(stmt, table_prefix)
-                        debug_log.append(f"Modified statement preview: {modified_stmt[:150]}...")
-                        
-                        cursor.execute(modified_stmt)
-                        created_tables.append(prefixed_table)
-                        debug_log.append(f"Successfully created table: {prefixed_table}")
-                        
-                    except pymysql.Error as e:
-                        error_msg = f"Error creating table from statement {i+1}: {str(e)}"
-                        debug_log.append(error_msg)
-
-                        # Continue with other statements
-                    except Exception as e:
-                        error_msg = f"Unexpected error processing CREATE TABLE {i+1}: {str(e)}"
-                        debug_log.append(error_msg)
-
-            
-            debug_log.append(f"Total CREATE TABLE statements found: {len(create_table_statements)}")
-            debug_log.append(f"Total tables created: {len(created_tables)}")
-            debug_log.append(f"Created tables: {created_tables}")
-            
-            # Second pass: Handle INSERT and other statements with table references
-            non_create_statements = 0
-            for i, stmt in enumerate(statements):
-                if not stmt.upper().strip().startswith('CREATE TABLE'):
-                    non_create_statements += 1
-                    try:
-                        modified_stmt = stmt
-                        replacements_made = 0
-                        
-                        # Replace table names in the statement with prefixed versions
-                        for original_table, prefixed_table in table_mappings.items():
-                            # Handle both backticked and non-backticked table names properly
-                            import re
-                            
-                            # First replace backticked table names: `tablename`
-                            backticked_pattern = r'`' + re.escape(original_table) + r'`'
-                            old_stmt = modified_stmt
-                            modified_stmt = re.sub(backticked_pattern, f"`{prefixed_table}`", modified_stmt, flags=re.IGNORECASE)
-                            if old_stmt != modified_stmt:
-                                replacements_made += 1
-                            
-                            # Then replace non-backticked table names with word boundaries
-                            word_boundary_pattern = r'\b' + re.escape(original_table) + r'\b'
-                            old_stmt = modified_stmt
-                            modified_stmt = re.sub(word_boundary_pattern, f"`{prefixed_table}`", modified_stmt, flags=re.IGNORECASE)
-                            if old_stmt != modified_stmt:
-                                replacements_made += 1
-                        
-                        if modified_stmt != stmt:  # Only execute if we made changes
-                            cursor.execute(modified_stmt)
-                            debug_log.append(f"Executed non-CREATE statement with {replacements_made} table name replacements")
-                        elif stmt.strip():  # Execute original if it's not empty and no replacements needed
-                            cursor.execute(stmt)
-                            debug_log.append(f"Executed original non-CREATE statement (no table references)")
-                            
-                    except pymysql.Error as e:
-                        error_msg = f"Error executing non-CREATE statement {i+1}: {str(e)}"
-                        debug_log.append(error_msg)
-
-                        # Continue with other statements
-            
-            debug_log.append(f"Processed {non_create_statements} non-CREATE statements")
-            
-            # Grant permissions to sql_student user for each created table (optional)
-            # This can be disabled if the database user doesn't have GRANT privileges
-            enable_permission_granting = os.getenv('ENABLE_PERMISSION_GRANTING', 'true').lower() == 'true'
-            
-            if enable_permission_granting:
-                permissions_granted = 0
-                permission_errors = 0
-                for table in created_tables:
-                    try:
-                        grant_stmt = f"GRANT SELECT ON `{os.getenv('APP_DB_NAME', '')}`.`{table}` TO 'sql_student'@{os.getenv('APP_DB_NAME', '')}"
-                        cursor.execute(grant_stmt)
-                        permissions_granted += 1
-                        debug_log.append(f"Granted SELECT permission on table: {table}")
-                    except pymysql.Error as e:
-                        permission_errors += 1
-                        error_msg = f"Warning: Could not grant permissions for table {table}: {str(e)}"
-                        debug_log.append(error_msg)
-                        # Don't print this as an error since it's not critical
-                        if permission_errors <= 3:  # Only show first few warnings
-                            logging.warning(error_msg)
-                
-                if permissions_granted > 0:
-                    debug_log.append(f"✅ Granted permissions on {permissions_granted} tables")
-                if permission_errors > 0:
-                    debug_log.append(f"⚠️  Permission warnings for {permission_errors} tables (not critical)")
-
-            else:
-                debug_log.append("ℹ️  Permission granting disabled via configuration")
-            
-            # cursor.execute("FLUSH PRIVILEGES")
-            connection.commit()
-            debug_log.append("Committed transaction and flushed privileges")
-            
-            # Update the schema record with the table prefix
-            schema.active_schema_name = table_prefix
-            db.session.commit()
-            debug_log.append(f"Updated schema record with active_schema_name: {table_prefix}")
-            
-            # Final verification - check what tables actually exist
-            cursor.execute("SHOW TABLES")
-            final_tables = [row[0] for row in cursor.fetchall()]
-            final_prefixed_tables = [t for t in final_tables if t.startswith(table_prefix)]
-            debug_log.append(f"Final verification: {len(final_prefixed_tables)} tables exist with prefix {table_prefix}")
-            debug_log.append(f"Final tables: {final_prefixed_tables}")
-            
-            return jsonify({
-                'success': True, 
-                'table_prefix': table_prefix,
-                'tables_created': created_tables,
-                'tables_verified': final_prefixed_tables,
-                'debug_log': debug_log,
-                'message': f'Schema successfully deployed to sql_classroom database with prefix: {table_prefix}'
-            })
-            
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
-    finally:
-        if connection:
-            connection.close()
+    # A deployment of this schema is already under way: report that one
+    job = find_active_job('schema_deploy', schema.id)
+    if job is None:
+        # Generate a unique prefix for table names
+        table_prefix = generate_schema_prefix(current_user.id, schema.id)
+        # Unchanged tables are kept unless a full rebuild is requested
+        full = bool((request.get_json(silent=True) or {}).get('full'))
+        job = submit_job('schema_deploy', run_deploy_job, current_user.id, target_id=schema.id,
+                         schema_id=schema.id, table_prefix=table_prefix, full=full)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('teacher.job_status', job_id=job.id),
+        'message': f'Deployment of schema "{schema.name}" has started'
+    }), 202
 
 @teacher.route('/schema/<int:schema_id>/delete', methods=['GET'])
 @login_required
@@ -1701,60 +1352,24 @@ def delete_schema(schema_id):
             flash(f'This schema cannot be deleted because it is used in the following questions: {", ".join(question_titles)}', 'danger')
             return redirect(url_for('teacher.import_schema'))
         
-        # Store the name for the success message
-        schema_name = schema.name
+        if find_active_job('schema_deploy', schema.id):
+            flash('This schema is still being deployed. Please wait for the deployment to finish before deleting it.', 'danger')
+            return redirect(url_for('teacher.import_schema'))
         
-        # Delete the prefixed tables from sql_classroom database if they exist
-        tables_deleted = []
-        if schema.active_schema_name:
-            try:
-                connection = pymysql.connect(
-                    host=os.getenv('MYSQL_HOST', ''),
-                    user=os.getenv('MYSQL_USER', ''),
-                    password=os.getenv('MYSQL_PASSWORD', ''),
-                    port=int(os.getenv('MYSQL_PORT', 3306)),
-                    # database='sql_classroom',  # Connect to sql_classroom database
-                    database=os.getenv('APP_DB_NAME', ''),  # Connect to sql_classroom database
-                    connect_timeout=30
-                )
-                
-                with connection.cursor() as cursor:
-                    # Get all tables with this schema's prefix
-                    cursor.execute("SHOW TABLES")
-                    all_tables = [row[0] for row in cursor.fetchall()]
-                    tables_to_delete = [table for table in all_tables if table.startswith(schema.active_schema_name)]
-                    
-                    # Disable foreign key checks to allow dropping tables with foreign key constraints
-                    if tables_to_delete:
-                        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
-                    
-                    # Drop each prefixed table
-                    for table in tables_to_delete:
-                        try:
-                            cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
-                            tables_deleted.append(table)
-
-                        except Exception as e:
-                            logging.error(f"Error dropping table {table}: {e}")
-                    # Re-enable foreign key checks
-                    if tables_to_delete:
-                        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
-
-                    
-                    connection.commit()
-                
-                connection.close()
-                
-            except Exception as e:
-                # Continue with schema deletion even if table cleanup fails
-                logging.error(f"Error cleaning up tables for schema {schema.id}: {e}")
+        # Store the name and prefix for the success message and table cleanup
+        schema_name = schema.name
+        table_prefix = schema.active_schema_name
         
         # Delete the schema record from the database
         db.session.delete(schema)
         db.session.commit()
+        invalidate_schema_rewrites(schema_id)
         
-        if tables_deleted:
-            flash(f'Schema "{schema_name}" and {len(tables_deleted)} associated tables have been successfully deleted.', 'success')
+        # Drop the prefixed tables in the background
+        if table_prefix:
+            submit_job('schema_drop', run_drop_job, current_user.id, target_id=schema_id,
+                       table_prefix=table_prefix)
+            flash(f'Schema "{schema_name}" has been deleted. Its tables are being removed in the background.', 'success')
         else:
             flash(f'Schema "{schema_name}" has been successfully deleted.', 'success')
             
@@ -1765,6 +1380,18 @@ def delete_schema(schema_id):
     return redirect(url_for('teacher.import_schema'))
 
 
+@teacher.route('/jobs/<int:job_id>')
+@login_required
+@teacher_required
+def job_status(job_id):
+    """Progress of a background job started by the current teacher"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if job.created_by != current_user.id:
+        abort(403)
+    expire_if_stale(job)
+    return jsonify(job.to_dict())
+
+
 @teacher.route('/admin/schema-monitor')
 @login_required
 @teacher_required
@@ -1859,7 +1486,7 @@ def debug_question(question_id):
                 'name': question.schema_import.name,
                 'active_schema_name': question.schema_import.active_schema_name,
                 'created_by': question.schema_import.created_by,
-                'content_length': len(question.schema_import.schema_content) if question.schema_import.schema_content else 0
+                'content_length': question.schema_import.content_size or 0
             }
             
             # Check if tables exist in database
@@ -1941,34 +1568,13 @@ def test_schema_query():
             }
             
             if table_prefix:
-                # Try to modify the query
-                from app.utils import parse_schema_statements
-                schema_content = question.schema_import.schema_content
-                statements = parse_schema_statements(schema_content)
-                table_names = []
-                
-                for stmt in statements:
-                    if stmt.upper().strip().startswith('CREATE TABLE'):
-                        table_start = stmt.upper().find('TABLE') + 5
-                        table_part = stmt[table_start:].strip()
-                        table_name = table_part.split()[0].strip('`').rstrip('(').strip('`')
-                        table_names.append(table_name)
-                
+                # Modify the query using the schema's table index
+                table_names = get_schema_table_names(question.schema_import)
                 debug_info['table_names'] = table_names
                 
-                # Modify query
-                import re
-                modified_query = test_query
-                replacements = []
-                
-                for table_name in table_names:
-                    pattern = r'\b' + re.escape(table_name) + r'\b'
-                    prefixed_table = f"{table_prefix}{table_name}"
-                    old_query = modified_query
-                    modified_query = re.sub(pattern, prefixed_table, modified_query, flags=re.IGNORECASE)
-                    
-                    if old_query != modified_query:
-                        replacements.append(f"{table_name} -> {prefixed_table}")
+                modified_query = rewrite_for_schema_import(test_query, question.schema_import, table_prefix)
+                replacements = [f"{table_name} -> {table_prefix}{table_name}" for table_name in table_names
+                                if f"`{table_prefix}{table_name}`" in modified_query]
                 
                 debug_info['modified_query'] = modified_query
                 debug_info['replacements'] = replacements
@@ -2080,7 +1686,8 @@ def view_schema_content(schema_id):
     
     # Parse the schema to show structure
     from app.utils import parse_schema_statements
-    statements = parse_schema_statements(schema.schema_content)
+    schema_content = schema.schema_content
+    statements = parse_schema_statements(schema_content)
     
     parsed_info = {
         'total_statements': len(statements),
@@ -2112,9 +1719,10 @@ def view_schema_content(schema_id):
             'id': schema.id,
             'name': schema.name,
             'active_schema_name': schema.active_schema_name,
-            'content_length': len(schema.schema_content)
+            'content_length': schema.content_size,
+            'content_hash': schema.content_hash
         },
-        'content': schema.schema_content,
+        'content': schema_content,
         'parsed': parsed_info
     })
 
@@ -2185,15 +1793,8 @@ def preview_question():
                     if not mysql_db_name:
                         return jsonify({'error': 'MySQL database name is required'}), 400
                     
-                    # Try to connect to the database
-                    connection = pymysql.connect(
-                        host=os.getenv('MYSQL_HOST', ''),
-                        user=os.getenv('MYSQL_USER', ''),
-                        password=os.getenv('MYSQL_PASSWORD', ''),
-                        port=int(os.getenv('MYSQL_PORT', 3306)),
-                        database=mysql_db_name,
-                        cursorclass=pymysql.cursors.DictCursor
-                    )
+                    # Check out a pooled connection to the database
+                    connection = get_sandbox_connection(mysql_db_name)
                 else:  # imported_schema
                     if not preview_question.schema_import:
                         return jsonify({'error': 'Invalid or missing schema import. Please ensure the schema is properly imported and deployed.'}), 400
@@ -2204,62 +1805,16 @@ def preview_question():
                     # Get the actual database name from the schema import
                     imported_schema_name = preview_question.schema_import.active_schema_name
                     
-                    # Connect to SQL classroom database first
-                    connection = pymysql.connect(
-                        host=os.getenv('MYSQL_HOST', ''),
-                        user=os.getenv('MYSQL_USER', ''),
-                        password=os.getenv('MYSQL_PASSWORD', ''),
-                        port=int(os.getenv('MYSQL_PORT', 3306)),
-                        # database='sql_classroom',
-                        database=os.getenv('APP_DB_NAME', ''),
-                        cursorclass=pymysql.cursors.DictCursor
-                    )
+                    # Check out a pooled connection to the SQL classroom database
+                    connection = get_sandbox_connection(os.getenv('APP_DB_NAME', ''))
                     
                     # Modify query to use table prefixes if needed
                     table_prefix = preview_question.get_table_prefix()
 
                     
                     if table_prefix:
-                        # Get all table names from the schema content
-                        schema_content = preview_question.schema_import.schema_content
-
-                        
-                        table_names = []
-                        
-                        # Parse CREATE TABLE statements to extract table names
-                        from app.utils import parse_schema_statements
-                        statements = parse_schema_statements(schema_content)
-                        
-                        for i, stmt in enumerate(statements):
-
-                            if stmt.upper().strip().startswith('CREATE TABLE'):
-
-                                # Extract table name using the same logic as import
-                                table_start = stmt.upper().find('TABLE') + 5
-                                table_part = stmt[table_start:].strip()
-
-                                table_name = table_part.split()[0].strip('`').rstrip('(').strip('`')
-
-                                table_names.append(table_name)
-                        
-
-
-                        
-                        # Replace table names with prefixed versions in the query using word boundaries
-                        import re
-                        modified_query = query
-                        for table_name in table_names:
-                            # Use word boundaries to avoid partial matches
-                            pattern = r'\b' + re.escape(table_name) + r'\b'
-                            prefixed_table = f"{table_prefix}{table_name}"
-                            old_query = modified_query
-                            modified_query = re.sub(pattern, prefixed_table, modified_query, flags=re.IGNORECASE)
-                            if old_query != modified_query:
-                                logging.debug(f"Table name '{table_name}' replaced with '{prefixed_table}' in query.")
-                            else:
-                                logging.debug(f"No replacement made for table name '{table_name}'.")
-
-                        query = modified_query
+                        # Replace table names with prefixed versions (cached per schema and query)
+                        query = rewrite_for_schema_import(query, preview_question.schema_import, table_prefix)
 
                     else:
                         logging.warning("No table prefix found for imported schema. Query may not execute as expected.")
@@ -2318,30 +1873,19 @@ def preview_question():
                 return jsonify({'error': 'SQLite schema is required'}), 400
                 
             try:
-                # Create in-memory SQLite database
-                engine = create_engine('sqlite:///:memory:', 
-                                     connect_args={'check_same_thread': False})
-                
-                # Create a new connection and load the schema
-                with engine.connect() as conn:
-                    # Load schema
-                    schema_statements = sample_db_schema.split(';')
-                    trans = conn.begin()
-                    try:
-                        for statement in schema_statements:
-                            if statement.strip():
-                                conn.execute(text(statement))
-                        trans.commit()
-                    except Exception as e:
-                        trans.rollback()
-                        return jsonify({'error': f'Error in schema: {str(e)}'}), 400
+                # Get a private copy of the cached schema template
+                try:
+                    sqlite_conn = get_sqlite_connection(sample_db_schema)
+                except Exception as e:
+                    return jsonify({'error': f'Error in schema: {str(e)}'}), 400
                 
+                with closing(sqlite_conn) as conn:
                     # Execute the query
-                    result_proxy = conn.execute(text(query))
+                    cursor = conn.execute(query)
                     
                     # Get columns and data
-                    columns = list(result_proxy.keys())
-                    data = [list(row) for row in result_proxy]
+                    columns = [col[0] for col in cursor.description] if cursor.description else []
+                    data = [list(row) for row in cursor.fetchall()]
                     
                     # Set query result in response
                     response_data['query_result'] = {
@@ -2362,71 +1906,42 @@ def preview_question():
             # Execute the correct answer query and get its results
             try:
                 if db_type == 'mysql' or db_type == 'imported_schema':
-                    # Re-establish connection
                     if db_type == 'mysql':
-                        connection = pymysql.connect(
-                            host=os.getenv('MYSQL_HOST', ''),
-                            user=os.getenv('MYSQL_USER', ''),
-                            password=os.getenv('MYSQL_PASSWORD', ''),
-                            port=int(os.getenv('MYSQL_PORT', 3306)),
-                            database=mysql_db_name,
-                            cursorclass=pymysql.cursors.DictCursor
-                        )
+                        database = mysql_db_name
                     else:
-                        connection = pymysql.connect(
-                            host=os.getenv('MYSQL_HOST', ''),
-                            user=os.getenv('MYSQL_USER', ''),
-                            password=os.getenv('MYSQL_PASSWORD', ''),
-                            port=int(os.getenv('MYSQL_PORT', 3306)),
-                            # database='sql_classroom',
-                            database=os.getenv('APP_DB_NAME', ''),
-                            cursorclass=pymysql.cursors.DictCursor
-                        )
+                        database = os.getenv('APP_DB_NAME', '')
                         
                         # Apply table prefixes to correct answer if needed
                         if table_prefix:
-                            modified_answer = correct_answer
-                            for table_name in table_names:
-                                modified_answer = modified_answer.replace(table_name, f"{table_prefix}{table_name}")
-                            correct_answer = modified_answer
+                            correct_answer = rewrite_for_schema_import(correct_answer, preview_question.schema_import, table_prefix)
                     
-                    with connection.cursor() as cursor:
-                        cursor.execute(correct_answer)
-                        correct_data = cursor.fetchall()
-                        correct_columns = [col[0] for col in cursor.description]
-                        
-                        # Convert to list format for comparison
-                        correct_rows = []
-                        for row in correct_data:
-                            # Normalize data for comparison
-                            row_values = [row[col] if not isinstance(row[col], (datetime, date)) 
-                                         else str(row[col]) for col in correct_columns]
-                            correct_rows.append(row_values)
+                    # Check out a pooled connection; it is returned to the pool on exit
+                    with get_sandbox_connection(database) as connection:
+                        with connection.cursor() as cursor:
+                            cursor.execute(correct_answer)
+                            correct_data = cursor.fetchall()
+                            correct_columns = [col[0] for col in cursor.description]
                             
-                    connection.close()
+                            # Convert to list format for comparison
+                            correct_rows = []
+                            for row in correct_data:
+                                # Normalize data for comparison
+                                row_values = [row[col] if not isinstance(row[col], (datetime, date)) 
+                                             else str(row[col]) for col in correct_columns]
+                                correct_rows.append(row_values)
+                    
                     correct_result = {
                         'columns': correct_columns,
                         'data': correct_rows
                     }
                     
                 elif db_type == 'sqlite':
-                    # Create a new in-memory database for correct answer
-                    correct_engine = create_engine('sqlite:///:memory:',
-                                                  connect_args={'check_same_thread': False})
-                    
-                    with correct_engine.connect() as conn:
-                        # Load schema again
-                        schema_statements = sample_db_schema.split(';')
-                        trans = conn.begin()
-                        for statement in schema_statements:
-                            if statement.strip():
-                                conn.execute(text(statement))
-                        trans.commit()
-                        
+                    # Run the correct answer on its own copy of the schema template
+                    with closing(get_sqlite_connection(sample_db_schema)) as conn:
                         # Execute correct answer
-                        correct_result_proxy = conn.execute(text(correct_answer))
-                        correct_columns = list(correct_result_proxy.keys())
-                        correct_data = [list(row) for row in correct_result_proxy]
+                        correct_cursor = conn.execute(correct_answer)
+                        correct_columns = [col[0] for col in correct_cursor.description] if correct_cursor.description else []
+                        correct_data = [list(row) for row in correct_cursor.fetchall()]
                         
                         correct_result = {
                             'columns': correct_columns,
@@ -2565,6 +2080,10 @@ def toggle_section_assignment_status(section_id, assignment_id):
     
     try:
         db.session.commit()
+        invalidate_student_progress(section_id=section_id)
+        bump_versions(section_ids=[section_id])
+        publish_event(section_channel(section_id), 'assignment_status',
+                      assignment_id=assignment_id, active=section_assignment.is_active)
         flash(f'Assignment has been {status}!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -2572,10 +2091,10 @@ def toggle_section_assignment_status(section_id, assignment_id):
     
     return redirect(url_for('teacher.view_section', section_id=section_id))
 
-@teacher.route('/section/<int:section_id>/assignment/<int:assignment_id>/export_results')
+@teacher.route('/section/<int:section_id>/assignment/<int:assignment_id>/export_results', methods=['GET', 'POST'])
 @login_required
 def export_assignment_results(section_id, assignment_id):
-    """Export results for a specific assignment in a section as Excel file."""
+    """Export results for a specific assignment in a section as an Excel or CSV file."""
     section = Section.query.get_or_404(section_id)
     assignment = Assignment.query.get_or_404(assignment_id)
     
@@ -2590,183 +2109,7 @@ def export_assignment_results(section_id, assignment_id):
         assignment_id=assignment.id
     ).first_or_404()
     
-    # Get all students in this section
-    students = section.get_enrolled_students(active_only=True)
-    
-    # Create Excel workbook
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill
-    from openpyxl.utils.cell import get_column_letter
-    from flask import send_file
-    import tempfile
-    import os
-    
-    # Create a workbook with proper properties
-    wb = Workbook()
-    
-    # Set workbook properties
-    wb.properties.creator = "SQL Classroom"
-    wb.properties.title = f"Assignment {assignment.title} Results"
-    wb.properties.description = f"Student results for {assignment.title} in section {section.name}"
-    
-    # Remove default sheet and create a new one with valid name
-    if "Sheet" in wb.sheetnames:
-        std = wb["Sheet"]
-        wb.remove(std)
-    
-    # Create worksheet with properly escaped name (limit to 31 chars, no special chars)
-    assignment_name = ''.join(c for c in assignment.title if c.isalnum() or c in ' _-')[:20]
-    if not assignment_name:
-        assignment_name = f"Assignment_{assignment.id}"
-    sheet_name = assignment_name
-    ws = wb.create_sheet(title=sheet_name)
-    
-    # Find all questions in the assignment
-    assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).order_by(AssignmentQuestion.order).all()
-    questions = [aq.question for aq in assignment_questions]
-    
-    # Create header row
-    headers = ["No.", "Last Name", "First Name", "Username", "Email"]
-    
-    # Add a column for each question
-    for i, question in enumerate(questions, 1):
-        # Limit title length to avoid Excel issues and remove invalid chars
-        title = ''.join(c for c in question.title if c not in '"*:<>?/\\|')
-        if len(title) > 30:
-            title = title[:27] + "..."
-        headers.append(f"Q{i}: {title}")
-    
-    # Add total score
-    headers.append("Total Score")
-    headers.append("Percentage")
-    
-    # Apply header styling
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-        cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-    
-    # Calculate total possible points for this assignment
-    question_scores = {aq.question_id: aq.score for aq in assignment_questions}
-    total_possible = sum(question_scores.values())
-    
-    # Add data rows
-    for idx, student in enumerate(students, 1):
-        row_num = idx + 1
-        
-        # Basic student info
-        ws.cell(row=row_num, column=1, value=idx)
-        ws.cell(row=row_num, column=2, value=str(student.last_name or ""))
-        ws.cell(row=row_num, column=3, value=str(student.first_name or ""))
-        ws.cell(row=row_num, column=4, value=student.username)
-        ws.cell(row=row_num, column=5, value=student.email)
-        
-        # Get all submissions for this student and assignment
-        submissions = Submission.query.filter_by(
-            student_id=student.id,
-            assignment_id=assignment.id
-        ).all()
-        
-        # Get the most recent submission for each question
-        latest_submissions = {}
-        for submission in submissions:
-            question_id = submission.question_id
-            if question_id not in latest_submissions or submission.submitted_at > latest_submissions[question_id].submitted_at:
-                latest_submissions[question_id] = submission
-        
-        # Fill in question results
-        col_idx = 6  # Start after student info columns
-        earned_points = 0
-        
-        for question in questions:
-            question_id = question.id
-            question_score = question_scores.get(question_id, 0)
-            
-            if question_id in latest_submissions:
-                submission = latest_submissions[question_id]
-                if submission.is_correct:
-                    ws.cell(row=row_num, column=col_idx, value="Correct")
-                    earned_points += question_score
-                    # Add green fill for correct answers
-                    ws.cell(row=row_num, column=col_idx).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                else:
-                    ws.cell(row=row_num, column=col_idx, value="Incorrect")
-                    # Add light red fill for incorrect answers
-                    ws.cell(row=row_num, column=col_idx).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            else:
-                ws.cell(row=row_num, column=col_idx, value="Not Attempted")
-            
-            col_idx += 1
-        
-        # Add total score
-        ws.cell(row=row_num, column=col_idx, value=f"{earned_points}/{total_possible}")
-        
-        # Add percentage
-        if total_possible > 0:
-            percentage = round((earned_points / total_possible) * 100)
-            ws.cell(row=row_num, column=col_idx + 1, value=f"{percentage}%")
-        else:
-            ws.cell(row=row_num, column=col_idx + 1, value="N/A")
-    
-    # Adjust column widths
-    for col_idx, header in enumerate(headers, 1):
-        column_letter = get_column_letter(col_idx)
-        if col_idx == 1:  # Number column
-            ws.column_dimensions[column_letter].width = 5
-        elif col_idx in (2, 3):  # Name columns
-            ws.column_dimensions[column_letter].width = 15
-        elif col_idx == 4:  # Username column
-            ws.column_dimensions[column_letter].width = 15
-        elif col_idx == 5:  # Email column
-            ws.column_dimensions[column_letter].width = 25
-        elif "Q" in header:  # Question columns
-            ws.column_dimensions[column_letter].width = 20
-        else:  # Total columns
-            ws.column_dimensions[column_letter].width = 12
-    
-    # Save to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    temp_file.close()
-    
-    try:
-        # Set proper workbook protection options
-        wb.security.lockStructure = False
-        
-        # Save with explicit options
-        wb.save(temp_file.name)
-        
-        # Send the file
-        filename = f"{section.name}_{assignment_name}_results.xlsx"
-        safe_filename = ''.join(c for c in filename if c.isalnum() or c in ' _-.()[]{}')
-        
-        return_data = send_file(
-            temp_file.name,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=safe_filename
-        )
-        
-        # Schedule file for deletion after request
-        @after_this_request
-        def remove_file(response):
-            try:
-                os.unlink(temp_file.name)
-            except Exception as e:
-                logging.error(f"Error deleting temporary file {temp_file.name}: {e}")
-            return response
-        
-        return return_data
-        
-    except Exception as e:
-
-        # Clean up temp file in case of error
-        try:
-            os.unlink(temp_file.name)
-        except:
-            logging.error(f"Error deleting temporary file {temp_file.name} after error: {e}")
-        flash(f'Error generating Excel file: {str(e)}', 'danger')
-        return redirect(url_for('teacher.view_section', section_id=section.id))
+    return _export_results(section, assignment)
 
 @teacher.route('/section/<int:section_id>/assignment/<int:assignment_id>/duplicate', methods=['GET'])
 @login_required
@@ -2814,6 +2157,9 @@ def duplicate_section_assignment(section_id, assignment_id):
     
     try:
         db.session.commit()
+        invalidate_student_progress(section_id=section.id)
+        bump_versions(section_ids=[section.id])
+        publish_event(section_channel(section.id), 'assignments_changed', assignment_id=new_assignment.id)
         flash(f'Assignment "{original_assignment.title}" has been duplicated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -2838,13 +2184,18 @@ def delete_submission(submission_id):
         return redirect(url_for('teacher.assignments'))
     
     # Get student and question info for the flash message
-    student = User.query.get(submission.student_id)
+    student_id = submission.student_id
+    student = User.query.get(student_id)
     question = Question.query.get(submission.question_id)
     
     try:
-        # Delete the submission
+        # Delete the submission; the gradebook falls back to any earlier submission
         db.session.delete(submission)
+        refresh_entries([(student_id, submission.assignment_id, submission.question_id)])
         db.session.commit()
+        invalidate_student_progress(student_id=student_id)
+        bump_versions(student_ids=[student_id])
+        publish_event(student_channel(student_id), 'progress', assignment_id=assignment.id)
         
         flash(f'Submission deleted successfully! {student.username if student else "Student"} can now re-answer "{question.title if question else "the question"}".', 'success')
     except Exception as e:
@@ -2893,6 +2244,9 @@ def reset_student_password(student_id):
         
         # Show the temporary password to the teacher
         flash(f'Password for {student.full_name} has been reset. Temporary password: {temp_password}', 'success')
+    except PasswordHashBusy:
+        flash('The server is busy. Please try again in a few seconds.', 'warning')
+        return view_student(student.id), 503
     except Exception as e:
         db.session.rollback()
         flash(f'Error resetting password: {str(e)}', 'danger')
@@ -2977,91 +2331,78 @@ def playground_execute():
         if selected_schema:
             # Use the selected schema for query rewriting
             table_prefix = selected_schema.active_schema_name
-            schema_content = selected_schema.schema_content
-            
-
             
-            # Apply query rewriting using utility function
-            from app.utils import rewrite_query_for_schema
-            query = rewrite_query_for_schema(query, schema_content, table_prefix)
+            # Apply cached query rewriting
+            query = rewrite_for_schema_import(query, selected_schema, table_prefix)
         
         # Teachers now have the same query restrictions as students for security
         try:
-            # Connect to MySQL using the actual database name (may be sql_classroom for schema access)
-            conn = pymysql.connect(
-                host=os.getenv('MYSQL_HOST', ''),
-                user=os.getenv('MYSQL_USER', ''),
-                password=os.getenv('MYSQL_PASSWORD', ''),
-                port=int(os.getenv('MYSQL_PORT', 3306)),
-                database=actual_database_name,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            # Execute query and fetch results
-            with conn.cursor() as cursor:
-                # Execute the query
-                cursor.execute(query)
+            # Check out a pooled connection using the actual database name (may be sql_classroom for schema access)
+            with get_sandbox_connection(actual_database_name) as conn:
+                # Execute query and fetch results
+                with conn.cursor() as cursor:
+                    # Execute the query
+                    cursor.execute(query)
                 
-                # Check if this is a SELECT query by looking for a result set
-                if cursor.description:
-                    # For SELECT queries, get the results
-                    data = cursor.fetchall()
+                    # Check if this is a SELECT query by looking for a result set
+                    if cursor.description:
+                        # For SELECT queries, get the results
+                        data = cursor.fetchall()
                     
-                    # Get column names directly from cursor description
-                    columns = [col[0] for col in cursor.description]
+                        # Get column names directly from cursor description
+                        columns = [col[0] for col in cursor.description]
                     
-                    # Convert dictionary data to lists for JSON response
-                    rows = []
-                    for row in data:
-                        # Convert any non-JSON serializable objects to strings
-                        serializable_row = {}
-                        for key, value in row.items():
-                            if isinstance(value, (dict, list, str, int, float, bool, type(None))):
-                                serializable_row[key] = value
-                            else:
-                                serializable_row[key] = str(value)
+                        # Convert dictionary data to lists for JSON response
+                        rows = []
+                        for row in data:
+                            # Convert any non-JSON serializable objects to strings
+                            serializable_row = {}
+                            for key, value in row.items():
+                                if isinstance(value, (dict, list, str, int, float, bool, type(None))):
+                                    serializable_row[key] = value
+                                else:
+                                    serializable_row[key] = str(value)
                         
-                        # Ensure values are in the same order as columns
-                        row_values = [serializable_row.get(col) for col in columns]
-                        rows.append(row_values)
+                            # Ensure values are in the same order as columns
+                            row_values = [serializable_row.get(col) for col in columns]
+                            rows.append(row_values)
                     
-                    # Check if this is a SHOW TABLES query on an imported schema
-                    from app.utils import is_show_tables_query, process_show_tables_result_for_schema, is_show_databases_query, filter_show_databases_result_for_user
-                    if is_show_tables_query(query):
-                        if selected_schema:
-                            # Filter tables for the specific selected schema
-                            prefix = selected_schema.active_schema_name
-                            # Filter tables to only show those belonging to this schema
-                            filtered_rows = []
-                            for row in rows:
-                                table_name = row[0]
-                                if table_name.startswith(prefix):
-                                    # Remove the prefix to show the original table name
-                                    original_name = table_name[len(prefix):]
-                                    filtered_rows.append([original_name])
-                            rows = filtered_rows
-                        else:
-                            # For regular databases, use the standard filtering
-                            columns, rows = process_show_tables_result_for_schema(
-                                columns, rows, database_name, current_user.id
-                            )
-                    elif is_show_databases_query(query):
-                        # Filter SHOW DATABASES result to include allowed databases and teacher's schemas
-                        columns, rows = filter_show_databases_result_for_user(columns, rows, current_user)
+                        # Check if this is a SHOW TABLES query on an imported schema
+                        from app.utils import is_show_tables_query, process_show_tables_result_for_schema, is_show_databases_query, filter_show_databases_result_for_user
+                        if is_show_tables_query(query):
+                            if selected_schema:
+                                # Filter tables for the specific selected schema
+                                prefix = selected_schema.active_schema_name
+                                # Filter tables to only show those belonging to this schema
+                                filtered_rows = []
+                                for row in rows:
+                                    table_name = row[0]
+                                    if table_name.startswith(prefix):
+                                        # Remove the prefix to show the original table name
+                                        original_name = table_name[len(prefix):]
+                                        filtered_rows.append([original_name])
+                                rows = filtered_rows
+                            else:
+                                # For regular databases, use the standard filtering
+                                columns, rows = process_show_tables_result_for_schema(
+                                    columns, rows, database_name, current_user.id
+                                )
+                        elif is_show_databases_query(query):
+                            # Filter SHOW DATABASES result to include allowed databases and teacher's schemas
+                            columns, rows = filter_show_databases_result_for_user(columns, rows, current_user)
                     
-                    result = {
-                        'columns': columns,
-                        'data': rows
-                    }
-                else:
-                    # For non-SELECT queries (INSERT, UPDATE, etc.)
-                    affected_rows = cursor.rowcount
-                    result = {
-                        'columns': ['Result'],
-                        'data': [[f"{affected_rows} row(s) affected"]]
-                    }
+                        result = {
+                            'columns': columns,
+                            'data': rows
+                        }
+                    else:
+                        # For non-SELECT queries (INSERT, UPDATE, etc.)
+                        affected_rows = cursor.rowcount
+                        result = {
+                            'columns': ['Result'],
+                            'data': [[f"{affected_rows} row(s) affected"]]
+                        }
             
-            conn.close()
             return jsonify(result)
             
         except pymysql.err.OperationalError as e:
@@ -3119,27 +2460,19 @@ def get_available_databases():
         
         # Fallback: if no allowed databases configured and no teacher schemas,
         # return all databases except system ones (backward compatibility)
-        conn = pymysql.connect(
-            host=os.getenv('MYSQL_HOST', ''),
-            user=os.getenv('MYSQL_USER', ''),
-            password=os.getenv('MYSQL_PASSWORD', ''),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        
-        # Execute query to get databases
-        with conn.cursor() as cursor:
-            cursor.execute("SHOW DATABASES")
-            all_databases = [db['Database'] for db in cursor.fetchall()]
-            
-            # For teachers, we include all databases except a few system ones
-            system_dbs = ['sys']  # Keep information_schema, mysql, performance_schema for admin purposes
-            user_databases = [db for db in all_databases if db not in system_dbs]
-            
-            # Sort alphabetically
-            user_databases.sort()
+        with get_sandbox_connection() as conn:
+            # Execute query to get databases
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW DATABASES")
+                all_databases = [db['Database'] for db in cursor.fetchall()]
+                
+                # For teachers, we include all databases except a few system ones
+                system_dbs = ['sys']  # Keep information_schema, mysql, performance_schema for admin purposes
+                user_databases = [db for db in all_databases if db not in system_dbs]
+                
+                # Sort alphabetically
+                user_databases.sort()
         
-        conn.close()
         return jsonify({'databases': user_databases})
         
     except Exception as e:
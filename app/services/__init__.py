@@ -0,0 +1,6 @@
+"""
+Service layer for the SQL Classroom application.
+
+Modules in this package hold long-lived, process-wide helpers (connection
+pools, caches, background workers) that are shared by several blueprints.
+"""
@@ -0,0 +1,224 @@
+"""
+System statistics for the admin dashboard.
+
+The dashboard used to run a dozen COUNT(*) queries and a SHOW TABLES on
+every view. The numbers are now gathered in one statement (every count is a
+scalar subquery of the same SELECT, and the "last 7 days" figures use plain
+range conditions that can use an index), kept per process for
+ADMIN_STATS_TTL seconds, and refreshed in a background thread once they are
+older than that, so views never wait for the aggregate after the first one.
+
+Answers submitted per day are also kept in ``daily_counters``: the submit
+paths call count_submission() in their transaction, so "submissions today"
+is a single-row read. A day's counter is seeded from the submissions table
+the first time it is used.
+
+    ADMIN_STATS_TTL   seconds before the cached snapshot is refreshed (default 60)
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from flask import current_app
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.assignment import Assignment
+from app.models.daily_counter import DailyCounter
+from app.models.question import Question
+from app.models.section import Section
+from app.models.submission import Submission
+from app.models.user import StudentEnrollment, User
+
+SUBMISSIONS = 'submissions'
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _day_range(day):
+    start = datetime.combine(day, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+def _seed(name, day):
+    """Count a day's events from the source table, for a counter row that does not exist yet."""
+    if name != SUBMISSIONS:
+        return 0
+    start, end = _day_range(day)
+    return (db.session.query(func.count(Submission.id))
+            .filter(Submission.submitted_at >= start, Submission.submitted_at < end)
+            .scalar())
+
+
+def increment_counter(name, day=None, amount=1):
+    """
+    Add to a day's counter (today, UTC, by default). Call before committing
+    the change being counted, so both are stored together.
+    """
+    day = day or datetime.utcnow().date()
+    updated = (DailyCounter.query
+               .filter_by(name=name, day=day)
+               .update({'count': DailyCounter.count + amount, 'updated_at': datetime.utcnow()},
+                       synchronize_session=False))
+    if updated:
+        return
+    # First event of the day: the seed already includes it once it has been flushed
+    db.session.flush()
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyCounter(name=name, day=day, count=max(_seed(name, day), amount)))
+    except IntegrityError:
+        # A concurrent request created the row first
+        increment_counter(name, day, amount)
+
+
+def count_submission():
+    """Count an answer submitted now (new or resubmitted); call before committing."""
+    increment_counter(SUBMISSIONS)
+
+
+def get_counter(name, day=None):
+    """Read a day's counter, seeding it if it does not exist yet."""
+    day = day or datetime.utcnow().date()
+    count = db.session.query(DailyCounter.count).filter_by(name=name, day=day).scalar()
+    if count is not None:
+        return count
+    count = _seed(name, day)
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyCounter(name=name, day=day, count=count))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return get_counter(name, day)
+    return count
+
+
+def _count(model, *conditions):
+    return select(func.count()).select_from(model).where(*conditions).scalar_subquery()
+
+
+def _database_info():
+    try:
+        return {
+            'name': db.engine.url.database,
+            'tables': len(inspect(db.engine).get_table_names()),
+            'status': 'Connected'
+        }
+    except Exception as e:
+        return {'name': 'Unknown', 'tables': 0, 'status': f'Error: {str(e)}'}
+
+
+def _database_size():
+    """Total size in MB (MySQL only; 0 where information_schema has no sizes)."""
+    try:
+        size = db.session.execute(text("""
+            SELECT ROUND(SUM((DATA_LENGTH + INDEX_LENGTH) / 1024 / 1024), 2)
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)).scalar()
+        return float(size or 0)
+    except Exception:
+        db.session.rollback()
+        return 0
+
+
+def compute_stats():
+    """Gather the dashboard numbers (one aggregate statement plus database metadata)."""
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    row = db.session.query(
+        _count(User).label('users'),
+        _count(User, User.role == 'student').label('students'),
+        _count(User, User.role == 'teacher').label('teachers'),
+        _count(User, User.role == 'admin').label('admins'),
+        _count(User, User.created_at >= week_ago).label('recent_users'),
+        _count(Section).label('sections'),
+        _count(StudentEnrollment, StudentEnrollment.is_active == True).label('enrollments'),
+        _count(Assignment).label('assignments'),
+        _count(Question).label('questions'),
+        _count(Submission).label('submissions'),
+        _count(Submission, Submission.submitted_at >= week_ago).label('recent_submissions'),
+    ).one()
+    return {
+        'users': {
+            'total': row.users,
+            'students': row.students,
+            'teachers': row.teachers,
+            'admins': row.admins,
+            'recent': row.recent_users
+        },
+        'sections': {
+            'total': row.sections,
+            'enrollments': row.enrollments
+        },
+        'assignments': {
+            'total': row.assignments,
+            'questions': row.questions,
+            'submissions': row.submissions,
+            'recent_submissions': row.recent_submissions
+        },
+        'database': dict(_database_info(), size_mb=_database_size()),
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+
+class StatsSnapshot:
+    """
+    The latest compute_stats() result of this process. Once it is older
+    than ``ttl`` it is still served while one background thread replaces it.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._stats = None
+        self._stored_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            stats, age = self._stats, time.monotonic() - self._stored_at
+            start_refresh = stats is not None and age >= self.ttl and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if stats is None:
+            return self.refresh()
+        if start_refresh:
+            app = current_app._get_current_object()
+            threading.Thread(target=self._refresh_in_background, args=(app,),
+                             name='admin-stats-refresh', daemon=True).start()
+        return stats
+
+    def refresh(self):
+        stats = compute_stats()
+        with self._lock:
+            self._stats, self._stored_at = stats, time.monotonic()
+        return stats
+
+    def _refresh_in_background(self, app):
+        with app.app_context():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Could not refresh the admin statistics: {e}")
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._refreshing = False
+
+
+_snapshot = StatsSnapshot(ttl=_env_int('ADMIN_STATS_TTL', 60))
+
+
+def get_dashboard_stats():
+    """The cached statistics snapshot (computed on first use)."""
+    return _snapshot.get()
@@ -0,0 +1,139 @@
+"""
+A student's active sections and their teachers, for the page layout.
+
+Every page rendered for a student shows the teacher of each of their
+sections. Instead of loading the sections and then each teacher on every
+render, the (section -> teacher) map is read in one joined query and kept
+per process for a short time, and within a request it is kept on
+``flask.g``. Entries are dropped when the student's enrollments change in
+this process; changes made by another worker show up once the entry
+expires:
+
+    ENROLLMENT_CACHE_TTL    seconds to keep a student's entry (default 30)
+    ENROLLMENT_CACHE_SIZE   maximum cached students (default 5000)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, has_request_context
+
+from app import db
+from app.models.section import Section
+from app.models.user import StudentEnrollment, User
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TeacherInfo(namedtuple('TeacherInfo', ['id', 'username', 'first_name', 'last_name'])):
+    """The teacher fields the templates show, detached from any session."""
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+
+class EnrollmentCache:
+    """
+    Thread-safe LRU of section_id -> TeacherInfo maps keyed by student_id,
+    with entries expiring after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries=5000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # student_id -> (teachers, stored_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, student_id):
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(student_id)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, student_id, teachers):
+        with self._lock:
+            self._entries[student_id] = (teachers, time.monotonic())
+            self._entries.move_to_end(student_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, student_ids=None, section_id=None):
+        """Drop the entries of some students and/or of everyone in a section (all entries if neither is given)."""
+        with self._lock:
+            if student_ids is None and section_id is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                student_ids = set(student_ids or ())
+                keys = [key for key, (teachers, _) in self._entries.items()
+                        if key in student_ids or section_id in teachers]
+                for key in keys:
+                    del self._entries[key]
+                dropped = len(keys)
+            self._stats['invalidations'] += dropped
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+
+
+_cache = EnrollmentCache(
+    max_entries=_env_int('ENROLLMENT_CACHE_SIZE', 5000),
+    ttl=_env_int('ENROLLMENT_CACHE_TTL', 30)
+)
+
+
+def _load_section_teachers(student_id):
+    rows = (db.session.query(StudentEnrollment.section_id, User.id, User.username, User.first_name, User.last_name)
+            .join(Section, Section.id == StudentEnrollment.section_id)
+            .join(User, User.id == Section.creator_id)
+            .filter(StudentEnrollment.student_id == student_id,
+                    StudentEnrollment.is_active == True))
+    return {section_id: TeacherInfo(teacher_id, username, first_name, last_name)
+            for section_id, teacher_id, username, first_name, last_name in rows}
+
+
+def get_section_teachers(student_id):
+    """
+    The teacher of each section a student is actively enrolled in.
+
+    Returns:
+        dict: section_id -> TeacherInfo
+    """
+    request_cache = g.setdefault('_section_teachers', {}) if has_request_context() else {}
+    teachers = request_cache.get(student_id)
+    if teachers is None:
+        teachers = _cache.get(student_id)
+        if teachers is None:
+            teachers = _load_section_teachers(student_id)
+            _cache.put(student_id, teachers)
+        request_cache[student_id] = teachers
+    return teachers
+
+
+def invalidate_enrollments(student_ids=None, section_id=None):
+    """
+    Forget cached enrollments after they changed: those of some students,
+    of everyone in a section, or (with no arguments) of everyone.
+    """
+    _cache.invalidate(student_ids=student_ids, section_id=section_id)
+    if has_request_context():
+        g.pop('_section_teachers', None)
+        g.pop('_active_sections', None)
+
+
+def get_enrollment_cache_stats():
+    return _cache.stats()
@@ -0,0 +1,295 @@
+"""
+Push notifications for open student pages.
+
+Student pages used to poll the assignment status APIs every few seconds.
+Instead, routes that change what a student may see (toggling or reassigning
+assignments, editing their questions, removing enrollments, new submissions)
+publish a small event, and each open page holds a Server-Sent Events stream
+that relays the events for its section and student.
+
+Gunicorn runs several worker processes, and the stream for a page may live
+in a different worker than the request that published the event. Events are
+therefore appended to a SQLite file shared by the workers on this host. Each
+worker that serves streams runs one listener thread, which reads new rows
+from the file and hands them to the in-process subscribers.
+
+    EVENT_BUS_PATH            shared SQLite file (default: sql_classroom_events.sqlite3
+                              in the system temp directory)
+    EVENT_BUS_POLL_INTERVAL   seconds between reads of the bus file (default 0.5)
+    EVENT_BUS_RETENTION       seconds events are kept in the file (default 300)
+    EVENT_STREAM_ENABLED      'true' turns the stream on (default 'false': pages poll)
+    EVENT_STREAM_MAX_STREAMS  open streams per process (default 16); pages beyond it poll
+    EVENT_STREAM_MAX_SECONDS  lifetime of one stream before the browser reconnects (default 300)
+    EVENT_STREAM_HEARTBEAT    seconds between keep-alive comments (default 15)
+
+Each open stream holds a server thread for up to EVENT_STREAM_MAX_SECONDS, so
+streaming is off by default and only suits threaded workers (see
+DEPLOYMENT.md). A process never holds more than EVENT_STREAM_MAX_STREAMS
+streams; further pages are told to poll, whatever the thread count.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def section_channel(section_id):
+    """Channel for events that concern every student of a section."""
+    return f"section:{section_id}"
+
+
+def student_channel(student_id):
+    """Channel for events that concern a single student."""
+    return f"student:{student_id}"
+
+
+def events_enabled():
+    """Whether the event stream endpoint is turned on."""
+    return os.getenv('EVENT_STREAM_ENABLED', 'false').lower() == 'true'
+
+
+class Subscription:
+    """
+    A stream's view of the bus: receives the events of its channels.
+
+    Use as a context manager so the subscription is removed when the stream ends.
+    """
+
+    def __init__(self, bus, channels, max_pending=100):
+        self.bus = bus
+        self.channels = frozenset(channels)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # The page is not keeping up; it will be told to reload its state instead
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        Wait for the next event.
+
+        Returns:
+            dict: The event ({'id', 'channel', 'event', 'data'}), or None on timeout
+        """
+        try:
+            return self._queue.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class EventBus:
+    """
+    Publish/subscribe bus shared by the worker processes through a SQLite file.
+
+    publish() only appends to the file; delivery always goes through the
+    listener thread, so the publishing worker sees its own events exactly
+    like the others do.
+    """
+
+    def __init__(self, path, poll_interval=0.5, retention=300, max_streams=16):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_streams = max(max_streams, 0)
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._last_prune = 0.0
+        self._streams = 0
+        self._stats = {'published': 0, 'delivered': 0, 'publish_errors': 0, 'overflows': 0,
+                       'streams_rejected': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        return conn
+
+    def publish(self, channel, event, data=None):
+        """
+        Append an event to the bus. Failures are logged, never raised, so a
+        notification problem cannot break the change that triggered it.
+        """
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute("INSERT INTO events (channel, event, data, created_at) VALUES (?, ?, ?, ?)",
+                             (channel, event, json.dumps(data or {}), now))
+                if now - self._last_prune > 60:
+                    self._last_prune = now
+                    conn.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention,))
+            with self._lock:
+                self._stats['published'] += 1
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats['publish_errors'] += 1
+            logging.warning(f"Could not publish event '{event}' on {channel}: {e}")
+
+    def subscribe(self, channels):
+        """Register a subscriber for the given channels and make sure the listener runs."""
+        subscription = Subscription(self, channels)
+        with self._lock:
+            self._subscribers.add(subscription)
+            # Threads do not survive a fork, so start a listener per process
+            if self._listener is None or self._listener_pid != os.getpid() or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='event-bus-listener', daemon=True)
+                self._listener_pid = os.getpid()
+                self._listener.start()
+        return subscription
+
+    def open_stream(self):
+        """Take one of the process's stream slots; False if all are in use."""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                self._stats['streams_rejected'] += 1
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        """Give back a slot taken with open_stream()."""
+        with self._lock:
+            self._streams = max(self._streams - 1, 0)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _dispatch(self, event):
+        with self._lock:
+            subscribers = [sub for sub in self._subscribers if event['channel'] in sub.channels]
+        for subscription in subscribers:
+            subscription.deliver(event)
+            with self._lock:
+                if subscription.overflowed:
+                    self._stats['overflows'] += 1
+                else:
+                    self._stats['delivered'] += 1
+
+    def _listen(self):
+        last_id = None
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self._connect()
+                if last_id is None:
+                    # Only events published from now on are relayed
+                    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+                rows = conn.execute("SELECT id, channel, event, data FROM events WHERE id > ? ORDER BY id",
+                                    (last_id,)).fetchall()
+                for event_id, channel, event, data in rows:
+                    last_id = event_id
+                    self._dispatch({'id': event_id, 'channel': channel, 'event': event, 'data': json.loads(data)})
+            except sqlite3.Error as e:
+                logging.warning(f"Event bus listener could not read {self.path}: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscribers), streams=self._streams,
+                        max_streams=self.max_streams, path=self.path)
+
+
+_bus = EventBus(
+    path=os.getenv('EVENT_BUS_PATH', os.path.join(tempfile.gettempdir(), 'sql_classroom_events.sqlite3')),
+    poll_interval=_env_float('EVENT_BUS_POLL_INTERVAL', 0.5),
+    retention=_env_int('EVENT_BUS_RETENTION', 300),
+    max_streams=_env_int('EVENT_STREAM_MAX_STREAMS', 16)
+)
+
+
+def publish_event(channel, event, **data):
+    """
+    Notify the open pages subscribed to a channel. Call after the change has been committed.
+
+    Args:
+        channel (str): From section_channel() or student_channel()
+        event (str): Event name, e.g. 'assignment_status'
+        **data: JSON-serialisable event payload
+    """
+    _bus.publish(channel, event, data)
+
+
+def subscribe(channels):
+    """
+    Subscribe to events on the given channels.
+
+    Returns:
+        Subscription: Use as a context manager; call get(timeout) for events
+    """
+    return _bus.subscribe(channels)
+
+
+def open_stream():
+    """
+    Reserve a stream slot in this process. Call close_stream() when the stream ends.
+
+    Returns:
+        bool: False if EVENT_STREAM_MAX_STREAMS streams are already open
+    """
+    return _bus.open_stream()
+
+
+def close_stream():
+    """Release a slot reserved with open_stream()."""
+    _bus.close_stream()
+
+
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Events message."""
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n" + message
+    return message
+
+
+def get_event_bus_stats():
+    """Return publish/delivery counters of the event bus in this process."""
+    return _bus.stats()
@@ -0,0 +1,228 @@
+"""
+Result exports prepared in the background and cached on disk.
+
+Near grading deadlines teachers export the same section again and again,
+and rebuilding the file each time is wasted work. An export is therefore
+identified by what it shows: the section (and assignment), the format, and
+a fingerprint of the gradebook behind it. The fingerprint combines the
+section's version stamp, which moves when the roster, the assignments or
+their scoring change, with the number and last update of the gradebook
+entries involved, which move with every submission. A file with the
+current fingerprint is served straight from the cache; otherwise the
+export runs as a background job (see app.services.jobs) and the page polls
+it and downloads the file when it is done.
+
+Artifacts older than EXPORT_CACHE_MAX_AGE are removed, and the least
+recently used ones go first when the cache grows beyond EXPORT_CACHE_MAX_MB:
+
+    EXPORT_CACHE_DIR       where artifacts are kept (default: a directory
+                           in the system temp dir, shared by all workers)
+    EXPORT_CACHE_MAX_AGE   seconds an artifact is kept (default 86400)
+    EXPORT_CACHE_MAX_MB    total size of the cache (default 500)
+"""
+
+import logging
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+from flask import send_file
+from sqlalchemy import func
+
+from app import db
+from app.models.assignment import Assignment
+from app.models.gradebook_entry import GradebookEntry
+from app.models.section import Section
+from app.models.section_assignment import SectionAssignment
+from app.models.user import StudentEnrollment
+from app.services.exports import FORMATS, assignment_results, export_filename, section_results, write_export
+from app.services.jobs import find_active_job, submit_job
+from app.services.version_stamps import get_versions, make_etag
+
+# Bump when the layout of the exported files changes, so cached artifacts are not reused
+EXPORT_REVISION = 1
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _cache_dir():
+    path = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sql_classroom_exports'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# name: file name in the cache; download_name: name offered to the browser
+Artifact = namedtuple('Artifact', ['name', 'download_name', 'export_format'])
+
+
+def gradebook_fingerprint(section, assignment_id=None):
+    """
+    Fingerprint of the data behind a section export, or the export of one
+    of its assignments. It changes whenever the exported file would.
+    """
+    section_version, _ = get_versions(section.id)
+    students = (db.session.query(StudentEnrollment.student_id)
+                .filter(StudentEnrollment.section_id == section.id,
+                        StudentEnrollment.is_active == True))
+    entries = db.session.query(func.count(GradebookEntry.id), func.max(GradebookEntry.updated_at))
+    if assignment_id is None:
+        assignments = (db.session.query(SectionAssignment.assignment_id)
+                       .filter(SectionAssignment.section_id == section.id))
+        entries = entries.filter(GradebookEntry.assignment_id.in_(assignments))
+    else:
+        entries = entries.filter(GradebookEntry.assignment_id == assignment_id)
+    count, last_update = entries.filter(GradebookEntry.student_id.in_(students)).one()
+    return make_etag(EXPORT_REVISION, section.id, assignment_id, section.name, section_version,
+                     count, last_update)
+
+
+def export_artifact(section, assignment=None, export_format='xlsx'):
+    """Identify the current export of a section, or of one of its assignments."""
+    assignment_id = assignment.id if assignment is not None else None
+    fingerprint = gradebook_fingerprint(section, assignment_id)
+    if assignment is None:
+        name = f"section-{section.id}-{fingerprint}.{export_format}"
+    else:
+        name = f"assignment-{section.id}-{assignment.id}-{fingerprint}.{export_format}"
+    download_name = f"{export_filename(section, assignment)}.{export_format}"
+    return Artifact(name, download_name, export_format)
+
+
+def _artifact_path(name):
+    return os.path.join(_cache_dir(), os.path.basename(name))
+
+
+def is_cached(name):
+    """Whether an artifact is ready in the cache."""
+    return os.path.isfile(_artifact_path(name))
+
+
+def artifact_response(name, download_name, export_format):
+    """
+    Send a cached artifact as a download.
+
+    Returns:
+        Response: The download, or None if the artifact is not (or no
+            longer) in the cache
+    """
+    path = _artifact_path(name)
+    try:
+        # Recently downloaded files are evicted last
+        os.utime(path)
+        return send_file(path, mimetype=FORMATS[export_format], as_attachment=True,
+                         download_name=download_name, max_age=0)
+    except FileNotFoundError:
+        return None
+
+
+def _job_type(assignment_id, export_format):
+    return f"{'assignment' if assignment_id else 'section'}_export_{export_format}"
+
+
+def start_export(artifact, section_id, assignment_id, created_by):
+    """
+    Queue the job that writes an artifact, or return the one already doing so.
+
+    A queued job has not read the gradebook yet and is reused as is; a
+    running one only if it works on the same fingerprint.
+
+    Returns:
+        BackgroundJob: The job whose result is the artifact
+    """
+    job_type = _job_type(assignment_id, artifact.export_format)
+    target_id = section_id
+    if assignment_id is not None:
+        # The same assignment can be exported from several sections
+        target_id = (db.session.query(SectionAssignment.id)
+                     .filter_by(section_id=section_id, assignment_id=assignment_id)
+                     .scalar())
+    job = find_active_job(job_type, target_id)
+    if job is not None and (job.status == 'queued' or job.get_progress().get('artifact') == artifact.name):
+        return job
+    return submit_job(job_type, run_export_job, created_by, target_id=target_id,
+                      section_id=section_id, assignment_id=assignment_id,
+                      export_format=artifact.export_format, name=artifact.name,
+                      download_name=artifact.download_name)
+
+
+def run_export_job(reporter, section_id, assignment_id, export_format, name, download_name):
+    """Build an export into the cache (runs on the background pool)."""
+    reporter.update('Loading results', artifact=name)
+    section = Section.query.get(section_id)
+    if section is None:
+        raise ValueError('The section no longer exists')
+    if assignment_id is None:
+        table = section_results(section)
+    else:
+        assignment = Assignment.query.get(assignment_id)
+        if assignment is None:
+            raise ValueError('The assignment no longer exists')
+        table = assignment_results(section, assignment)
+
+    reporter.update('Writing file')
+    cache_dir = _cache_dir()
+    path = os.path.join(cache_dir, name)
+    # Write next to the final file and rename, so readers never see a partial artifact
+    fd, partial_path = tempfile.mkstemp(dir=cache_dir, suffix='.partial')
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            write_export(table, export_format, fileobj)
+        os.replace(partial_path, path)
+    except Exception:
+        os.unlink(partial_path)
+        raise
+    size = os.path.getsize(path)
+
+    evict_artifacts(keep=name)
+    return {'artifact': name, 'download_name': download_name, 'format': export_format, 'size': size}
+
+
+def evict_artifacts(keep=None):
+    """
+    Trim the cache: remove artifacts older than EXPORT_CACHE_MAX_AGE, then
+    the least recently used ones until it fits in EXPORT_CACHE_MAX_MB.
+
+    Args:
+        keep (str, optional): An artifact that must stay, e.g. the one just written
+
+    Returns:
+        dict: Number of files removed and bytes remaining
+    """
+    cache_dir = _cache_dir()
+    max_age = _env_int('EXPORT_CACHE_MAX_AGE', 86400)
+    max_bytes = _env_int('EXPORT_CACHE_MAX_MB', 500) * 1024 * 1024
+    now = time.time()
+
+    files = []
+    for entry in os.scandir(cache_dir):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.is_file():
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+
+    removed, total = 0, sum(size for _, size, _ in files)
+    for mtime, size, name in sorted(files):
+        expired = now - mtime > max_age
+        # Partial files of running jobs are only removed once they are clearly abandoned
+        if name == keep or (name.endswith('.partial') and not expired):
+            continue
+        if not expired and total <= max_bytes:
+            continue
+        try:
+            os.unlink(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove cached export {name}: {e}")
+            continue
+        removed += 1
+        total -= size
+    return {'removed': removed, 'bytes': total}
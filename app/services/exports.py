@@ -0,0 +1,278 @@
+"""
+Result exports for a section, or one assignment of a section, as XLSX or CSV.
+
+Everything an export needs (students, assignments, question sets and the
+gradebook) is loaded up front in a handful of queries; the rows are then
+produced by a generator. Workbooks are written with openpyxl's write-only
+mode, which keeps only the current row in memory, into an anonymous
+temporary file that is streamed to the client in chunks. CSV is generated
+on the fly while the response is sent.
+"""
+
+import csv
+import io
+import tempfile
+from collections import namedtuple
+from urllib.parse import quote
+
+from flask import Response, send_file
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from app import db
+from app.models.assignment import Assignment, AssignmentQuestion
+from app.models.question import Question
+from app.models.section_assignment import SectionAssignment
+from app.models.user import StudentEnrollment, User
+from app.services.gradebook import load_assignment_points, load_results
+from app.services.section_stats import load_question_sets
+
+FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+HEADER_FILL = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+STATUS_FILLS = {
+    'Correct': PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"),
+    'Incorrect': PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid"),
+}
+
+# status: colour the cell by its value (Correct / Incorrect)
+Column = namedtuple('Column', ['header', 'width', 'status'], defaults=[False])
+
+
+class ResultTable:
+    """
+    An export ready to be written.
+
+    Attributes:
+        title (str): Worksheet name (at most 31 characters)
+        filename (str): Download name without extension
+        description (str): Workbook description
+        columns (list): Column tuples, in order
+        rows (iterator): Lists of cell values, one per student
+    """
+
+    def __init__(self, title, filename, description, columns, rows):
+        self.title = title
+        self.filename = filename
+        self.description = description
+        self.columns = columns
+        self.rows = rows
+
+
+def _safe_filename(name):
+    return ''.join(c for c in name if c.isalnum() or c in ' _-.()[]{}')
+
+
+def _section_sheet_name(section):
+    return ''.join(c for c in section.name if c.isalnum() or c in ' _-')[:31] or "Results"
+
+
+def _assignment_sheet_name(assignment):
+    return ''.join(c for c in assignment.title if c.isalnum() or c in ' _-')[:20] or f"Assignment_{assignment.id}"
+
+
+def export_filename(section, assignment=None):
+    """Download name, without extension, of a section export or of one of its assignments."""
+    if assignment is None:
+        return _safe_filename(f"{_section_sheet_name(section)}_results")
+    return _safe_filename(f"{section.name}_{_assignment_sheet_name(assignment)}_results")
+
+
+def _load_students(section_id):
+    """(id, last_name, first_name, username, email) of the section's active students."""
+    return (db.session.query(User.id, User.last_name, User.first_name, User.username, User.email)
+            .join(StudentEnrollment, StudentEnrollment.student_id == User.id)
+            .filter(StudentEnrollment.section_id == section_id,
+                    StudentEnrollment.is_active == True)
+            .order_by(User.id)
+            .all())
+
+
+def _score_display(earned, possible):
+    if possible > 0:
+        return f"{earned}/{possible} ({round(earned / possible * 100)}%)"
+    return "N/A"
+
+
+def section_results(section):
+    """
+    Build the section export: one row per student with the score of every
+    assignment of the section and the total.
+    """
+    students = _load_students(section.id)
+    assignments = (db.session.query(Assignment.id, Assignment.title)
+                   .join(SectionAssignment, SectionAssignment.assignment_id == Assignment.id)
+                   .filter(SectionAssignment.section_id == section.id)
+                   .order_by(Assignment.id)
+                   .all())
+    assignment_ids = [assignment.id for assignment in assignments]
+    question_sets = load_question_sets(assignment_ids)
+    points = load_assignment_points([student.id for student in students], assignment_ids)
+    possible = {assignment_id: sum(question_sets.get(assignment_id, {}).values()) for assignment_id in assignment_ids}
+
+    section_name = section.name
+    columns = [Column("No.", 5), Column("Last Name", 15), Column("First Name", 15), Column("Section", 20)]
+    for assignment in assignments:
+        title = ''.join(c for c in assignment.title if c not in '"*:<>?/\\|')
+        if len(title) > 100:
+            title = title[:100] + "..."
+        columns += [Column(title, 25), Column("Raw Score", 12)]
+    columns += [Column("Total Score", 25), Column("Raw Total", 12)]
+
+    def rows():
+        for number, student in enumerate(students, 1):
+            row = [number, student.last_name or "", student.first_name or "", section_name]
+            total_earned = total_possible = 0
+            for assignment_id in assignment_ids:
+                earned = points.get((student.id, assignment_id), 0)
+                total_earned += earned
+                total_possible += possible[assignment_id]
+                row += [_score_display(earned, possible[assignment_id]), float(earned)]
+            if total_possible > 0:
+                row += [_score_display(total_earned, total_possible), float(total_earned)]
+            else:
+                row += ["N/A", 0]
+            yield row
+
+    return ResultTable(title=_section_sheet_name(section),
+                       filename=export_filename(section),
+                       description=f"Student results for section {section.name}",
+                       columns=columns,
+                       rows=rows())
+
+
+def assignment_results(section, assignment):
+    """
+    Build the assignment export: one row per student of the section with the
+    result of every question and the total score.
+    """
+    students = _load_students(section.id)
+    questions = (db.session.query(AssignmentQuestion.question_id, AssignmentQuestion.score, Question.title)
+                 .join(Question, Question.id == AssignmentQuestion.question_id)
+                 .filter(AssignmentQuestion.assignment_id == assignment.id)
+                 .order_by(AssignmentQuestion.order)
+                 .all())
+    assignment_id = assignment.id
+    results = load_results([student.id for student in students], [assignment_id])
+    total_possible = sum({question.question_id: question.score for question in questions}.values())
+
+    columns = [Column("No.", 5), Column("Last Name", 15), Column("First Name", 15),
+               Column("Username", 15), Column("Email", 25)]
+    for number, question in enumerate(questions, 1):
+        title = ''.join(c for c in question.title if c not in '"*:<>?/\\|')
+        if len(title) > 30:
+            title = title[:27] + "..."
+        columns.append(Column(f"Q{number}: {title}", 20, status=True))
+    columns += [Column("Total Score", 12), Column("Percentage", 12)]
+
+    def rows():
+        for number, student in enumerate(students, 1):
+            row = [number, student.last_name or "", student.first_name or "", student.username, student.email]
+            entries = results.get((student.id, assignment_id), {})
+            earned = 0
+            for question in questions:
+                if question.question_id not in entries:
+                    row.append("Not Attempted")
+                    continue
+                is_correct, points = entries[question.question_id]
+                row.append("Correct" if is_correct else "Incorrect")
+                earned += points if is_correct else 0
+            row.append(f"{earned}/{total_possible}")
+            row.append(f"{round(earned / total_possible * 100)}%" if total_possible > 0 else "N/A")
+            yield row
+
+    return ResultTable(title=_assignment_sheet_name(assignment),
+                       filename=export_filename(section, assignment),
+                       description=f"Student results for {assignment.title} in section {section.name}",
+                       columns=columns,
+                       rows=rows())
+
+
+def write_xlsx(table, fileobj):
+    """Write a ResultTable as a workbook, row by row, into a binary file object."""
+    workbook = Workbook(write_only=True)
+    workbook.properties.creator = "SQL Classroom"
+    workbook.properties.title = table.filename
+    workbook.properties.description = table.description
+    sheet = workbook.create_sheet(title=table.title)
+
+    # Column widths must be set before the first row is written
+    for index, column in enumerate(table.columns, 1):
+        sheet.column_dimensions[get_column_letter(index)].width = column.width
+
+    header_font, header_alignment = Font(bold=True), Alignment(horizontal='center')
+    headers = []
+    for column in table.columns:
+        cell = WriteOnlyCell(sheet, value=column.header)
+        cell.font, cell.alignment, cell.fill = header_font, header_alignment, HEADER_FILL
+        headers.append(cell)
+    sheet.append(headers)
+
+    status_columns = [index for index, column in enumerate(table.columns) if column.status]
+    for row in table.rows:
+        for index in status_columns:
+            fill = STATUS_FILLS.get(row[index])
+            if fill is not None:
+                cell = WriteOnlyCell(sheet, value=row[index])
+                cell.fill = fill
+                row[index] = cell
+        sheet.append(row)
+
+    workbook.save(fileobj)
+
+
+def iter_csv(table, chunk_size=64 * 1024):
+    """Yield a ResultTable as UTF-8 CSV (with a byte order mark for Excel), in chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([column.header for column in table.columns])
+    for row in table.rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_export(table, export_format, fileobj):
+    """Write a ResultTable in 'xlsx' or 'csv' format into a binary file object."""
+    if export_format == 'csv':
+        for chunk in iter_csv(table):
+            fileobj.write(chunk)
+    else:
+        write_xlsx(table, fileobj)
+
+
+def export_response(table, export_format='xlsx'):
+    """
+    Stream a ResultTable to the client as a download.
+
+    Workbooks are completed in a temporary file before the response starts,
+    so errors still surface to the caller; CSV rows are produced while the
+    response is sent.
+    """
+    if export_format == 'csv':
+        response = Response(iter_csv(table), mimetype=FORMATS['csv'])
+        filename = f"{table.filename}.csv"
+        ascii_name = filename.encode('ascii', 'ignore').decode('ascii') or 'results.csv'
+        response.headers['Content-Disposition'] = f'attachment; filename="{ascii_name}"'
+        if ascii_name != filename:
+            response.headers['Content-Disposition'] += f"; filename*=UTF-8''{quote(filename)}"
+        return response
+
+    fileobj = tempfile.TemporaryFile()
+    try:
+        write_xlsx(table, fileobj)
+        fileobj.seek(0)
+    except Exception:
+        fileobj.close()
+        raise
+    return send_file(fileobj, mimetype=FORMATS['xlsx'], as_attachment=True,
+                     download_name=f"{table.filename}.xlsx")
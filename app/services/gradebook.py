@@ -0,0 +1,277 @@
+"""
+Materialized gradebook: each student's latest result per assignment question.
+
+Reports judge a student's work by the most recent submission for every
+question of an assignment. Instead of scanning Submission rows to find it,
+``gradebook_entries`` keeps one row per (student, assignment, question) with
+the latest result, the points it earns and the number of attempts.
+
+Entries are maintained in the same transaction as the submissions they
+describe: call refresh_entries() (or record_submission()) after adding,
+changing or deleting submissions and before committing. rebuild_gradebook()
+recomputes entries from scratch (the migration that creates the table fills
+it from the existing submissions); run it whenever entries are suspected to be
+out of step:
+
+    flask rebuild-gradebook [--assignment ID]
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.assignment import AssignmentQuestion
+from app.models.gradebook_entry import GradebookEntry
+from app.models.submission import Submission
+
+_SUBMISSION_COLUMNS = (Submission.id, Submission.student_id, Submission.assignment_id,
+                       Submission.question_id, Submission.is_correct, Submission.submitted_at)
+
+
+def _key_filter(model, keys):
+    return or_(*[and_(model.student_id == student_id,
+                      model.assignment_id == assignment_id,
+                      model.question_id == question_id)
+                 for student_id, assignment_id, question_id in keys])
+
+
+def _question_scores(assignment_ids):
+    """(assignment_id, question_id) -> score for the questions of the given assignments."""
+    rows = (db.session.query(AssignmentQuestion.assignment_id, AssignmentQuestion.question_id,
+                             AssignmentQuestion.score)
+            .filter(AssignmentQuestion.assignment_id.in_(list(assignment_ids))))
+    return {(assignment_id, question_id): score for assignment_id, question_id, score in rows}
+
+
+def _summarize(rows, score):
+    """Entry values for the submissions of one (student, assignment, question)."""
+    latest = max(rows, key=lambda row: (row.submitted_at or datetime.min, row.id))
+    return {
+        'submission_id': latest.id,
+        'is_correct': bool(latest.is_correct),
+        'points_earned': score if latest.is_correct else 0,
+        'attempts': len(rows),
+        'correct_attempts': sum(1 for row in rows if row.is_correct),
+        'submitted_at': latest.submitted_at,
+    }
+
+
+def _upsert(key, values):
+    student_id, assignment_id, question_id = key
+    entry = GradebookEntry.query.filter_by(student_id=student_id, assignment_id=assignment_id,
+                                           question_id=question_id).first()
+    if entry is None:
+        entry = GradebookEntry(student_id=student_id, assignment_id=assignment_id,
+                               question_id=question_id, **values)
+        try:
+            with db.session.begin_nested():
+                db.session.add(entry)
+            return
+        except IntegrityError:
+            # A concurrent submission for the same question created the entry first
+            entry = GradebookEntry.query.filter_by(student_id=student_id, assignment_id=assignment_id,
+                                                   question_id=question_id).one()
+    for name, value in values.items():
+        setattr(entry, name, value)
+
+
+def refresh_entries(keys):
+    """
+    Recompute gradebook entries from the current submissions.
+
+    Call after adding, changing or deleting submissions and before
+    committing, so the entries change in the same transaction. An entry
+    whose submissions are all gone is removed.
+
+    Args:
+        keys (iterable): (student_id, assignment_id, question_id) tuples
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    db.session.flush()
+
+    rows_by_key = defaultdict(list)
+    for row in db.session.query(*_SUBMISSION_COLUMNS).filter(_key_filter(Submission, keys)):
+        rows_by_key[(row.student_id, row.assignment_id, row.question_id)].append(row)
+    scores = _question_scores({assignment_id for _, assignment_id, _ in keys})
+
+    now = datetime.utcnow()
+    for key in keys:
+        rows = rows_by_key.get(key)
+        if not rows:
+            GradebookEntry.query.filter(_key_filter(GradebookEntry, [key])).delete(synchronize_session=False)
+            continue
+        values = _summarize(rows, scores.get(key[1:], 0))
+        values['updated_at'] = now
+        _upsert(key, values)
+
+
+def record_submission(submission):
+    """Bring the gradebook entry of a new or changed submission up to date (before committing)."""
+    refresh_entries([(submission.student_id, submission.assignment_id, submission.question_id)])
+
+
+def delete_assignment_entries(assignment_id):
+    """Remove the entries of an assignment whose submissions are being deleted (before committing)."""
+    GradebookEntry.query.filter_by(assignment_id=assignment_id).delete(synchronize_session=False)
+
+
+def refresh_assignment_points(assignment_id):
+    """
+    Re-price the correct entries of an assignment after its question scores
+    changed or questions were removed (before committing).
+    """
+    scores = _question_scores([assignment_id])
+    entries = GradebookEntry.query.filter_by(assignment_id=assignment_id)
+    for (_, question_id), score in scores.items():
+        (entries.filter(GradebookEntry.question_id == question_id, GradebookEntry.is_correct == True)
+         .update({'points_earned': score}, synchronize_session=False))
+    question_ids = [question_id for _, question_id in scores]
+    removed = entries.filter(GradebookEntry.points_earned != 0)
+    if question_ids:
+        removed = removed.filter(~GradebookEntry.question_id.in_(question_ids))
+    removed.update({'points_earned': 0}, synchronize_session=False)
+
+
+def rebuild_gradebook(assignment_ids=None):
+    """
+    Recompute the gradebook from the submissions, one assignment per transaction.
+
+    Args:
+        assignment_ids (list, optional): Only rebuild these assignments
+            (default: every assignment that has entries or submissions)
+
+    Returns:
+        dict: Number of assignments and entries written
+    """
+    if assignment_ids is None:
+        assignment_ids = sorted({assignment_id for (assignment_id,) in
+                                 db.session.query(Submission.assignment_id).distinct()} |
+                                {assignment_id for (assignment_id,) in
+                                 db.session.query(GradebookEntry.assignment_id).distinct()})
+
+    totals = {'assignments': 0, 'entries': 0}
+    for assignment_id in assignment_ids:
+        rows_by_key = defaultdict(list)
+        for row in db.session.query(*_SUBMISSION_COLUMNS).filter(Submission.assignment_id == assignment_id):
+            rows_by_key[(row.student_id, row.assignment_id, row.question_id)].append(row)
+        scores = _question_scores([assignment_id])
+
+        now = datetime.utcnow()
+        entries = []
+        for (student_id, _, question_id), rows in rows_by_key.items():
+            values = _summarize(rows, scores.get((assignment_id, question_id), 0))
+            entries.append(dict(values, student_id=student_id, assignment_id=assignment_id,
+                                question_id=question_id, updated_at=now))
+        try:
+            delete_assignment_entries(assignment_id)
+            db.session.bulk_insert_mappings(GradebookEntry, entries)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logging.exception(f"Could not rebuild the gradebook of assignment {assignment_id}")
+            raise
+        totals['assignments'] += 1
+        totals['entries'] += len(entries)
+    return totals
+
+
+def load_entries(student_ids, assignment_ids):
+    """
+    Read the gradebook of some students on some assignments.
+
+    Returns:
+        dict: (student_id, assignment_id) -> {question_id: GradebookEntry}
+    """
+    results = defaultdict(dict)
+    if not student_ids or not assignment_ids:
+        return results
+    entries = GradebookEntry.query.filter(GradebookEntry.assignment_id.in_(list(assignment_ids)),
+                                          GradebookEntry.student_id.in_(list(student_ids)))
+    for entry in entries:
+        results[(entry.student_id, entry.assignment_id)][entry.question_id] = entry
+    return results
+
+
+def load_results(student_ids, assignment_ids, chunk_size=500):
+    """
+    Like load_entries(), but reads only the result columns, for reports over
+    many students.
+
+    Returns:
+        dict: (student_id, assignment_id) -> {question_id: (is_correct, points_earned)}
+    """
+    results = defaultdict(dict)
+    student_ids, assignment_ids = list(student_ids), list(assignment_ids)
+    if not student_ids or not assignment_ids:
+        return results
+    for start in range(0, len(student_ids), chunk_size):
+        rows = (db.session.query(GradebookEntry.student_id, GradebookEntry.assignment_id, GradebookEntry.question_id,
+                                 GradebookEntry.is_correct, GradebookEntry.points_earned)
+                .filter(GradebookEntry.assignment_id.in_(assignment_ids),
+                        GradebookEntry.student_id.in_(student_ids[start:start + chunk_size])))
+        for student_id, assignment_id, question_id, is_correct, points_earned in rows:
+            results[(student_id, assignment_id)][question_id] = (is_correct, points_earned)
+    return results
+
+
+def load_assignment_points(student_ids, assignment_ids, chunk_size=500):
+    """
+    Sum the points each student earned per assignment, counting only the
+    questions that are still part of the assignment.
+
+    Returns:
+        dict: (student_id, assignment_id) -> points; pairs without any
+            entry are left out
+    """
+    points = {}
+    student_ids, assignment_ids = list(student_ids), list(assignment_ids)
+    if not student_ids or not assignment_ids:
+        return points
+    for start in range(0, len(student_ids), chunk_size):
+        rows = (db.session.query(GradebookEntry.student_id, GradebookEntry.assignment_id,
+                                 func.sum(GradebookEntry.points_earned))
+                .join(AssignmentQuestion, and_(AssignmentQuestion.assignment_id == GradebookEntry.assignment_id,
+                                               AssignmentQuestion.question_id == GradebookEntry.question_id))
+                .filter(GradebookEntry.assignment_id.in_(assignment_ids),
+                        GradebookEntry.student_id.in_(student_ids[start:start + chunk_size]))
+                .group_by(GradebookEntry.student_id, GradebookEntry.assignment_id))
+        for student_id, assignment_id, earned in rows:
+            points[(student_id, assignment_id)] = int(earned or 0)
+    return points
+
+
+def summarize_assignment_students(assignment_id):
+    """
+    Per-student totals on one assignment, aggregated in SQL over the latest
+    result of every question. Points only count for questions that are still
+    part of the assignment.
+
+    Returns:
+        dict: student_id -> {'submissions', 'correct_submissions', 'answered', 'score'}
+            for every student with at least one submission
+    """
+    in_assignment = AssignmentQuestion.id.isnot(None)
+    rows = (db.session.query(GradebookEntry.student_id,
+                             func.sum(GradebookEntry.attempts),
+                             func.sum(GradebookEntry.correct_attempts),
+                             func.sum(case((in_assignment, 1), else_=0)),
+                             func.sum(case((in_assignment, GradebookEntry.points_earned), else_=0)))
+            .outerjoin(AssignmentQuestion, and_(AssignmentQuestion.assignment_id == GradebookEntry.assignment_id,
+                                                AssignmentQuestion.question_id == GradebookEntry.question_id))
+            .filter(GradebookEntry.assignment_id == assignment_id)
+            .group_by(GradebookEntry.student_id))
+    return {
+        student_id: {
+            'submissions': int(submissions or 0),
+            'correct_submissions': int(correct or 0),
+            'answered': int(answered or 0),
+            'score': int(score or 0),
+        }
+        for student_id, submissions, correct, answered, score in rows
+    }
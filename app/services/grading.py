@@ -0,0 +1,529 @@
+"""
+Answer-key snapshots for grading student submissions.
+
+Grading used to run ``question.correct_answer`` against the exercise database
+on every submission. Instead, the expected result is reduced once to a compact
+fingerprint (column names and types, row count, an order-sensitive hash, an
+order-insensitive hash and, for small results, the rows themselves) and stored
+in ``AnswerKeySnapshot``. Submissions are fingerprinted the same way and
+compared against the stored snapshot.
+
+A snapshot records a hash of every input that can change the expected result
+(the correct answer, the SQLite schema, the MySQL database or the deployed
+imported schema). When any of them changes the snapshot is recomputed on next
+use, and ``use_schema`` refreshes snapshots explicitly after a redeploy.
+
+Results are streamed from the cursor in batches and folded into the rolling
+hashes, so neither side is ever held in memory as a whole. Rows are only kept
+(up to a bound) so the feedback can name missing and unexpected rows.
+
+    ANSWER_KEY_MAX_STORED_ROWS   rows kept alongside the hashes (default 200)
+    ANSWER_KEY_MYSQL_TTL         seconds before snapshots for external MySQL
+                                 databases are recomputed (default 3600)
+    GRADING_FETCH_SIZE           rows fetched per round trip (default 1000)
+    GRADING_FLOAT_PLACES         decimal places floats are rounded to before
+                                 comparison; empty for exact (default 6)
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pymysql
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.answer_key import AnswerKeySnapshot
+
+_HASH_MODULUS = 2 ** 256
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def float_places_from_env():
+    """Return the configured float rounding, or None for exact comparison."""
+    value = os.getenv('GRADING_FLOAT_PLACES', '6')
+    if value is None or value.strip() == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return 6
+
+
+def _canonical_fraction(value, float_places):
+    if float_places is not None and math.isfinite(value):
+        value = round(value, float_places)
+        if value == 0:
+            value = 0.0  # -0.0 and 0.0 must hash the same
+        if value.is_integer():
+            return f'n:{int(value)}'
+    return f'n:{value!r}'
+
+
+def canonical_value(value, float_places=None):
+    """
+    Encode a single result value as a type-tagged string for hashing.
+
+    Numbers are encoded by value, so 1, 1.0 and Decimal('1.00') hash the
+    same. Fractional numbers are rounded to ``float_places`` decimal places
+    first when given. Values that are not JSON types (dates, times, ...) are
+    compared through their string form, matching how results are serialised
+    for display.
+    """
+    if value is None:
+        return 'N'
+    if isinstance(value, bool):
+        return f'n:{int(value)}'
+    if isinstance(value, int):
+        return f'n:{value}'
+    if isinstance(value, float):
+        if math.isfinite(value) and value.is_integer():
+            return f'n:{int(value)}'
+        return _canonical_fraction(value, float_places)
+    if isinstance(value, Decimal):
+        if value.is_finite() and value == value.to_integral_value():
+            return f'n:{int(value)}'
+        return _canonical_fraction(float(value), float_places)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'b:{bytes(value).hex()}'
+    return f's:{value}'
+
+
+def serializable_value(value):
+    """Convert a value to something json.dumps can store."""
+    if isinstance(value, (dict, list, str, int, float, bool, type(None))):
+        return value
+    return str(value)
+
+
+def canonical_row(values, float_places=None):
+    """
+    Encode one result row as a single string.
+
+    Equivalent to joining canonical_value() over the row; the common column
+    types are handled inline because this runs once per value graded.
+    """
+    parts = []
+    append = parts.append
+    for value in values:
+        value_type = type(value)
+        if value_type is str:
+            append('s:' + value)
+        elif value_type is int:
+            append('n:%d' % value)
+        elif value is None:
+            append('N')
+        elif value_type is float and float_places is not None and math.isfinite(value):
+            value = round(value, float_places) + 0.0  # + 0.0 folds -0.0 into 0.0
+            append('n:%d' % value if value.is_integer() else 'n:' + repr(value))
+        else:
+            append(canonical_value(value, float_places))
+    return '\x1f'.join(parts)
+
+
+def row_digest(values, float_places=None):
+    """Return the SHA-256 digest of one result row."""
+    return hashlib.sha256(canonical_row(values, float_places).encode('utf-8', 'surrogatepass')).digest()
+
+
+def open_streaming_cursor(conn):
+    """
+    Open a cursor that does not buffer the whole result on the client.
+
+    pymysql buffers every row by default; SSCursor reads them from the socket
+    as they are fetched. sqlite3 cursors already step through the result.
+    """
+    if isinstance(conn, sqlite3.Connection):
+        return conn.cursor()
+    return conn.cursor(pymysql.cursors.SSCursor)
+
+
+class ResultFingerprint:
+    """Compact description of a query result used for comparisons."""
+
+    def __init__(self, columns, column_types, row_count, ordered_hash, unordered_hash, rows=None):
+        self.columns = list(columns)
+        self.column_types = list(column_types)
+        self.row_count = row_count
+        self.ordered_hash = ordered_hash
+        self.unordered_hash = unordered_hash
+        self.rows = rows
+
+    @classmethod
+    def from_cursor(cls, cursor, keep_rows=None, float_places=None, fetch_size=None):
+        """
+        Fingerprint the result set of an executed cursor.
+
+        Rows are fetched ``fetch_size`` at a time and folded into the hashes,
+        so memory use does not grow with the size of the result.
+
+        Args:
+            cursor: A DB-API cursor that has just executed a query
+            keep_rows (int, optional): Keep the rows when the result has at
+                most this many; defaults to ANSWER_KEY_MAX_STORED_ROWS
+            float_places (int, optional): Round fractional numbers to this
+                many decimal places before hashing
+            fetch_size (int, optional): Rows per fetchmany() call; defaults
+                to GRADING_FETCH_SIZE
+
+        pymysql DictCursor rows are dicts; sqlite3 and plain cursors give
+        tuples. Both are accepted.
+
+        Returns:
+            ResultFingerprint: The fingerprint of the result set
+        """
+        if keep_rows is None:
+            keep_rows = _env_int('ANSWER_KEY_MAX_STORED_ROWS', 200)
+        if fetch_size is None:
+            fetch_size = max(_env_int('GRADING_FETCH_SIZE', 1000), 1)
+
+        description = cursor.description or []
+        columns = [col[0] for col in description]
+        column_types = [col[1] for col in description]
+
+        ordered = hashlib.sha256()
+        unordered = 0
+        row_count = 0
+        rows = []
+        while description:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            for row in batch:
+                values = row.values() if isinstance(row, dict) else row
+                digest = hashlib.sha256(
+                    canonical_row(values, float_places).encode('utf-8', 'surrogatepass')).digest()
+                ordered.update(digest)
+                unordered += int.from_bytes(digest, 'big')
+                row_count += 1
+                if rows is not None:
+                    if row_count > keep_rows:
+                        rows = None
+                    else:
+                        rows.append([serializable_value(v) for v in values])
+            unordered %= _HASH_MODULUS
+
+        return cls(columns, column_types, row_count, ordered.hexdigest(),
+                   f'{unordered % _HASH_MODULUS:064x}', rows)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.get_column_names(), snapshot.get_column_types(), snapshot.row_count,
+                   snapshot.ordered_hash, snapshot.unordered_hash, snapshot.get_rows())
+
+    def apply_to_snapshot(self, snapshot):
+        """Copy this fingerprint onto an AnswerKeySnapshot row."""
+        snapshot.column_names = json.dumps(self.columns)
+        snapshot.column_types = json.dumps(self.column_types)
+        snapshot.row_count = self.row_count
+        snapshot.ordered_hash = self.ordered_hash
+        snapshot.unordered_hash = self.unordered_hash
+        snapshot.rows_json = json.dumps(self.rows) if self.rows is not None else None
+        snapshot.created_at = datetime.utcnow()
+        return snapshot
+
+    def matches(self, other, ordered=True):
+        """
+        Check whether another result is identical to this one.
+
+        Args:
+            other (ResultFingerprint): The result to compare against
+            ordered (bool): Whether row order has to match as well
+
+        Returns:
+            bool: True if columns and rows are the same
+        """
+        return ResultComparator(ordered=ordered).matches(self, other)
+
+
+def _format_row(row, limit=80):
+    text = '(' + ', '.join('NULL' if v is None else str(v) for v in row) + ')'
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+class ResultComparator:
+    """
+    Compares a student's result fingerprint with the answer key.
+
+    Args:
+        ordered (bool): Whether rows have to come back in the same order
+        match_column_names (bool): Whether column names (and their order) have
+            to match; when False only the number of columns is checked
+        float_places (int, optional): Decimal places used for float tolerance;
+            must match the value the fingerprints were computed with
+        max_listed_rows (int): Missing/unexpected rows quoted in the feedback
+    """
+
+    def __init__(self, ordered=True, match_column_names=True, float_places=None, max_listed_rows=3):
+        self.ordered = ordered
+        self.match_column_names = match_column_names
+        self.float_places = float_places
+        self.max_listed_rows = max_listed_rows
+
+    def _columns_match(self, expected, actual):
+        if self.match_column_names:
+            return [c.lower() for c in expected.columns] == [c.lower() for c in actual.columns]
+        return len(expected.columns) == len(actual.columns)
+
+    def matches(self, expected, actual):
+        """Return True if the actual result is accepted for the expected one."""
+        if not self._columns_match(expected, actual) or expected.row_count != actual.row_count:
+            return False
+        if self.ordered:
+            return expected.ordered_hash == actual.ordered_hash
+        return expected.unordered_hash == actual.unordered_hash
+
+    def compare(self, expected, actual):
+        """
+        Grade a result and build the feedback shown to the student.
+
+        Args:
+            expected (ResultFingerprint): The answer key
+            actual (ResultFingerprint): The student's result
+
+        Returns:
+            tuple: (is_correct, feedback)
+        """
+        is_correct = self.matches(expected, actual)
+        return is_correct, self.feedback(expected, actual, is_correct)
+
+    def feedback(self, expected, actual, is_correct):
+        """Build the feedback message for a graded result."""
+        if is_correct:
+            return "Correct! Your query produces the expected result."
+
+        feedback = "Incorrect. Your query does not produce the expected result."
+        if len(actual.columns) != len(expected.columns) or actual.row_count != expected.row_count:
+            feedback += (f" Expected result has {expected.row_count} rows and {len(expected.columns)} columns, "
+                         f"but your query returned {actual.row_count} rows and {len(actual.columns)} columns.")
+        elif self.match_column_names and not self._columns_match(expected, actual):
+            expected_names = {c.lower() for c in expected.columns}
+            actual_names = {c.lower() for c in actual.columns}
+            missing = [c for c in expected.columns if c.lower() not in actual_names]
+            extra = [c for c in actual.columns if c.lower() not in expected_names]
+            if missing:
+                feedback += f" Missing columns: {', '.join(missing)}."
+            if extra:
+                feedback += f" Extra columns: {', '.join(extra)}."
+            if not missing and not extra:
+                feedback += " The columns are in a different order than expected."
+            return feedback
+        elif self.ordered and expected.unordered_hash == actual.unordered_hash:
+            return feedback + " Your query returns the right rows, but not in the expected order."
+
+        if len(actual.columns) == len(expected.columns):
+            feedback += self._row_differences(expected, actual)
+        return feedback
+
+    def _row_differences(self, expected, actual):
+        """Describe missing and unexpected rows when both results were kept."""
+        if expected.rows is None or actual.rows is None:
+            return ""
+
+        expected_rows = Counter(canonical_row(row, self.float_places) for row in expected.rows)
+        actual_rows = Counter(canonical_row(row, self.float_places) for row in actual.rows)
+        missing_keys = expected_rows - actual_rows
+        extra_keys = actual_rows - expected_rows
+
+        def sample(rows, keys):
+            listed = []
+            for row in rows:
+                if len(listed) >= self.max_listed_rows:
+                    break
+                key = canonical_row(row, self.float_places)
+                if keys[key] > 0:
+                    keys[key] -= 1
+                    listed.append(_format_row(row))
+            return listed
+
+        text = ""
+        missing_count = sum(missing_keys.values())
+        extra_count = sum(extra_keys.values())
+        if missing_count:
+            listed = sample(expected.rows, Counter(missing_keys))
+            text += f" Missing {missing_count} expected row{'s' if missing_count != 1 else ''}, e.g. {'; '.join(listed)}."
+        if extra_count:
+            listed = sample(actual.rows, Counter(extra_keys))
+            text += f" Found {extra_count} unexpected row{'s' if extra_count != 1 else ''}, e.g. {'; '.join(listed)}."
+        return text
+
+
+def comparator_for(question):
+    """
+    Build the comparator used to grade a question.
+
+    MySQL-backed questions are order-sensitive while SQLite exercises accept
+    any row order, as they always have.
+    """
+    return ResultComparator(ordered=question.db_type != 'sqlite', float_places=float_places_from_env())
+
+
+def result_feedback(expected, actual, is_correct):
+    """
+    Build the feedback message shown to the student after grading.
+
+    Args:
+        expected (ResultFingerprint): The answer key
+        actual (ResultFingerprint): The student's result
+        is_correct (bool): The grading outcome
+
+    Returns:
+        str: The feedback text
+    """
+    return ResultComparator().feedback(expected, actual, is_correct)
+
+
+def question_source_hash(question):
+    """
+    Hash every question input that determines the expected result.
+
+    Args:
+        question (Question): The question being graded
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    active_schema_name = None
+    if question.db_type == 'imported_schema' and question.schema_import:
+        active_schema_name = question.schema_import.active_schema_name
+
+    parts = [
+        question.db_type or '',
+        question.correct_answer or '',
+        (question.sample_db_schema or '') if question.db_type == 'sqlite' else '',
+        (question.mysql_db_name or '') if question.db_type == 'mysql' else '',
+        str(question.schema_import_id or '') if question.db_type == 'imported_schema' else '',
+        active_schema_name or '',
+        f'float_places={float_places_from_env()}',  # hashes depend on the rounding
+    ]
+    return hashlib.sha256('\x1e'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _is_fresh(snapshot, question, source_hash):
+    if snapshot is None or snapshot.source_hash != source_hash:
+        return False
+    if question.db_type == 'mysql':
+        # External databases can change without the app knowing about it
+        ttl = _env_int('ANSWER_KEY_MYSQL_TTL', 3600)
+        if not snapshot.created_at or datetime.utcnow() - snapshot.created_at > timedelta(seconds=ttl):
+            return False
+    return True
+
+
+def _store_snapshot(question, fingerprint, source_hash):
+    """Persist a freshly computed answer key, tolerating concurrent writers."""
+    try:
+        snapshot = AnswerKeySnapshot.query.filter_by(question_id=question.id).first()
+        if snapshot is None:
+            snapshot = AnswerKeySnapshot(question_id=question.id)
+            db.session.add(snapshot)
+        snapshot.source_hash = source_hash
+        fingerprint.apply_to_snapshot(snapshot)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same snapshot first
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not store answer key snapshot for question {question.id}: {e}")
+
+
+def teacher_query_for(question):
+    """Return the correct_answer query, rewritten for imported schema prefixes."""
+    teacher_query = question.correct_answer
+    if question.db_type == 'imported_schema':
+        table_prefix = question.get_table_prefix()
+        if table_prefix:
+            from app.services.query_rewrite import rewrite_for_schema_import
+            teacher_query = rewrite_for_schema_import(teacher_query, question.schema_import, table_prefix)
+    return teacher_query
+
+
+def get_answer_key(question, conn, teacher_query=None):
+    """
+    Get the answer key for a question, computing it on the given connection
+    if there is no up-to-date snapshot.
+
+    Args:
+        question (Question): The question being graded
+        conn: An open connection to the question's exercise database
+        teacher_query (str, optional): The correct answer, already rewritten
+            for imported schema prefixes
+
+    Returns:
+        ResultFingerprint: The expected result
+    """
+    source_hash = question_source_hash(question)
+    snapshot = question.answer_key_snapshot if question.id else None
+    if _is_fresh(snapshot, question, source_hash):
+        return ResultFingerprint.from_snapshot(snapshot)
+
+    logging.debug(f"Computing answer key snapshot for question {question.id}")
+    with closing(open_streaming_cursor(conn)) as cursor:
+        cursor.execute(teacher_query or teacher_query_for(question))
+        fingerprint = ResultFingerprint.from_cursor(cursor, float_places=float_places_from_env())
+
+    if question.id:
+        _store_snapshot(question, fingerprint, source_hash)
+    return fingerprint
+
+
+def refresh_answer_key(question):
+    """
+    Recompute and store the answer key for a question.
+
+    Called when a question is saved and when its imported schema is
+    redeployed. Failures are logged and leave grading to compute the
+    snapshot lazily.
+
+    Args:
+        question (Question): A saved question
+
+    Returns:
+        bool: True if the snapshot was refreshed
+    """
+    if not question or not question.id or not question.correct_answer:
+        return False
+
+    try:
+        if question.db_type == 'sqlite':
+            from app.services.sqlite_sandbox import get_sqlite_connection
+            conn = closing(get_sqlite_connection(question.sample_db_schema))
+        else:
+            from app.services.sandbox import get_question_connection
+            conn = get_question_connection(question)
+
+        with conn as connection:
+            with closing(open_streaming_cursor(connection)) as cursor:
+                cursor.execute(teacher_query_for(question))
+                fingerprint = ResultFingerprint.from_cursor(cursor, float_places=float_places_from_env())
+
+        _store_snapshot(question, fingerprint, question_source_hash(question))
+        return True
+    except Exception as e:
+        logging.warning(f"Could not refresh answer key for question {question.id}: {e}")
+        return False
+
+
+def refresh_answer_keys_for_schema(schema_import_id):
+    """Recompute answer keys for every question built on an imported schema."""
+    from app.models.question import Question
+
+    refreshed = 0
+    for question in Question.query.filter_by(schema_import_id=schema_import_id).all():
+        if refresh_answer_key(question):
+            refreshed += 1
+    return refreshed
@@ -0,0 +1,138 @@
+"""
+Invitation-token lookups for the join and register-with-token links.
+
+At the start of term a whole class follows the same invitation link within
+minutes, and mistyped or revoked links are retried. Tokens are looked up
+through the unique index on ``sections.invitation_token`` and the result,
+found or not, is remembered per process in a small LRU keyed by a digest
+of the token. A remembered section is re-read by primary key and its
+current token compared in constant time, so a token revoked or replaced in
+another worker is never honoured. Entries for unknown tokens expire sooner:
+
+    INVITATION_CACHE_SIZE           tokens remembered per process (default 1000)
+    INVITATION_CACHE_TTL            seconds to remember a valid token (default 300)
+    INVITATION_CACHE_NEGATIVE_TTL   seconds to remember an unknown token (default 30)
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from app.models.section import Section
+
+# secrets.token_urlsafe() output, within the column size
+_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token digest -> section id (None for unknown tokens),
+    with separate lifetimes for found and unknown tokens.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300, negative_ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # digest -> (section_id, stored_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+
+    def get(self, digest):
+        """
+        Returns:
+            tuple: (found, section_id); found is False on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                section_id, stored_at = entry
+                ttl = self.ttl if section_id is not None else self.negative_ttl
+                if time.monotonic() - stored_at < ttl:
+                    self._entries.move_to_end(digest)
+                    self._stats['hits' if section_id is not None else 'negative_hits'] += 1
+                    return True, section_id
+                del self._entries[digest]
+            self._stats['misses'] += 1
+            return False, None
+
+    def put(self, digest, section_id):
+        with self._lock:
+            self._entries[digest] = (section_id, time.monotonic())
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries,
+                        ttl=self.ttl, negative_ttl=self.negative_ttl)
+
+
+_cache = TokenCache(
+    max_entries=_env_int('INVITATION_CACHE_SIZE', 1000),
+    ttl=_env_int('INVITATION_CACHE_TTL', 300),
+    negative_ttl=_env_int('INVITATION_CACHE_NEGATIVE_TTL', 30)
+)
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def _matches(section, token):
+    return (section is not None and section.invitation_token is not None
+            and hmac.compare_digest(section.invitation_token.encode('utf-8'), token.encode('utf-8')))
+
+
+def find_section_by_token(token):
+    """
+    Find the section an invitation token belongs to.
+
+    Returns:
+        Section: The section, or None if the token is malformed, unknown or revoked
+    """
+    if not token or not _TOKEN_PATTERN.match(token):
+        return None
+    digest = _digest(token)
+
+    found, section_id = _cache.get(digest)
+    if found:
+        if section_id is None:
+            return None
+        section = Section.query.get(section_id)
+        if _matches(section, token):
+            return section
+        # Revoked or replaced since it was cached (possibly by another worker)
+        _cache.discard(digest)
+
+    section = Section.query.filter_by(invitation_token=token).first()
+    if not _matches(section, token):
+        section = None
+    _cache.put(digest, section.id if section is not None else None)
+    return section
+
+
+def forget_token(token):
+    """Drop a token from this process's cache, e.g. after it was revoked or replaced."""
+    if token:
+        _cache.discard(_digest(token))
+
+
+def get_invitation_cache_stats():
+    return _cache.stats()
@@ -0,0 +1,210 @@
+"""
+Background jobs for long-running teacher operations.
+
+Deploying or dropping an imported schema can take minutes for large dumps.
+Running that inside the request would tie up a gunicorn worker that should
+be serving student queries, so such work is recorded as a ``BackgroundJob``
+row and executed on a small thread pool. The request returns the job id at
+once, and the page polls the job for its phase and counters.
+
+Progress is written to the database (throttled), so any worker process can
+answer a status poll. A running job whose process died stops updating; once
+it has been silent for JOB_STALE_SECONDS it is reported as failed. Queued
+jobs are not expired, and a worker only starts a job whose row is still
+queued, so the same job never runs twice.
+
+    JOB_WORKERS          concurrent jobs per process (default 2)
+    JOB_STALE_SECONDS    seconds without progress before a running job is
+                         considered lost (default 900)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models.background_job import BackgroundJob
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Threads do not survive a fork (e.g. gunicorn preload), so start a new pool per process
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(_env_int('JOB_WORKERS', 2), 1),
+                                           thread_name_prefix='background-job')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+class JobReporter:
+    """
+    Progress handle passed to a running job.
+
+    Updates are kept in memory and flushed to the job row at most every
+    ``interval`` seconds, and always when the phase changes.
+    """
+
+    def __init__(self, job_id, interval=1.0):
+        self.job_id = job_id
+        self.interval = interval
+        self.phase = None
+        self.progress = {}
+        self._last_flush = 0.0
+
+    def update(self, phase=None, **counters):
+        """Record the current phase and/or counter values."""
+        phase_changed = phase is not None and phase != self.phase
+        if phase is not None:
+            self.phase = phase
+        self.progress.update(counters)
+        if phase_changed or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        try:
+            job = BackgroundJob.query.get(self.job_id)
+            job.phase = self.phase
+            job.progress = json.dumps(self.progress)
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Could not record progress for job {self.job_id}: {e}")
+        self._last_flush = time.monotonic()
+
+
+def _finish(job_id, status, result=None, error=None, reporter=None):
+    job = BackgroundJob.query.get(job_id)
+    job.status = status
+    job.result = json.dumps(result) if result is not None else None
+    job.error = error
+    if reporter is not None:
+        job.phase = reporter.phase
+        job.progress = json.dumps(reporter.progress)
+    job.finished_at = job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _run(app, job_id, func, kwargs):
+    with app.app_context():
+        reporter = JobReporter(job_id)
+        try:
+            # Claim the job, unless its row left the queued state while it waited for a worker
+            now = datetime.utcnow()
+            claimed = (BackgroundJob.query
+                       .filter_by(id=job_id, status='queued')
+                       .update({'status': 'running', 'started_at': now, 'updated_at': now},
+                               synchronize_session=False))
+            db.session.commit()
+            if not claimed:
+                logging.info(f"Background job {job_id} is no longer queued; not running it")
+                return
+
+            result = func(reporter, **kwargs)
+            _finish(job_id, 'succeeded', result=result, reporter=reporter)
+        except Exception as e:
+            logging.error(f"Background job {job_id} failed: {str(e)}")
+            db.session.rollback()
+            try:
+                _finish(job_id, 'failed', error=str(e), reporter=reporter)
+            except Exception as finish_error:
+                db.session.rollback()
+                logging.error(f"Could not record failure of job {job_id}: {finish_error}")
+        finally:
+            db.session.remove()
+
+
+def submit_job(job_type, func, created_by, target_id=None, **kwargs):
+    """
+    Record a job and start it on the background pool.
+
+    Args:
+        job_type (str): Kind of job, e.g. 'schema_deploy'
+        func (callable): Called as ``func(reporter, **kwargs)`` inside an app
+            context; its return value (JSON-serialisable) becomes the result
+        created_by (int): The user who started the job
+        target_id (int, optional): The object the job works on
+        **kwargs: Arguments for func; must not be ORM objects bound to the
+            request's session
+
+    Returns:
+        BackgroundJob: The queued job
+    """
+    job = BackgroundJob(job_type=job_type, status='queued', created_by=created_by, target_id=target_id)
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor().submit(_run, app, job.id, func, kwargs)
+    logging.debug(f"Queued background job {job.id} ({job_type})")
+    return job
+
+
+def find_active_job(job_type, target_id):
+    """Return the queued or running job of this type for a target, if any."""
+    job = (BackgroundJob.query
+           .filter(BackgroundJob.job_type == job_type,
+                   BackgroundJob.target_id == target_id,
+                   BackgroundJob.status.in_(BackgroundJob.ACTIVE_STATUSES))
+           .order_by(BackgroundJob.id.desc())
+           .first())
+    if job is not None and expire_if_stale(job):
+        return None
+    return job
+
+
+def expire_if_stale(job):
+    """
+    Mark a running job as failed if its worker stopped reporting.
+
+    Queued jobs are never expired: waiting for a free worker says nothing
+    about the process, and the job may still start later.
+
+    Returns:
+        bool: True if the job was expired
+    """
+    if job.status != 'running':
+        return False
+    stale_before = datetime.utcnow() - timedelta(seconds=_env_int('JOB_STALE_SECONDS', 900))
+    if job.updated_at is None or job.updated_at >= stale_before:
+        return False
+    # Only if it is still silent: the worker may have reported since the row was read
+    expired = (BackgroundJob.query
+               .filter(BackgroundJob.id == job.id,
+                       BackgroundJob.status == 'running',
+                       BackgroundJob.updated_at < stale_before)
+               .update({'status': 'failed',
+                        'error': 'The job stopped responding (the server may have restarted). Please try again.',
+                        'finished_at': datetime.utcnow()},
+                       synchronize_session=False))
+    db.session.commit()
+    db.session.refresh(job)
+    return bool(expired)
+
+
+def get_active_jobs(user_id, job_types=None):
+    """Return the user's queued and running jobs (optionally of some types only), oldest first."""
+    query = BackgroundJob.query.filter(BackgroundJob.created_by == user_id,
+                                       BackgroundJob.status.in_(BackgroundJob.ACTIVE_STATUSES))
+    if job_types is not None:
+        query = query.filter(BackgroundJob.job_type.in_(list(job_types)))
+    return [job for job in query.order_by(BackgroundJob.id).all() if not expire_if_stale(job)]
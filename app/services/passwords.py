@@ -0,0 +1,214 @@
+"""
+Password hashing on a bounded pool.
+
+At the start of a timed lab a whole class logs in within a minute, and each
+login runs a full PBKDF2 verification. The hash releases the GIL, so on
+threaded workers every login request hashes in parallel and the CPU is
+shared with the requests that run student queries. Hashes are therefore
+computed on a small per-process pool: logins beyond its size wait their
+turn instead of competing with everything else, and give up after
+PASSWORD_HASH_TIMEOUT seconds so the page can ask the student to retry.
+
+The hash parameters can be raised over time without a migration: after a
+successful login, a hash stored with other parameters than
+PASSWORD_HASH_METHOD is replaced (see needs_rehash()).
+
+    PASSWORD_HASH_WORKERS   concurrent hash computations per process (default 2)
+    PASSWORD_HASH_TIMEOUT   seconds a login waits for the pool (default 10)
+    PASSWORD_HASH_METHOD    werkzeug method for new hashes
+                            (default pbkdf2:sha256:260000); a method whose
+                            hashes would not fit users.password_hash is
+                            ignored with a warning
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+# Size of users.password_hash; the model column is declared with it
+HASH_COLUMN_LENGTH = 128
+
+DEFAULT_HASH_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+# werkzeug's default salt length
+_SALT_LENGTH = 16
+
+_rejected_methods = set()
+
+
+class PasswordHashBusy(RuntimeError):
+    """The hashing pool could not take the request in time."""
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _normalize_method(method):
+    """Spell out the iterations werkzeug would use, e.g. pbkdf2:sha256 -> pbkdf2:sha256:260000."""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        if len(parts) == 1:
+            parts.append('sha256')
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+
+def _hash_length(method):
+    """Length of the hashes werkzeug makes with a method: method$salt$hex digest."""
+    parts = method.split(':')
+    digest_name = parts[1] if parts[0] == 'pbkdf2' else parts[0]
+    return len(method) + 1 + _SALT_LENGTH + 1 + hashlib.new(digest_name).digest_size * 2
+
+
+def usable_hash_method(method, default=DEFAULT_HASH_METHOD):
+    """
+    Normalize a configured hash method, falling back to ``default`` (with a
+    warning, once per method) if it is unknown or its hashes would not fit
+    in users.password_hash.
+    """
+    method = _normalize_method(method)
+    try:
+        length = _hash_length(method)
+        problem = (f'its hashes are {length} characters long, more than the {HASH_COLUMN_LENGTH} the column holds'
+                   if length > HASH_COLUMN_LENGTH else None)
+    except (ValueError, TypeError, IndexError):
+        problem = 'it is not a known hash method'
+    if problem is None:
+        return method
+    if method not in _rejected_methods:
+        _rejected_methods.add(method)
+        logging.warning(f"Ignoring password hash method {method}: {problem}; using {default}")
+    return default
+
+
+def hash_method():
+    """The method new hashes are generated with."""
+    return usable_hash_method(os.getenv('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD))
+
+
+class HashingPool:
+    """
+    Thread pool that computes password hashes, at most ``workers`` at a
+    time. Callers wait for their result for up to ``timeout`` seconds.
+    """
+
+    def __init__(self, workers=2, timeout=10):
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._stats = {'hashes': 0, 'timeouts': 0, 'max_wait_ms': 0.0}
+
+    def run(self, func, *args):
+        """Run a hash function on the pool and return its result."""
+        queued_at = time.monotonic()
+
+        def timed():
+            waited = (time.monotonic() - queued_at) * 1000
+            with self._lock:
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], round(waited, 1))
+            return func(*args)
+
+        with self._lock:
+            self._waiting += 1
+        try:
+            future = self._executor.submit(timed)
+            try:
+                result = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # Drop it if it has not started; a running hash is left to finish
+                future.cancel()
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PasswordHashBusy(f'No password hashing worker became free within {self.timeout}s')
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._stats['hashes'] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=self._waiting, workers=self.workers, timeout=self.timeout)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Threads do not survive a fork (e.g. gunicorn preload), so start a new pool per process
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = HashingPool(workers=_env_int('PASSWORD_HASH_WORKERS', 2),
+                                timeout=_env_int('PASSWORD_HASH_TIMEOUT', 10))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def hash_password(password):
+    """
+    Hash a password with the configured method.
+
+    Raises:
+        PasswordHashBusy: If the pool stayed busy for PASSWORD_HASH_TIMEOUT seconds
+    """
+    return _get_pool().run(generate_password_hash, password, hash_method())
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against a stored hash.
+
+    Raises:
+        PasswordHashBusy: If the pool stayed busy for PASSWORD_HASH_TIMEOUT seconds
+    """
+    if not password_hash or password is None:
+        return False
+    return _get_pool().run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    if not password_hash or '$' not in password_hash:
+        return False
+    method = password_hash.split('$', 1)[0]
+    return _normalize_method(method) != hash_method()
+
+
+def upgrade_hash(user, password):
+    """
+    Re-hash a user's password with the current parameters, after it was
+    verified. The caller commits. Failures are logged and leave the old hash.
+
+    Returns:
+        bool: Whether the hash was replaced
+    """
+    if not needs_rehash(user.password_hash):
+        return False
+    try:
+        user.set_password(password)
+    except PasswordHashBusy as e:
+        logging.warning(f"Password hash of user {user.id} not upgraded: {e}")
+        return False
+    logging.info(f"Upgraded password hash of user {user.id} to {hash_method()}")
+    return True
+
+
+def get_password_pool_stats():
+    return _get_pool().stats()
@@ -0,0 +1,193 @@
+"""
+Per-student assignment progress for the student dashboard.
+
+The dashboard and its ``/api/active-assignments`` poll show, for every active
+assignment of the student's section, how many questions it has and how many
+the student has answered (and answered correctly, judged by the latest
+submission per question). This module computes those counts for the whole
+section in one grouped query over the gradebook and caches the result per (student, section).
+
+Entries are dropped when the student submits, when a section's assignments
+are toggled or reassigned, and when an assignment's questions change. The
+cache is per process; callers that know the current version stamps (see
+app.services.version_stamps) pass them, so changes made in another worker
+are picked up at once. Otherwise an entry is trusted until it expires:
+
+    STUDENT_PROGRESS_CACHE_TTL    seconds to keep an entry (default 30)
+    STUDENT_PROGRESS_CACHE_SIZE   maximum cached (student, section) pairs (default 5000)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import and_, case, func
+
+from app import db
+from app.models.assignment import AssignmentQuestion
+from app.models.gradebook_entry import GradebookEntry
+from app.models.section_assignment import SectionAssignment
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class StudentProgressCache:
+    """
+    Thread-safe LRU of progress stats keyed by (student_id, section_id), with
+    entries expiring after ``ttl`` seconds. An entry stored with a version
+    only matches lookups for that same version.
+    """
+
+    def __init__(self, max_entries=5000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (student_id, section_id) -> (stats, stored_at, version)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, student_id, section_id, version=None):
+        key = (student_id, section_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and time.monotonic() - entry[1] < self.ttl
+                    and (version is None or entry[2] == version)):
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, student_id, section_id, stats, version=None):
+        with self._lock:
+            self._entries[(student_id, section_id)] = (stats, time.monotonic(), version)
+            self._entries.move_to_end((student_id, section_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, student_id=None, section_id=None):
+        """Drop the entries matching every given key part (all entries if none is given)."""
+        with self._lock:
+            if student_id is None and section_id is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries
+                        if (student_id is None or key[0] == student_id)
+                        and (section_id is None or key[1] == section_id)]
+                for key in keys:
+                    del self._entries[key]
+                dropped = len(keys)
+            self._stats['invalidations'] += dropped
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
+
+
+_cache = StudentProgressCache(
+    max_entries=_env_int('STUDENT_PROGRESS_CACHE_SIZE', 5000),
+    ttl=_env_int('STUDENT_PROGRESS_CACHE_TTL', 30)
+)
+
+
+def compute_section_progress(student_id, section_id):
+    """
+    Count questions, answered questions and correct answers for every active
+    assignment of a section in a single query.
+
+    Only questions that are still part of an assignment count, and each
+    question is judged by the student's most recent submission for it.
+
+    Args:
+        student_id (int): The student
+        section_id (int): The section whose active assignments are counted
+
+    Returns:
+        dict: assignment_id -> {'question_count', 'submitted_count', 'correct_count'};
+            assignments without questions are left out
+    """
+    active_assignments = (db.session.query(SectionAssignment.assignment_id)
+                          .filter(SectionAssignment.section_id == section_id,
+                                  SectionAssignment.is_active == True))
+
+    # The gradebook holds the latest result per question (see app.services.gradebook)
+    rows = (db.session.query(AssignmentQuestion.assignment_id,
+                             func.count(AssignmentQuestion.id),
+                             func.count(func.distinct(GradebookEntry.id)),
+                             func.count(func.distinct(case((GradebookEntry.is_correct == True, GradebookEntry.id)))))
+            .outerjoin(GradebookEntry, and_(GradebookEntry.student_id == student_id,
+                                            GradebookEntry.assignment_id == AssignmentQuestion.assignment_id,
+                                            GradebookEntry.question_id == AssignmentQuestion.question_id))
+            .filter(AssignmentQuestion.assignment_id.in_(active_assignments))
+            .group_by(AssignmentQuestion.assignment_id)
+            .all())
+
+    return {
+        assignment_id: {
+            'question_count': question_count,
+            'submitted_count': submitted_count,
+            'correct_count': correct_count,
+        }
+        for assignment_id, question_count, submitted_count, correct_count in rows
+    }
+
+
+def get_section_progress(student_id, section_id, version=None):
+    """
+    Cached version of compute_section_progress.
+
+    The returned dict is shared with the cache and must not be modified.
+
+    Args:
+        student_id (int): The student
+        section_id (int): The section
+        version (tuple, optional): Current (section, student) version stamps;
+            a cached entry computed at other versions is not used
+    """
+    stats = _cache.get(student_id, section_id, version)
+    if stats is None:
+        stats = compute_section_progress(student_id, section_id)
+        _cache.put(student_id, section_id, stats, version)
+    return stats
+
+
+def invalidate_student_progress(student_id=None, section_id=None):
+    """
+    Forget cached progress for a student, a section, or both.
+
+    Call after the change has been committed. With no arguments every entry
+    is dropped.
+    """
+    _cache.invalidate(student_id=student_id, section_id=section_id)
+
+
+def get_assignment_section_ids(assignment_id):
+    """Return the ids of the sections an assignment is assigned to."""
+    return [section_id for (section_id,) in
+            db.session.query(SectionAssignment.section_id).filter_by(assignment_id=assignment_id)]
+
+
+def invalidate_assignment_progress(assignment_id, section_ids=None):
+    """
+    Forget cached progress in every section an assignment is assigned to.
+
+    Args:
+        assignment_id (int): The assignment whose questions changed
+        section_ids (list, optional): The sections to clear, for callers that
+            looked them up before removing the assignment
+    """
+    if section_ids is None:
+        section_ids = get_assignment_section_ids(assignment_id)
+    for section_id in section_ids:
+        _cache.invalidate(section_id=section_id)
+
+
+def get_progress_cache_stats():
+    """Return hit/miss counters of the student progress cache."""
+    return _cache.stats()
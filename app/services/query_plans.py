@@ -0,0 +1,138 @@
+"""
+Query-plan checks for the hot paths.
+
+Each entry of HOT_PATHS builds one of the lookups that student and teacher
+pages make on every request. check_query_plans() runs EXPLAIN for each of
+them and reports those the database would answer with a full table scan,
+which usually means an index is missing or no longer matches the query:
+
+    flask check-query-plans            # against the configured database
+    flask check-query-plans --seed 2000  # against a seeded throwaway SQLite copy
+
+The command exits with status 1 when a plan falls back to a scan, so it can
+run as a deployment check.
+"""
+
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.assignment import AssignmentQuestion
+from app.models.gradebook_entry import GradebookEntry
+from app.models.section_assignment import SectionAssignment
+from app.models.submission import Submission
+from app.models.user import StudentEnrollment
+
+PlanCheck = namedtuple('PlanCheck', ['name', 'ok', 'plan'])
+
+
+def _since():
+    return datetime.utcnow() - timedelta(days=7)
+
+
+# name -> function(session) returning the query to explain
+HOT_PATHS = {
+    'submissions of a student for an assignment': lambda session: (
+        session.query(Submission.id, Submission.question_id, Submission.is_correct, Submission.submitted_at)
+        .filter(Submission.student_id == 1, Submission.assignment_id == 1)),
+    'submissions of an assignment': lambda session: (
+        session.query(Submission.id, Submission.student_id, Submission.question_id)
+        .filter(Submission.assignment_id == 1)),
+    'submissions of a question': lambda session: (
+        session.query(Submission.id).filter(Submission.question_id == 1)),
+    'submissions since a date': lambda session: (
+        session.query(Submission.id).filter(Submission.submitted_at >= _since())),
+    'active enrollments of a student': lambda session: (
+        session.query(StudentEnrollment.section_id)
+        .filter(StudentEnrollment.student_id == 1, StudentEnrollment.is_active == True)),
+    'active students of a section': lambda session: (
+        session.query(StudentEnrollment.student_id)
+        .filter(StudentEnrollment.section_id == 1, StudentEnrollment.is_active == True)),
+    'active assignments of a section': lambda session: (
+        session.query(SectionAssignment.assignment_id)
+        .filter(SectionAssignment.section_id == 1, SectionAssignment.is_active == True)),
+    'questions of an assignment in order': lambda session: (
+        session.query(AssignmentQuestion.question_id, AssignmentQuestion.score)
+        .filter(AssignmentQuestion.assignment_id == 1)
+        .order_by(AssignmentQuestion.order)),
+    'gradebook of an assignment': lambda session: (
+        session.query(GradebookEntry.student_id, GradebookEntry.question_id, GradebookEntry.is_correct)
+        .filter(GradebookEntry.assignment_id == 1, GradebookEntry.student_id.in_([1, 2, 3]))),
+}
+
+
+def explain(session, query):
+    """
+    Run EXPLAIN for a query.
+
+    Returns:
+        tuple: (plan lines, whether any step reads a whole table)
+    """
+    connection = session.connection()
+    dialect = connection.dialect
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        lines = [row[-1] for row in rows]
+        full_scan = any(line.startswith('SCAN ') and 'CONSTANT ROW' not in line for line in lines)
+    else:
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params).mappings().fetchall()
+        lines = [f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}" for row in rows]
+        # ALL reads every row, index reads every entry of an index
+        full_scan = any(row['type'] in ('ALL', 'index') for row in rows)
+    return lines, full_scan
+
+
+def check_query_plans(session=None):
+    """
+    Explain every hot-path query.
+
+    Args:
+        session (Session, optional): Where to run them (default: the app's session)
+
+    Returns:
+        list: PlanCheck(name, ok, plan) per query
+    """
+    session = session or db.session
+    results = []
+    for name, build in HOT_PATHS.items():
+        plan, full_scan = explain(session, build(session))
+        results.append(PlanCheck(name, not full_scan, plan))
+    return results
+
+
+def seeded_sqlite_session(rows=2000):
+    """
+    Create an in-memory SQLite database with the app's schema and some
+    synthetic rows, so plans can be checked without a production copy.
+    """
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(bind=engine)
+    random.seed(0)
+    now = datetime.utcnow()
+    pairs = {(random.randint(1, rows), random.randint(1, rows // 10 or 1)) for _ in range(rows)}
+    with engine.begin() as connection:
+        connection.execute(Submission.__table__.insert(), [
+            {'student_id': random.randint(1, rows), 'assignment_id': random.randint(1, rows // 10 or 1),
+             'question_id': random.randint(1, rows // 5 or 1), 'submitted_answer': 'SELECT 1',
+             'is_correct': random.random() < 0.5, 'submitted_at': now - timedelta(minutes=number)}
+            for number in range(rows)])
+        connection.execute(StudentEnrollment.__table__.insert(), [
+            {'student_id': student_id, 'section_id': section_id, 'is_active': random.random() < 0.9}
+            for student_id, section_id in pairs])
+        connection.execute(SectionAssignment.__table__.insert(), [
+            {'section_id': number % (rows // 10 or 1) + 1, 'assignment_id': number + 1, 'is_active': True}
+            for number in range(rows // 5 or 1)])
+        connection.execute(AssignmentQuestion.__table__.insert(), [
+            {'assignment_id': number // 10 + 1, 'question_id': number + 1, 'order': number % 10, 'score': 10}
+            for number in range(rows)])
+        connection.exec_driver_sql('ANALYZE')
+    return Session(bind=engine)
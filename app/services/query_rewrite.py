@@ -0,0 +1,151 @@
+"""
+Cached table-name rewriting for imported-schema queries.
+
+Imported schemas are deployed as prefixed tables in the application database,
+so every student and teacher query against them has its table names rewritten
+(``customers`` -> ``schema_1_23_customers``). The set of table names is
+persisted on ``SchemaImport.table_names`` when the schema is deployed; older
+deployments fall back to parsing ``schema_content`` once per process.
+Rewritten queries are kept in an LRU cache keyed by (schema id, schema
+version, prefix, query). The version is a digest of the schema's content
+hash and table list, so after a redeploy every worker process misses the
+cache, not only the one that ran the deploy.
+
+    QUERY_REWRITE_CACHE_SIZE   rewritten queries kept per process (default 2048)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from app.utils import extract_table_names, rewrite_table_references
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _schema_version(schema):
+    """Digest of what a schema's rewrites depend on: its content and its recorded table list."""
+    return hashlib.sha1(f"{schema.content_hash}:{schema.table_names}".encode('utf-8')).hexdigest()
+
+
+class QueryRewriteCache:
+    """
+    Thread-safe LRU cache of rewritten queries.
+
+    Args:
+        max_entries (int): Number of rewritten queries to keep
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (schema id, version, prefix, query) -> rewritten query
+        self._table_index = {}  # (schema id, content hash) -> tuple of table names parsed from schema_content
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'index_builds': 0}
+
+    def table_names(self, schema):
+        """Return the table names of a SchemaImport, parsing its content at most once."""
+        persisted = schema.get_table_names()
+        if persisted is not None:
+            return persisted
+
+        index_key = (schema.id, schema.content_hash)
+        with self._lock:
+            names = self._table_index.get(index_key)
+        if names is None:
+            names = tuple(extract_table_names(schema.schema_content))
+            with self._lock:
+                self._table_index[index_key] = names
+                self._stats['index_builds'] += 1
+            logging.debug(f"Built table index for schema {schema.id}: {list(names)}")
+        return list(names)
+
+    def rewrite(self, query, schema, table_prefix):
+        key = (schema.id, _schema_version(schema), table_prefix, query)
+        with self._lock:
+            rewritten = self._entries.get(key)
+            if rewritten is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return rewritten
+            self._stats['misses'] += 1
+
+        rewritten = rewrite_table_references(query, self.table_names(schema), table_prefix)
+        with self._lock:
+            self._entries[key] = rewritten
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rewritten
+
+    def invalidate(self, schema_id=None):
+        """Forget cached rewrites and table indexes for one (or every) schema."""
+        with self._lock:
+            if schema_id is None:
+                self._entries.clear()
+                self._table_index.clear()
+                return
+            for key in [key for key in self._table_index if key[0] == schema_id]:
+                del self._table_index[key]
+            for key in [key for key in self._entries if key[0] == schema_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'indexed_schemas': len(self._table_index),
+            })
+        return stats
+
+
+rewrite_cache = QueryRewriteCache(max(_env_int('QUERY_REWRITE_CACHE_SIZE', 2048), 1))
+
+
+def get_schema_table_names(schema):
+    """
+    Get the table names defined by an imported schema.
+
+    Args:
+        schema (SchemaImport): The imported schema
+
+    Returns:
+        list: The schema's table names, without prefix
+    """
+    return rewrite_cache.table_names(schema)
+
+
+def rewrite_for_schema_import(query, schema, table_prefix=None):
+    """
+    Rewrite a query to use an imported schema's prefixed table names.
+
+    Args:
+        query (str): The original SQL query
+        schema (SchemaImport): The imported schema the query runs against
+        table_prefix (str, optional): Defaults to the schema's active prefix
+
+    Returns:
+        str: The rewritten query (unchanged if the schema is not deployed)
+    """
+    table_prefix = table_prefix or schema.active_schema_name
+    if not query or not table_prefix:
+        return query
+    return rewrite_cache.rewrite(query, schema, table_prefix)
+
+
+def invalidate_schema_rewrites(schema_id=None):
+    """Drop cached rewrites after a schema is redeployed or deleted."""
+    rewrite_cache.invalidate(schema_id)
+
+
+def get_rewrite_cache_stats():
+    """Return statistics for the query rewrite cache in this process."""
+    return rewrite_cache.stats()
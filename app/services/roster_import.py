@@ -0,0 +1,414 @@
+"""
+Student roster import for a section.
+
+Teachers upload a CSV or XLSX file with one student per row and a header
+row naming the columns (username, email, first_name, last_name and,
+optionally, password). The file is read as a stream (openpyxl in read-only
+mode for XLSX) and handled in chunks: each chunk costs one lookup of the
+usernames and emails it contains, one multi-row INSERT of the new users and
+one of their enrollments, and is committed on its own. A row that cannot be
+imported (missing fields, a duplicate, a username taken by someone else) is
+reported with its line number and the rest of the file goes on.
+
+A row naming an existing student account (same username and email) enrolls
+that account instead of creating one. Rows without a password get a random
+temporary password, shown once on the result page. Those are hashed with
+the cheaper ROSTER_TEMP_HASH_METHOD: they are long and random, so the hash
+cost adds little, and the hash is upgraded to PASSWORD_HASH_METHOD on the
+student's first login (see app.services.passwords). Hashing runs on a
+process pool so large rosters use every core:
+
+    ROSTER_IMPORT_PROCESSES   hashing processes per import (default: CPU count, at most 8)
+    ROSTER_IMPORT_CHUNK       rows per INSERT and commit (default 500)
+    ROSTER_IMPORT_MAX_ROWS    largest accepted roster (default 5000)
+    ROSTER_TEMP_HASH_METHOD   hash method for temporary passwords
+                              (default pbkdf2:sha256:20000)
+"""
+
+import codecs
+import csv
+import logging
+import multiprocessing
+import os
+import secrets
+import string
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from zipfile import BadZipFile
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models.section import Section
+from app.models.user import StudentEnrollment, User
+from app.services.enrollments import invalidate_enrollments
+from app.services.passwords import hash_method, usable_hash_method
+from app.services.version_stamps import bump_versions
+
+FIELDS = ('username', 'email', 'first_name', 'last_name', 'password')
+REQUIRED_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+# Header spellings accepted for each field (compared lower-cased, with spaces and dashes as underscores)
+HEADER_ALIASES = {
+    'username': ('username', 'user_name', 'user', 'login', 'student_id'),
+    'email': ('email', 'e_mail', 'email_address', 'mail'),
+    'first_name': ('first_name', 'firstname', 'first', 'given_name'),
+    'last_name': ('last_name', 'lastname', 'last', 'surname', 'family_name'),
+    'password': ('password', 'initial_password'),
+}
+
+# Column sizes of the users table
+MAX_LENGTHS = {'username': 50, 'email': 120, 'first_name': 50, 'last_name': 50}
+
+TEMP_PASSWORD_LENGTH = 12
+
+# Below this many passwords, starting the hashing processes costs more than it saves
+PARALLEL_MIN_PASSWORDS = 32
+
+
+class RosterError(ValueError):
+    """The file as a whole cannot be imported (format, header, size)."""
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _temp_hash_method():
+    return usable_hash_method(os.getenv('ROSTER_TEMP_HASH_METHOD', 'pbkdf2:sha256:20000'))
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _map_header(header):
+    """Map field name -> column index, or raise RosterError naming the missing columns."""
+    names = [_normalize_header(value) for value in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    missing = [field for field in REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise RosterError(f"The header row has no {', '.join(missing)} column. "
+                          f"Expected columns: {', '.join(FIELDS)} (password is optional).")
+    return columns
+
+
+def _csv_rows(fileobj):
+    # utf-8-sig drops the byte order mark Excel writes in front of CSV files
+    yield from csv.reader(codecs.iterdecode(fileobj, 'utf-8-sig'))
+
+
+def _xlsx_rows(fileobj):
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Numeric usernames or passwords typed into Excel
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_roster(fileobj, filename):
+    """
+    Read a roster file row by row.
+
+    Args:
+        fileobj: The uploaded file (binary)
+        filename (str): Its name; the extension selects CSV or XLSX
+
+    Yields:
+        tuple: (line number, dict of FIELDS), for every non-empty row after the header
+
+    Raises:
+        RosterError: If the format is not supported or the header is unusable
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(fileobj)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(fileobj)
+    else:
+        raise RosterError('Only .csv and .xlsx roster files are supported.')
+
+    try:
+        columns = None
+        for line, row in enumerate(rows, 1):
+            values = [_cell(value) for value in row]
+            if not any(values):
+                continue
+            if columns is None:
+                columns = _map_header(values)
+                continue
+            record = dict.fromkeys(FIELDS, '')
+            for field, index in columns.items():
+                if index < len(values):
+                    record[field] = values[index]
+            yield line, record
+        if columns is None:
+            raise RosterError('The roster file is empty.')
+    except UnicodeDecodeError:
+        raise RosterError('The CSV file is not UTF-8 encoded. Save it as "CSV UTF-8" and try again.')
+    except (csv.Error, OSError, BadZipFile, InvalidFileException) as e:
+        raise RosterError(f'The roster file could not be read: {e}')
+
+
+def _validate(record):
+    """Return an error message for a row, or None if it can be imported."""
+    missing = [field.replace('_', ' ') for field in REQUIRED_FIELDS if not record.get(field)]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    for field, limit in MAX_LENGTHS.items():
+        if len(record[field]) > limit:
+            return f"{field.replace('_', ' ').capitalize()} is longer than {limit} characters"
+    if any(character.isspace() for character in record['username']):
+        return 'Username contains spaces'
+    if '@' not in record['email'][1:-1]:
+        return 'Email address is not valid'
+    return None
+
+
+def _temp_password():
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(alphabet) for _ in range(TEMP_PASSWORD_LENGTH))
+
+
+class _Hasher:
+    """Hashes passwords, on a process pool once there are enough of them."""
+
+    def __init__(self):
+        self.processes = min(max(_env_int('ROSTER_IMPORT_PROCESSES', os.cpu_count() or 1), 1), 8)
+        self._executor = None
+
+    def hash_all(self, passwords, methods):
+        if self.processes > 1 and len(passwords) >= PARALLEL_MIN_PASSWORDS:
+            if self._executor is None:
+                # Forking a threaded web worker is unsafe, so the processes are spawned
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            chunksize = max(len(passwords) // (self.processes * 4), 1)
+            try:
+                return list(self._executor.map(generate_password_hash, passwords, methods, chunksize=chunksize))
+            except BrokenProcessPool as e:
+                logging.warning(f"Roster import hashing processes failed, hashing in this process: {e}")
+                self.close()
+                self.processes = 1
+        return [generate_password_hash(password, method) for password, method in zip(passwords, methods)]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class _RosterImport:
+    def __init__(self, section):
+        self.section = section
+        self.hasher = _Hasher()
+        self.created = []    # {'line', 'username', 'name', 'password'}; password only if generated
+        self.enrolled = []   # {'line', 'username', 'name'} of existing accounts
+        self.errors = []     # {'line', 'username', 'message'}
+        self.changed_student_ids = set()
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+    def error(self, line, record, message):
+        self.errors.append({'line': line, 'username': record.get('username', ''), 'message': message})
+
+    def accept(self, line, record):
+        """Check a row on its own and against earlier rows of the file."""
+        message = _validate(record)
+        if message is None:
+            username, email = record['username'].lower(), record['email'].lower()
+            if username in self._seen_usernames:
+                message = 'Username appears more than once in the file'
+            elif email in self._seen_emails:
+                message = 'Email appears more than once in the file'
+            else:
+                self._seen_usernames.add(username)
+                self._seen_emails.add(email)
+        if message is not None:
+            self.error(line, record, message)
+            return False
+        return True
+
+    def import_chunk(self, rows):
+        usernames = [record['username'] for _, record in rows]
+        emails = [record['email'] for _, record in rows]
+        existing = (db.session.query(User.id, User.username, User.email, User.role)
+                    .filter(or_(func.lower(User.username).in_([name.lower() for name in usernames]),
+                                func.lower(User.email).in_([email.lower() for email in emails])))
+                    .all())
+        by_username = {user.username.lower(): user for user in existing}
+        by_email = {user.email.lower(): user for user in existing}
+
+        new_rows, existing_rows = [], []
+        for line, record in rows:
+            user = by_username.get(record['username'].lower())
+            if user is not None:
+                if user.role == 'student' and user.email.lower() == record['email'].lower():
+                    existing_rows.append((line, record, user.id))
+                else:
+                    self.error(line, record, 'Username is already used by another account')
+            elif record['email'].lower() in by_email:
+                self.error(line, record, 'Email is already used by another account')
+            else:
+                new_rows.append((line, record))
+
+        if existing_rows:
+            self._enroll_existing(existing_rows)
+        if new_rows:
+            self._create_students(new_rows)
+        db.session.commit()
+
+    def _enroll_existing(self, rows):
+        student_ids = [student_id for _, _, student_id in rows]
+        teacher_section_ids = (db.session.query(Section.id)
+                               .filter(Section.creator_id == self.section.creator_id))
+        # Students stay with the teacher whose section they are active in (as on the Manage Students page)
+        taken = {student_id for (student_id,) in (
+            db.session.query(StudentEnrollment.student_id)
+            .filter(StudentEnrollment.student_id.in_(student_ids),
+                    StudentEnrollment.is_active == True,
+                    StudentEnrollment.section_id.notin_(teacher_section_ids)))}
+        enrollments = {enrollment.student_id: enrollment for enrollment in (
+            StudentEnrollment.query
+            .filter(StudentEnrollment.section_id == self.section.id,
+                    StudentEnrollment.student_id.in_(student_ids)))}
+
+        new_enrollments = []
+        for line, record, student_id in rows:
+            if student_id in taken:
+                self.error(line, record, "Student is enrolled in another teacher's section")
+                continue
+            enrollment = enrollments.get(student_id)
+            if enrollment is None:
+                new_enrollments.append({'student_id': student_id, 'section_id': self.section.id,
+                                        'is_active': True})
+                self.changed_student_ids.add(student_id)
+            elif not enrollment.is_active:
+                enrollment.is_active = True
+                self.changed_student_ids.add(student_id)
+            self.enrolled.append({'line': line, 'username': record['username'],
+                                  'name': f"{record['first_name']} {record['last_name']}"})
+        if new_enrollments:
+            db.session.execute(StudentEnrollment.__table__.insert(), new_enrollments)
+
+    def _create_students(self, rows):
+        temporary = [not record['password'] for _, record in rows]
+        passwords = [record['password'] or _temp_password() for _, record in rows]
+        methods = [_temp_hash_method() if generated else hash_method() for generated in temporary]
+        hashes = self.hasher.hash_all(passwords, methods)
+
+        users = [{'username': record['username'], 'email': record['email'],
+                  'first_name': record['first_name'], 'last_name': record['last_name'],
+                  'password_hash': password_hash, 'role': 'student', 'is_active': True}
+                 for (_, record), password_hash in zip(rows, hashes)]
+        try:
+            with db.session.begin_nested():
+                db.session.execute(User.__table__.insert(), users)
+            inserted = users
+        except IntegrityError:
+            # Someone registered one of these names meanwhile: insert row by row to find it
+            inserted = []
+            for (line, record), user in zip(rows, users):
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(User.__table__.insert(), [user])
+                    inserted.append(user)
+                except IntegrityError:
+                    self.error(line, record, 'Username or email was taken while importing')
+
+        names = [user['username'] for user in inserted]
+        ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(names)))
+        if ids:
+            db.session.execute(StudentEnrollment.__table__.insert(), [
+                {'student_id': student_id, 'section_id': self.section.id, 'is_active': True}
+                for student_id in ids.values()])
+
+        for (line, record), password, generated in zip(rows, passwords, temporary):
+            if record['username'] in ids:
+                self.created.append({'line': line, 'username': record['username'],
+                                     'name': f"{record['first_name']} {record['last_name']}",
+                                     'email': record['email'],
+                                     'password': password if generated else None})
+
+
+def import_roster(section, fileobj, filename):
+    """
+    Create and enroll the students listed in a roster file.
+
+    Args:
+        section (Section): The section to enroll them in
+        fileobj: The uploaded file (binary)
+        filename (str): Its name (.csv or .xlsx)
+
+    Returns:
+        dict: 'created' (new accounts, with the temporary password if one was
+            generated), 'enrolled' (existing accounts) and 'errors' (rows
+            skipped), each a list of dicts with the row's line number
+
+    Raises:
+        RosterError: If the file cannot be read at all, or has more than
+            ROSTER_IMPORT_MAX_ROWS rows; nothing is imported then
+    """
+    chunk_size = max(_env_int('ROSTER_IMPORT_CHUNK', 500), 1)
+    max_rows = _env_int('ROSTER_IMPORT_MAX_ROWS', 5000)
+    roster = _RosterImport(section)
+
+    # Read and check the whole file first, so an unreadable or oversized one imports nothing
+    rows = []
+    for line, record in parse_roster(fileobj, filename):
+        if len(rows) + len(roster.errors) >= max_rows:
+            raise RosterError(f'The roster has more than {max_rows} rows. Split it into several files.')
+        if roster.accept(line, record):
+            rows.append((line, record))
+
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            reported = len(roster.created), len(roster.enrolled), len(roster.errors)
+            changed = set(roster.changed_student_ids)
+            try:
+                roster.import_chunk(chunk)
+            except Exception as e:
+                # Nothing of this chunk was stored: report all of its rows as failed
+                db.session.rollback()
+                logging.error(f"Roster import into section {section.id} failed for a chunk: {e}")
+                del roster.created[reported[0]:], roster.enrolled[reported[1]:], roster.errors[reported[2]:]
+                roster.changed_student_ids = changed
+                for line, record in chunk:
+                    roster.error(line, record, 'Could not be saved; please try this row again')
+    finally:
+        roster.hasher.close()
+
+    if roster.created or roster.changed_student_ids:
+        invalidate_enrollments(student_ids=roster.changed_student_ids)
+        # The section's roster changed; new accounts have no cached pages to refresh
+        bump_versions(section_ids=[section.id], student_ids=roster.changed_student_ids)
+
+    logging.info(f"Roster import into section {section.id}: {len(roster.created)} created, "
+                 f"{len(roster.enrolled)} enrolled, {len(roster.errors)} errors")
+    return {
+        'created': roster.created,
+        'enrolled': roster.enrolled,
+        'errors': sorted(roster.errors, key=lambda error: error['line'])
+    }
@@ -0,0 +1,417 @@
+"""
+Pooled MySQL connections for sandbox query execution.
+
+Student queries, teacher previews and both SQL playgrounds run against the
+MySQL server configured through the MYSQL_* environment variables. Opening a
+fresh connection for every request costs a TCP handshake plus authentication,
+so this module keeps a small pool of connections per database and hands them
+out on demand.
+
+Pool sizing is controlled through environment variables:
+
+    SANDBOX_POOL_SIZE          idle connections kept per database (default 4)
+    SANDBOX_POOL_MAX_OVERFLOW  extra connections allowed under load (default 8)
+    SANDBOX_POOL_TIMEOUT       seconds to wait for a free connection (default 10)
+    SANDBOX_POOL_RECYCLE       maximum connection age in seconds (default 1800)
+    SANDBOX_POOL_PING_AFTER    idle seconds before a health check (default 30)
+    SANDBOX_DB_CACHE_TTL       seconds to cache database name lookups (default 300)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import pymysql
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class PooledConnection:
+    """
+    Proxy around a pymysql connection checked out from a SandboxPool.
+
+    Behaves like the wrapped connection, except that close() (or leaving a
+    ``with`` block) hands the connection back to its pool instead of closing
+    the socket.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise pymysql.err.InterfaceError(0, 'Connection has been returned to the pool')
+        return getattr(conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that return early without closing
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SandboxPool:
+    """
+    Thread-safe pool of pymysql connections bound to a single database.
+
+    At most ``pool_size`` idle connections are retained. Up to ``max_overflow``
+    additional connections may be opened when all pooled ones are busy; those
+    are closed as soon as they are released. Once the overflow limit is hit,
+    callers wait up to ``timeout`` seconds for a connection to come back.
+    """
+
+    def __init__(self, database=None, pool_size=4, max_overflow=8, timeout=10,
+                 recycle=1800, ping_after=30, connect_kwargs=None):
+        self.database = database
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.connect_kwargs = connect_kwargs or {}
+
+        self._idle = deque()  # (connection, created_at, last_used)
+        self._created_at = {}  # id(connection) -> creation time
+        self._checked_out = 0
+        self._cond = threading.Condition()
+
+        self._stats = {
+            'connections_created': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'overflow_opened': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+            'timeouts': 0,
+        }
+
+    def _connect(self):
+        kwargs = dict(self.connect_kwargs)
+        if self.database:
+            kwargs['database'] = self.database
+        conn = pymysql.connect(**kwargs)
+        self._created_at[id(conn)] = time.monotonic()
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at, last_used):
+        """Check an idle connection before handing it out again."""
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if not conn.open:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception as e:
+                logging.warning(f"Sandbox pool health check failed for '{self.database}': {e}")
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        """
+        Check out a connection from the pool.
+
+        Returns:
+            PooledConnection: A proxy that returns the connection on close()
+
+        Raises:
+            ValueError: If no connection became available within the timeout
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            candidate = None
+            with self._cond:
+                while not self._idle and self._checked_out >= self.pool_size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise ValueError("The query service is busy right now. Please try again in a moment.")
+                    self._cond.wait(remaining)
+
+                self._checked_out += 1
+                self._stats['checkouts'] += 1
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._checked_out > self.pool_size:
+                    self._stats['overflow_opened'] += 1
+
+            if candidate is None:
+                try:
+                    return PooledConnection(self, self._connect())
+                except Exception:
+                    self._release_slot()
+                    raise
+
+            conn, created_at, last_used = candidate
+            if self._is_usable(conn, created_at, last_used):
+                with self._cond:
+                    self._stats['reused'] += 1
+                return PooledConnection(self, conn)
+
+            # Stale connection: drop it and try again with a new slot
+            self._discard(conn)
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._checked_out -= 1
+            self._cond.notify()
+
+    def release(self, conn):
+        """Return a connection to the pool (or close it if the pool is full)."""
+        keep = conn.open
+        with self._cond:
+            self._checked_out -= 1
+            if keep and len(self._idle) < self.pool_size:
+                created_at = self._created_at.get(id(conn), time.monotonic())
+                self._idle.append((conn, created_at, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    def dispose(self):
+        """Close every idle connection held by this pool."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage counters."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'database': self.database,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+            })
+        return stats
+
+
+# Process-wide pool registry, keyed by database name (None = no default database)
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+# Cache of question.mysql_db_name -> resolved (possibly prefixed) database name
+_resolved_databases = {}
+_resolved_lock = threading.Lock()
+_resolver_stats = {'hits': 0, 'misses': 0}
+
+
+def _reset_after_fork():
+    """Forget pools inherited from a parent process (e.g. gunicorn preload)."""
+    global _pools_pid
+    if _pools_pid != os.getpid():
+        _pools.clear()
+        with _resolved_lock:
+            _resolved_databases.clear()
+        _pools_pid = os.getpid()
+
+
+def _connect_kwargs():
+    return {
+        'host': os.getenv('MYSQL_HOST', ''),
+        'user': os.getenv('MYSQL_USER', ''),
+        'password': os.getenv('MYSQL_PASSWORD', ''),
+        'port': int(os.getenv('MYSQL_PORT', 3306)),
+        'cursorclass': pymysql.cursors.DictCursor,
+        'autocommit': True,  # sandbox queries are read-only; never hold a snapshot open
+        'connect_timeout': 10,
+    }
+
+
+def get_pool(database=None):
+    """
+    Get (or lazily create) the connection pool for a database.
+
+    Args:
+        database (str, optional): The database to bind connections to
+
+    Returns:
+        SandboxPool: The pool for this database
+    """
+    with _pools_lock:
+        _reset_after_fork()
+        pool = _pools.get(database)
+        if pool is None:
+            pool = SandboxPool(
+                database=database,
+                pool_size=_env_int('SANDBOX_POOL_SIZE', 4),
+                max_overflow=_env_int('SANDBOX_POOL_MAX_OVERFLOW', 8),
+                timeout=_env_int('SANDBOX_POOL_TIMEOUT', 10),
+                recycle=_env_int('SANDBOX_POOL_RECYCLE', 1800),
+                ping_after=_env_int('SANDBOX_POOL_PING_AFTER', 30),
+                connect_kwargs=_connect_kwargs()
+            )
+            _pools[database] = pool
+        return pool
+
+
+def get_sandbox_connection(database=None):
+    """
+    Check out a pooled connection to the sandbox MySQL server.
+
+    Args:
+        database (str, optional): Database to use; None connects without one
+
+    Returns:
+        PooledConnection: Use as a context manager or call close() when done
+    """
+    return get_pool(database).acquire()
+
+
+def resolve_sandbox_database(mysql_db_name):
+    """
+    Find the actual database backing a question's ``mysql_db_name``.
+
+    Questions may refer to a database by its bare name while the server holds
+    it under the assignments or template prefix. The lookup result is cached
+    for SANDBOX_DB_CACHE_TTL seconds so SHOW DATABASES is not issued per query.
+
+    Args:
+        mysql_db_name (str): The database name configured on the question
+
+    Returns:
+        str: The existing database name, or None if no candidate exists
+    """
+    ttl = _env_int('SANDBOX_DB_CACHE_TTL', 300)
+    now = time.monotonic()
+    with _resolved_lock:
+        cached = _resolved_databases.get(mysql_db_name)
+        if cached and now - cached[1] < ttl:
+            _resolver_stats['hits'] += 1
+            return cached[0]
+        _resolver_stats['misses'] += 1
+
+    assignments_prefix = os.getenv('ASSIGNMENTS_DB_PREFIX', 'student_assignment_')
+    template_prefix = os.getenv('TEMPLATE_DB_PREFIX', 'template_assignment_')
+    possible_names = [
+        mysql_db_name,
+        f"{assignments_prefix}{mysql_db_name}",
+        f"{template_prefix}{mysql_db_name}"
+    ]
+
+    with get_sandbox_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW DATABASES")
+            databases = {row['Database'] for row in cursor.fetchall()}
+
+    db_name = next((name for name in possible_names if name in databases), None)
+    if db_name:
+        with _resolved_lock:
+            _resolved_databases[mysql_db_name] = (db_name, now)
+    return db_name
+
+
+def get_question_connection(question):
+    """
+    Check out a pooled connection to the exercise database of a MySQL-backed question.
+
+    Args:
+        question (Question): A question with db_type 'mysql' or 'imported_schema'
+
+    Returns:
+        PooledConnection: A connection bound to the question's database
+
+    Raises:
+        ValueError: If the question is not configured with a usable database
+    """
+    if not question:
+        raise ValueError("Invalid question")
+        
+    if question.db_type == 'imported_schema':
+        if not question.schema_import or not question.schema_import.active_schema_name:
+            raise ValueError("Question's imported schema is not properly configured")
+            
+        # Imported schemas live as prefixed tables in the application database
+        return get_sandbox_connection(os.getenv('APP_DB_NAME', ''))
+        
+    elif question.db_type == 'mysql':
+        if not question.mysql_db_name:
+            raise ValueError("Invalid question or missing database name")
+            
+        try:
+            # Resolve the bare or prefixed database name (cached between requests)
+            db_name = resolve_sandbox_database(question.mysql_db_name)
+            if not db_name:
+                raise ValueError(f"Database '{question.mysql_db_name}' (or its prefixed versions) does not exist")
+            
+            return get_sandbox_connection(db_name)
+            
+        except Exception as e:
+            logging.error(f"Error connecting to database: {str(e)}")
+            if "Access denied" in str(e):
+                raise ValueError("Access denied to database. Please contact your teacher.")
+            raise
+    else:
+        raise ValueError(f"Unsupported database type: {question.db_type}")
+
+
+def invalidate_resolved_database(mysql_db_name=None):
+    """
+    Drop one (or every) cached database name lookup in this process, e.g.
+    after the allowed databases or a section's database changed. Other
+    worker processes pick the change up within SANDBOX_DB_CACHE_TTL.
+    """
+    with _resolved_lock:
+        if mysql_db_name is None:
+            _resolved_databases.clear()
+        else:
+            _resolved_databases.pop(mysql_db_name, None)
+
+
+def get_pool_stats():
+    """
+    Collect statistics for every sandbox pool in this process.
+
+    Returns:
+        dict: Per-database pool counters plus database-name cache counters
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    with _resolved_lock:
+        resolver = dict(_resolver_stats, cached_names=len(_resolved_databases))
+    return {
+        'pid': os.getpid(),
+        'pools': [pool.stats() for pool in pools],
+        'database_name_cache': resolver,
+    }
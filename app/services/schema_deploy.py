@@ -0,0 +1,628 @@
+"""
+Bulk deployment of imported schemas into the application database.
+
+``use_schema`` copies a teacher's uploaded dump into the application database
+as prefixed tables (``customers`` -> ``schema_1_23_customers``). Replaying the
+dump one statement at a time is slow for large uploads, so the deployer works
+in phases:
+
+    parse       split the dump, sort statements into DDL, data and the rest,
+                and hash each table's statements
+    drop        remove tables left over from a previous deployment
+    ddl         create the tables, holding back secondary indexes
+    load        run the INSERTs as large multi-row batches in one transaction,
+                with foreign-key and unique checks disabled
+    indexes     add the held-back secondary indexes in one ALTER per table
+    statements  run the remaining statements (ALTER, CREATE INDEX, views, ...)
+    grants      grant SELECT on the new tables in a single round trip
+
+MySQL commits implicitly around DDL, so only the data load is a real
+transaction. If the load fails, the deployer drops every table it created,
+which leaves nothing half-deployed.
+
+Redeploying a schema is incremental. Each table's hash covers its CREATE
+TABLE, its INSERTs and the ALTER/CREATE INDEX statements aimed at it; when
+the hashes recorded by the previous deployment are passed in, tables whose
+hash is unchanged (and which still exist) are left alone, so students keep
+querying them while the changed tables are dropped and reloaded.
+
+    SCHEMA_DEPLOY_BATCH_BYTES   maximum size of one batched INSERT (default 1 MB)
+"""
+
+import hashlib
+import logging
+import os
+import re
+import time
+
+import pymysql
+from pymysql.constants import CLIENT
+
+from app.utils import (extract_create_table_name, get_prefixed_table_name, iter_schema_statements,
+                       modify_create_table_statement, rewrite_table_references)
+
+_INSERT_HEAD_RE = re.compile(
+    r'(?P<head>INSERT\s+(?:IGNORE\s+)?INTO\s+(?P<table>`[^`]+`|[\w$.]+)\s*(?:\([^)]*\))?\s*VALUES?)\s*',
+    re.IGNORECASE)
+_ON_DUPLICATE_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_SECONDARY_INDEX_RE = re.compile(r'(?:KEY|INDEX|FULLTEXT|SPATIAL)\b', re.IGNORECASE)
+_FOREIGN_KEY_RE = re.compile(r'(?:CONSTRAINT\s+\S+\s+)?FOREIGN\s+KEY\s*(?:\S+\s*)?\(([^)]*)\)', re.IGNORECASE)
+_INDEX_COLUMNS_RE = re.compile(r'\(([^)]*)\)')
+
+# Dump statements the deployer handles itself (tables are dropped up front,
+# and table locks would end the load transaction)
+_SKIPPED_RE = re.compile(r'(?:DROP\s+TABLE|LOCK\s+TABLES|UNLOCK\s+TABLES)\b', re.IGNORECASE)
+
+# Non-DDL statements that belong to a single table
+_TABLE_STATEMENT_RE = re.compile(
+    r'(?:ALTER\s+(?:IGNORE\s+)?TABLE|CREATE\s+(?:UNIQUE\s+|FULLTEXT\s+|SPATIAL\s+)?INDEX\s+\S+\s+ON)'
+    r'\s+(?P<table>`[^`]+`|[\w$.]+)',
+    re.IGNORECASE)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _bare_table_name(name):
+    """Strip quoting and any database qualifier from a table reference."""
+    return name.split('.')[-1].strip('`')
+
+
+def _split_definitions(body):
+    """Split the column/index list of a CREATE TABLE on top-level commas."""
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+        i += 1
+    parts.append(body[start:])
+    return parts
+
+
+def _index_columns(definition):
+    match = _INDEX_COLUMNS_RE.search(definition)
+    if not match:
+        return []
+    return [col.strip().strip('`').split('(')[0].lower() for col in match.group(1).split(',')]
+
+
+def split_secondary_indexes(statement):
+    """
+    Separate plain secondary indexes from a CREATE TABLE statement.
+
+    PRIMARY and UNIQUE keys stay in place, because they decide which rows are
+    accepted. Indexes whose leading column is used by a foreign key also stay,
+    since InnoDB would otherwise create its own index for the constraint.
+
+    Args:
+        statement (str): The CREATE TABLE statement
+
+    Returns:
+        tuple: (statement without deferred indexes, list of index definitions)
+    """
+    open_paren = statement.find('(')
+    close_paren = statement.rfind(')')
+    if open_paren < 0 or close_paren <= open_paren:
+        return statement, []
+
+    definitions = _split_definitions(statement[open_paren + 1:close_paren])
+    fk_columns = set()
+    for definition in definitions:
+        match = _FOREIGN_KEY_RE.match(definition.strip())
+        if match:
+            fk_columns.update(col.strip().strip('`').lower() for col in match.group(1).split(','))
+
+    kept, deferred = [], []
+    for definition in definitions:
+        stripped = definition.strip()
+        columns = _index_columns(stripped)
+        if (_SECONDARY_INDEX_RE.match(stripped) and columns
+                and columns[0] not in fk_columns):
+            deferred.append(stripped)
+        else:
+            kept.append(definition)
+
+    if not deferred:
+        return statement, []
+    return statement[:open_paren + 1] + ','.join(kept) + statement[close_paren:], deferred
+
+
+class SchemaDeployer:
+    """
+    Deploys one imported schema under a table prefix.
+
+    Args:
+        schema_content (str): The uploaded SQL dump
+        table_prefix (str): Prefix for every created table
+        database (str, optional): Target database; defaults to APP_DB_NAME
+        batch_bytes (int, optional): Maximum size of one batched INSERT
+        grant_permissions (bool, optional): Grant SELECT to the student user;
+            defaults to the ENABLE_PERMISSION_GRANTING setting
+        progress (callable, optional): Called as ``progress(phase, **counters)``
+            as the deployment advances
+        previous_hashes (dict, optional): Table hashes recorded by the previous
+            deployment under the same prefix; unchanged tables are kept.
+            None rebuilds every table
+    """
+
+    def __init__(self, schema_content, table_prefix, database=None, batch_bytes=None,
+                 grant_permissions=None, progress=None, previous_hashes=None):
+        self.schema_content = schema_content
+        self.table_prefix = table_prefix
+        self.database = database if database is not None else os.getenv('APP_DB_NAME', '')
+        self.batch_bytes = batch_bytes or _env_int('SCHEMA_DEPLOY_BATCH_BYTES', 1024 * 1024)
+        if grant_permissions is None:
+            grant_permissions = os.getenv('ENABLE_PERMISSION_GRANTING', 'true').lower() == 'true'
+        self.grant_permissions = grant_permissions
+        self.progress = progress
+        self.previous_hashes = previous_hashes
+
+        self.log = []
+        self.timings = {}
+        self.table_mappings = {}  # original table name -> prefixed table name
+        self.table_hashes = {}  # original table name -> sha256 of its statements
+        self.unchanged_tables = []  # original names of tables kept from the previous deployment
+        self.created_tables = []
+        self.verified_tables = []
+        self.counters = {'statements': 0, 'statements_processed': 0, 'rows_loaded': 0,
+                         'insert_statements': 0, 'insert_batches': 0, 'deferred_indexes': 0,
+                         'other_statements': 0, 'tables_unchanged': 0, 'warnings': 0}
+
+    def _connect(self):
+        return pymysql.connect(
+            host=os.getenv('MYSQL_HOST', ''),
+            user=os.getenv('MYSQL_USER', ''),
+            password=os.getenv('MYSQL_PASSWORD', ''),
+            port=int(os.getenv('MYSQL_PORT', 3306)),
+            database=self.database,
+            connect_timeout=30,
+            autocommit=False,
+            client_flag=CLIENT.MULTI_STATEMENTS
+        )
+
+    def _report(self, phase=None):
+        if self.progress:
+            self.progress(phase,
+                          statements_total=self.counters['statements'],
+                          statements_processed=self.counters['statements_processed'],
+                          rows_loaded=self.counters['rows_loaded'],
+                          tables_created=len(self.created_tables),
+                          tables_unchanged=len(self.unchanged_tables))
+
+    def _phase(self, name, started):
+        self.timings[name] = round(time.perf_counter() - started, 3)
+        self.log.append(f"Phase '{name}' finished in {self.timings[name]:.3f}s")
+
+    def _warn(self, message):
+        self.counters['warnings'] += 1
+        self.log.append(message)
+        if self.counters['warnings'] <= 3:  # Only log the first few warnings
+            logging.warning(message)
+
+    def _parse(self):
+        """
+        Sort the dump's statements and hash them per table.
+
+        Returns:
+            tuple: Lists of (table, statement) pairs for CREATE TABLE, INSERT and
+                other statements; table is the original table name, or None
+                for statements that do not belong to a table of the dump
+        """
+        creates, inserts, others = [], [], []
+        for statement in iter_schema_statements(self.schema_content):
+            self.counters['statements'] += 1
+            text = statement.text
+            upper = text[:20].upper()
+            if upper.startswith('CREATE TABLE'):
+                creates.append((extract_create_table_name(text), text))
+            elif upper.startswith('INSERT'):
+                match = _INSERT_HEAD_RE.match(text)
+                inserts.append((_bare_table_name(match.group('table')) if match else None, text))
+            elif not _SKIPPED_RE.match(text):
+                match = _TABLE_STATEMENT_RE.match(text)
+                others.append((_bare_table_name(match.group('table')) if match else None, text))
+
+        hashers = {}
+        for original_table, _ in creates:
+            self.table_mappings[original_table] = get_prefixed_table_name(self.table_prefix, original_table)
+            hashers[original_table] = hashlib.sha256()
+        lowered = {table.lower(): table for table in self.table_mappings}
+
+        def owner(table):
+            if table is None or table in self.table_mappings:
+                return table
+            return lowered.get(table.lower())
+
+        inserts = [(owner(table), text) for table, text in inserts]
+        others = [(owner(table), text) for table, text in others]
+        for group in (creates, inserts, others):
+            for table, text in group:
+                if table is not None:
+                    hashers[table].update(text.encode('utf-8', 'surrogatepass'))
+                    hashers[table].update(b'\0')
+        self.table_hashes = {table: hasher.hexdigest() for table, hasher in hashers.items()}
+
+        self.log.append(f"Parsed {self.counters['statements']} statements: {len(creates)} CREATE TABLE, "
+                        f"{len(inserts)} INSERT, {len(others)} other")
+        return creates, inserts, others
+
+    def _rewrite(self, sql):
+        return rewrite_table_references(sql, self.table_mappings.keys(), self.table_prefix)
+
+    def _drop_existing(self, cursor):
+        """
+        Drop the prefixed tables that this deployment replaces.
+
+        Without previous hashes every prefixed table goes. Otherwise tables
+        whose hash matches the previous deployment and that still exist are
+        kept and recorded in unchanged_tables.
+        """
+        cursor.execute("SHOW TABLES")
+        existing = [row[0] for row in cursor.fetchall() if row[0].startswith(self.table_prefix)]
+
+        if self.previous_hashes is not None:
+            existing_set = set(existing)
+            self.unchanged_tables = [
+                table for table, prefixed_table in self.table_mappings.items()
+                if prefixed_table in existing_set
+                and self.previous_hashes.get(table) == self.table_hashes[table]
+            ]
+            self.counters['tables_unchanged'] = len(self.unchanged_tables)
+            kept = {self.table_mappings[table] for table in self.unchanged_tables}
+            existing = [table for table in existing if table not in kept]
+            self.log.append(f"Keeping {len(kept)} unchanged tables, rebuilding "
+                            f"{len(self.table_mappings) - len(kept)}")
+
+        if existing:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            cursor.execute("DROP TABLE IF EXISTS " + ', '.join(f"`{table}`" for table in existing))
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        self.log.append(f"Dropped {len(existing)} existing tables with prefix {self.table_prefix}")
+
+    def _pending(self, statements):
+        """Keep the statements that belong to rebuilt tables (or to no table)."""
+        unchanged = set(self.unchanged_tables)
+        pending = [text for table, text in statements if table is None or table not in unchanged]
+        # Statements of kept tables count as done for the progress display
+        self.counters['statements_processed'] += len(statements) - len(pending)
+        return pending
+
+    def _create_tables(self, cursor, creates):
+        deferred = {}  # prefixed table -> index definitions
+        for statement in creates:
+            original_table = extract_create_table_name(statement)
+            prefixed_table = self.table_mappings[original_table]
+            statement, indexes = split_secondary_indexes(statement)
+            cursor.execute(modify_create_table_statement(statement, self.table_prefix))
+            self.created_tables.append(prefixed_table)
+            self.counters['statements_processed'] += 1
+            self._report()
+            if indexes:
+                deferred[prefixed_table] = indexes
+                self.counters['deferred_indexes'] += len(indexes)
+        self.log.append(f"Created {len(self.created_tables)} tables, "
+                        f"deferred {self.counters['deferred_indexes']} secondary indexes")
+        return deferred
+
+    def _insert_batches(self, inserts):
+        """
+        Merge consecutive INSERTs with the same target and columns into
+        multi-row statements.
+
+        Yields:
+            tuple: (SQL to execute, number of dump statements it covers)
+        """
+        head, values, size = None, [], 0
+        for statement in inserts:
+            match = _INSERT_HEAD_RE.match(statement)
+            if not match or _ON_DUPLICATE_RE.search(statement):
+                if values:
+                    yield head + ' ' + ',\n'.join(values), len(values)
+                    head, values, size = None, [], 0
+                yield self._rewrite(statement), 1
+                continue
+
+            statement_head = self._rewrite(match.group('head'))
+            statement_values = statement[match.end():]
+            if values and (statement_head != head or size + len(statement_values) > self.batch_bytes):
+                yield head + ' ' + ',\n'.join(values), len(values)
+                values, size = [], 0
+            head = statement_head
+            values.append(statement_values)
+            size += len(statement_values)
+        if values:
+            yield head + ' ' + ',\n'.join(values), len(values)
+
+    def _load(self, connection, cursor, inserts):
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        cursor.execute("SET UNIQUE_CHECKS = 0")
+        connection.begin()
+        try:
+            for batch, statement_count in self._insert_batches(inserts):
+                self.counters['rows_loaded'] += cursor.execute(batch) or 0
+                self.counters['insert_batches'] += 1
+                self.counters['statements_processed'] += statement_count
+                self._report()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute("SET UNIQUE_CHECKS = 1")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        self.counters['insert_statements'] = len(inserts)
+        self.log.append(f"Loaded {self.counters['rows_loaded']} rows from {len(inserts)} INSERT statements "
+                        f"in {self.counters['insert_batches']} batches")
+
+    def _add_indexes(self, cursor, deferred):
+        for table, indexes in deferred.items():
+            try:
+                cursor.execute(f"ALTER TABLE `{table}` " + ', '.join(f"ADD {index}" for index in indexes))
+            except pymysql.Error as e:
+                self._warn(f"Warning: Could not add indexes to {table}: {str(e)}")
+
+    def _run_others(self, cursor, others):
+        for statement in others:
+            try:
+                cursor.execute(self._rewrite(statement))
+                self.counters['other_statements'] += 1
+            except pymysql.Error as e:
+                self._warn(f"Error executing statement '{statement[:80]}': {str(e)}")
+            self.counters['statements_processed'] += 1
+            self._report()
+
+    def _grant(self, cursor):
+        if not self.grant_permissions:
+            self.log.append("Permission granting disabled via configuration")
+            return
+        if not self.created_tables:
+            return
+
+        grants = [f"GRANT SELECT ON `{self.database}`.`{table}` TO 'sql_student'@{self.database}"
+                  for table in self.created_tables]
+        try:
+            # One round trip for every grant
+            cursor.execute(';\n'.join(grants))
+            while cursor.nextset():
+                pass
+            self.log.append(f"Granted permissions on {len(grants)} tables")
+        except pymysql.Error as e:
+            self._warn(f"Warning: Could not grant permissions on the new tables: {str(e)}")
+
+    def _drop_created(self, cursor):
+        if not self.created_tables:
+            return
+        try:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            cursor.execute("DROP TABLE IF EXISTS " + ', '.join(f"`{table}`" for table in self.created_tables))
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            self.log.append(f"Rolled back: dropped {len(self.created_tables)} partially deployed tables")
+        except pymysql.Error as e:
+            logging.error(f"Could not clean up partially deployed tables for {self.table_prefix}: {e}")
+
+    def deploy(self):
+        """
+        Run every deployment phase.
+
+        Returns:
+            SchemaDeployer: self, with created_tables, unchanged_tables, table_hashes,
+                timings, counters and log filled in
+
+        Raises:
+            ValueError: If the tables could not be created or the data could not
+                be loaded; nothing from this deployment is left behind
+        """
+        started = time.perf_counter()
+        self._report('parse')
+        creates, inserts, others = self._parse()
+        self._phase('parse', started)
+
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                started = time.perf_counter()
+                self._report('drop')
+                self._drop_existing(cursor)
+                creates, inserts, others = self._pending(creates), self._pending(inserts), self._pending(others)
+                self._phase('drop', started)
+
+                try:
+                    started = time.perf_counter()
+                    self._report('ddl')
+                    deferred = self._create_tables(cursor, creates)
+                    self._phase('ddl', started)
+
+                    started = time.perf_counter()
+                    self._report('load')
+                    self._load(connection, cursor, inserts)
+                    self._phase('load', started)
+                except pymysql.Error as e:
+                    self.log.append(f"Deployment failed: {str(e)}")
+                    self._drop_created(cursor)
+                    self.created_tables = []
+                    raise ValueError(f"Schema deployment failed: {str(e)}")
+
+                started = time.perf_counter()
+                self._report('indexes')
+                self._add_indexes(cursor, deferred)
+                self._phase('indexes', started)
+
+                started = time.perf_counter()
+                self._report('statements')
+                self._run_others(cursor, others)
+                connection.commit()
+                self._phase('statements', started)
+
+                started = time.perf_counter()
+                self._report('grants')
+                self._grant(cursor)
+                self._phase('grants', started)
+
+                cursor.execute("SHOW TABLES")
+                self.verified_tables = [row[0] for row in cursor.fetchall() if row[0].startswith(self.table_prefix)]
+                self.log.append(f"Final verification: {len(self.verified_tables)} tables exist with prefix {self.table_prefix}")
+        finally:
+            connection.close()
+
+        self.timings['total'] = round(sum(self.timings.values()), 3)
+        self._report('done')
+        logging.info(f"Deployed schema {self.table_prefix} in {self.timings['total']:.3f}s: {self.timings}")
+        return self
+
+
+def deploy_schema(schema_content, table_prefix, **kwargs):
+    """
+    Deploy an imported schema's dump under a table prefix.
+
+    Args:
+        schema_content (str): The uploaded SQL dump
+        table_prefix (str): Prefix for every created table
+        **kwargs: Passed on to SchemaDeployer
+
+    Returns:
+        SchemaDeployer: The finished deployment (created_tables, timings, log)
+    """
+    return SchemaDeployer(schema_content, table_prefix, **kwargs).deploy()
+
+
+def drop_schema_tables(table_prefix, database=None, progress=None):
+    """
+    Drop every table deployed under an imported schema's prefix.
+
+    Args:
+        table_prefix (str): The schema's active_schema_name
+        database (str, optional): Target database; defaults to APP_DB_NAME
+        progress (callable, optional): Called as ``progress(phase, **counters)``
+
+    Returns:
+        list: Names of the dropped tables
+    """
+    if not table_prefix:
+        return []
+
+    connection = pymysql.connect(
+        host=os.getenv('MYSQL_HOST', ''),
+        user=os.getenv('MYSQL_USER', ''),
+        password=os.getenv('MYSQL_PASSWORD', ''),
+        port=int(os.getenv('MYSQL_PORT', 3306)),
+        database=database if database is not None else os.getenv('APP_DB_NAME', ''),
+        connect_timeout=30
+    )
+    tables_deleted = []
+    try:
+        with connection.cursor() as cursor:
+            # Get all tables with this schema's prefix
+            cursor.execute("SHOW TABLES")
+            tables_to_delete = [row[0] for row in cursor.fetchall() if row[0].startswith(table_prefix)]
+            if progress:
+                progress('drop', tables_total=len(tables_to_delete), tables_dropped=0)
+
+            # Disable foreign key checks to allow dropping tables with foreign key constraints
+            if tables_to_delete:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in tables_to_delete:
+                try:
+                    cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+                    tables_deleted.append(table)
+                except pymysql.Error as e:
+                    logging.error(f"Error dropping table {table}: {e}")
+                if progress:
+                    progress(None, tables_dropped=len(tables_deleted))
+            if tables_to_delete:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            connection.commit()
+    finally:
+        connection.close()
+    if progress:
+        progress('done', tables_dropped=len(tables_deleted))
+    return tables_deleted
+
+
+def run_deploy_job(reporter, schema_id, table_prefix, full=False):
+    """
+    Background job: deploy an imported schema and record the result on it.
+
+    Args:
+        reporter (JobReporter): Progress handle from app.services.jobs
+        schema_id (int): The SchemaImport to deploy
+        table_prefix (str): Prefix for the created tables
+        full (bool): Rebuild every table, even those unchanged since the
+            previous deployment
+
+    Returns:
+        dict: Created tables, per-phase timings, counters and the deployment log
+    """
+    from app import db
+    from app.models.schema_import import SchemaImport
+    from app.services.grading import refresh_answer_keys_for_schema
+    from app.services.query_rewrite import invalidate_schema_rewrites
+
+    schema = SchemaImport.query.get(schema_id)
+    if schema is None:
+        raise ValueError("The schema no longer exists")
+
+    # Only tables deployed under the same prefix can be reused
+    previous_hashes = None
+    if not full and schema.active_schema_name == table_prefix:
+        previous_hashes = schema.get_table_hashes()
+
+    deployer = SchemaDeployer(schema.schema_content, table_prefix, progress=reporter.update,
+                              previous_hashes=previous_hashes)
+    deployer.deploy()
+
+    # Update the schema record with the table prefix, its table index and the table hashes
+    schema.active_schema_name = table_prefix
+    schema.set_table_names(deployer.table_mappings.keys())
+    schema.set_table_hashes(deployer.table_hashes)
+    db.session.commit()
+    invalidate_schema_rewrites(schema.id)
+    deployer.log.append(f"Updated schema record with active_schema_name: {table_prefix}")
+
+    # The redeployed data may differ, so recompute answer keys built on this schema
+    if deployer.created_tables or previous_hashes is None:
+        reporter.update('answer_keys')
+        refreshed_keys = refresh_answer_keys_for_schema(schema.id)
+        deployer.log.append(f"Refreshed {refreshed_keys} answer key snapshots")
+    reporter.update('done')
+
+    return {
+        'table_prefix': table_prefix,
+        'tables_created': deployer.created_tables,
+        'tables_unchanged': [deployer.table_mappings[table] for table in deployer.unchanged_tables],
+        'tables_verified': deployer.verified_tables,
+        'timings': deployer.timings,
+        'counters': deployer.counters,
+        'debug_log': deployer.log,
+    }
+
+
+def run_drop_job(reporter, table_prefix):
+    """
+    Background job: drop the tables of a deleted imported schema.
+
+    Returns:
+        dict: The dropped tables
+    """
+    tables_deleted = drop_schema_tables(table_prefix, progress=reporter.update)
+    return {'table_prefix': table_prefix, 'tables_deleted': tables_deleted}
@@ -0,0 +1,109 @@
+"""
+Completion and correctness statistics for a section's students.
+
+The teacher's section page and student page both judge every assignment by
+each student's most recent submission per question, counting only the
+questions that are still part of the assignment. Rather than querying per
+student and per assignment, this module loads the question sets of all the
+assignments and the students' gradebook entries (see app.services.gradebook)
+in two queries, and works out the numbers from those in memory.
+"""
+
+from collections import defaultdict
+
+from app import db
+from app.models.assignment import AssignmentQuestion
+from app.services.gradebook import load_entries
+
+
+def load_question_sets(assignment_ids):
+    """
+    Load the questions of several assignments in one query.
+
+    Returns:
+        dict: assignment_id -> {question_id: score}; assignments without
+            questions are left out
+    """
+    question_sets = defaultdict(dict)
+    if not assignment_ids:
+        return question_sets
+    rows = (db.session.query(AssignmentQuestion.assignment_id, AssignmentQuestion.question_id,
+                             AssignmentQuestion.score)
+            .filter(AssignmentQuestion.assignment_id.in_(list(assignment_ids))))
+    for assignment_id, question_id, score in rows:
+        question_sets[assignment_id][question_id] = score
+    return question_sets
+
+
+def summarize_assignment(questions, latest):
+    """
+    Score one student's work on one assignment.
+
+    Args:
+        questions (dict): question_id -> score, from load_question_sets()
+        latest (dict): question_id -> is_correct of the student's latest submission
+
+    Returns:
+        dict: question_count, submitted_count, correct_count, progress (percent),
+            total_possible_score, earned_score and is_completed
+    """
+    submitted = [question_id for question_id in latest if question_id in questions]
+    correct = [question_id for question_id in submitted if latest[question_id]]
+    return {
+        'question_count': len(questions),
+        'submitted_count': len(submitted),
+        'correct_count': len(correct),
+        'progress': len(submitted) / len(questions) * 100 if questions else 0,
+        'total_possible_score': sum(questions.values()),
+        'earned_score': sum(questions[question_id] for question_id in correct),
+        'is_completed': len(submitted) == len(questions),
+    }
+
+
+def get_section_statistics(student_ids, assignment_ids, question_sets=None):
+    """
+    Compute per-student statistics over a set of assignments.
+
+    Args:
+        student_ids (iterable): The students to report on
+        assignment_ids (iterable): The assignments that count, e.g. those of a section
+        question_sets (dict, optional): From load_question_sets(), if the caller
+            already loaded them
+
+    Returns:
+        dict: student_id -> {
+            'total_submissions': submissions to these assignments,
+            'correct_submissions': how many of them were correct,
+            'completed_assignments': assignments whose questions all have a submission,
+            'assignments': assignment_id -> summarize_assignment() result, for
+                every assignment that has questions
+        }
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    assignment_ids = list(dict.fromkeys(assignment_ids))
+    if question_sets is None:
+        question_sets = load_question_sets(assignment_ids)
+
+    totals = {student_id: [0, 0] for student_id in student_ids}
+    # (student_id, assignment_id) -> {question_id: is_correct of the latest submission}
+    latest = defaultdict(dict)
+    for (student_id, assignment_id), entries in load_entries(student_ids, assignment_ids).items():
+        for question_id, entry in entries.items():
+            totals[student_id][0] += entry.attempts
+            totals[student_id][1] += entry.correct_attempts
+            latest[(student_id, assignment_id)][question_id] = entry.is_correct
+
+    statistics = {}
+    for student_id in student_ids:
+        assignments = {
+            assignment_id: summarize_assignment(question_sets[assignment_id],
+                                                latest.get((student_id, assignment_id), {}))
+            for assignment_id in assignment_ids if assignment_id in question_sets
+        }
+        statistics[student_id] = {
+            'total_submissions': totals[student_id][0],
+            'correct_submissions': totals[student_id][1],
+            'completed_assignments': sum(1 for summary in assignments.values() if summary['is_completed']),
+            'assignments': assignments,
+        }
+    return statistics
@@ -0,0 +1,224 @@
+"""
+Template-cloned SQLite databases for in-memory exercise questions.
+
+Questions with ``db_type == 'sqlite'`` carry their own schema script in
+``Question.sample_db_schema``. Replaying that script (CREATE TABLE and INSERT
+statements) on every query run is wasted work, so each distinct script is
+built once into an in-memory template database. Every request then gets a
+private copy made with sqlite3's online backup API, which copies pages
+instead of re-executing SQL.
+
+Templates are kept in an LRU cache bounded by their total page size:
+
+    SQLITE_TEMPLATE_CACHE_MB   memory budget for cached templates (default 64)
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def schema_cache_key(schema_sql):
+    """Return the cache key (SHA-256 hex digest) for a schema script."""
+    return hashlib.sha256((schema_sql or '').encode('utf-8')).hexdigest()
+
+
+def _build_database(schema_sql):
+    """
+    Create an in-memory database and run a schema script against it.
+
+    Statements are split on ';' exactly like the original per-request loader
+    did, so existing question schemas behave the same way.
+
+    Raises:
+        sqlite3.Error: If any schema statement fails
+    """
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    try:
+        for statement in (schema_sql or '').split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _database_size(conn):
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    return page_count * page_size
+
+
+class _Template:
+    __slots__ = ('conn', 'size', 'lock', 'users', 'evicted')
+
+    def __init__(self, conn, size):
+        self.conn = conn
+        self.size = size
+        self.lock = threading.Lock()
+        # Requests copying from the template; an evicted one is closed by the last of them
+        self.users = 0
+        self.evicted = False
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SQLiteTemplateCache:
+    """
+    Process-wide LRU cache of built schema templates.
+
+    Args:
+        max_bytes (int): Total template size to keep before evicting the
+            least recently used templates
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._templates = OrderedDict()  # cache key -> _Template
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'clones': 0}
+
+    def _get_template(self, schema_sql):
+        key = schema_cache_key(schema_sql)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self._stats['hits'] += 1
+                template.users += 1
+                return template
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given schema; the others wait for it
+        with build_lock:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is not None:
+                    self._templates.move_to_end(key)
+                    self._stats['hits'] += 1
+                    template.users += 1
+                    return template
+                self._stats['misses'] += 1
+
+            try:
+                conn = _build_database(schema_sql)
+                template = _Template(conn, _database_size(conn))
+                self._store(key, template)
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+        return template
+
+    def _store(self, key, template):
+        """Cache a new template, already acquired for the thread that built it."""
+        unused = []
+        with self._lock:
+            template.users += 1
+            self._templates[key] = template
+            self._total_bytes += template.size
+            # Always keep the newest template, even if it alone exceeds the budget
+            while self._total_bytes > self.max_bytes and len(self._templates) > 1:
+                _, old = self._templates.popitem(last=False)
+                self._total_bytes -= old.size
+                self._stats['evictions'] += 1
+                if self._retire(old):
+                    unused.append(old)
+        for old in unused:
+            old.close()
+
+    @staticmethod
+    def _retire(template):
+        """Mark a template evicted (cache lock held); True if nobody is using it and it can be closed now."""
+        template.evicted = True
+        return template.users == 0
+
+    def _release(self, template):
+        with self._lock:
+            template.users -= 1
+            unused = template.evicted and template.users == 0
+        if unused:
+            template.close()
+
+    def connect(self, schema_sql):
+        """
+        Get a private in-memory database initialised with a schema script.
+
+        Args:
+            schema_sql (str): The question's sample_db_schema
+
+        Returns:
+            sqlite3.Connection: A fresh copy the caller owns and must close
+
+        Raises:
+            sqlite3.Error: If the schema script itself is invalid
+        """
+        template = self._get_template(schema_sql)
+        try:
+            copy = sqlite3.connect(':memory:', check_same_thread=False)
+            with template.lock:
+                template.conn.backup(copy)
+        finally:
+            # An evicted template stays open until the last copy from it is made
+            self._release(template)
+        with self._lock:
+            self._stats['clones'] += 1
+        return copy
+
+    def clear(self):
+        """Drop every cached template."""
+        with self._lock:
+            unused = [template for template in self._templates.values() if self._retire(template)]
+            self._templates.clear()
+            self._total_bytes = 0
+        for template in unused:
+            template.close()
+
+    def stats(self):
+        """Return hit/miss counters and current memory use."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'templates': len(self._templates),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            })
+        return stats
+
+
+def _max_bytes_from_env():
+    try:
+        megabytes = float(os.getenv('SQLITE_TEMPLATE_CACHE_MB', 64))
+    except ValueError:
+        megabytes = 64
+    return int(megabytes * 1024 * 1024)
+
+
+template_cache = SQLiteTemplateCache(_max_bytes_from_env())
+
+
+def get_sqlite_connection(schema_sql):
+    """
+    Get a private in-memory SQLite database loaded with a question schema.
+
+    Args:
+        schema_sql (str): The question's sample_db_schema
+
+    Returns:
+        sqlite3.Connection: A fresh copy; close it when the request is done
+    """
+    logging.debug(f"Cloning SQLite template for schema {schema_cache_key(schema_sql)[:12]}")
+    return template_cache.connect(schema_sql)
+
+
+def get_template_cache_stats():
+    """Return statistics for the SQLite template cache in this process."""
+    return template_cache.stats()
@@ -0,0 +1,196 @@
+"""
+Student listings with per-student submission statistics for teachers.
+
+The teacher's Students page shows every student enrolled in one of the
+teacher's sections together with how many assignments they have, how many
+they started, and how many of their submissions were correct. Those numbers
+are computed for a whole page of students in one grouped query, and the
+list is paged with a keyset on the sort column, so a page costs the same no
+matter how far into the list it is:
+
+    TEACHER_STUDENTS_PAGE_SIZE   students per page (default 50)
+"""
+
+import base64
+import json
+import os
+
+from sqlalchemy import and_, func, or_
+
+from app import db
+from app.models.gradebook_entry import GradebookEntry
+from app.models.section import Section
+from app.models.section_assignment import SectionAssignment
+from app.models.user import StudentEnrollment, User
+
+SORT_FIELDS = {
+    'first_name': User.first_name,
+    'last_name': User.last_name,
+    'email': User.email,
+}
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+PAGE_SIZE = _env_int('TEACHER_STUDENTS_PAGE_SIZE', 50)
+
+
+def encode_cursor(value, student_id):
+    """Encode a page boundary (sort value and student id) for use in a URL."""
+    raw = json.dumps([value, student_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor().
+
+    Returns:
+        tuple: (value, student_id), or None if the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        value, student_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(value), int(student_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _teacher_enrollments(teacher_id):
+    """Active enrollments in the teacher's sections, as a (student_id, section_id) subquery."""
+    return (db.session.query(StudentEnrollment.student_id.label('student_id'),
+                             StudentEnrollment.section_id.label('section_id'))
+            .join(Section, Section.id == StudentEnrollment.section_id)
+            .filter(Section.creator_id == teacher_id,
+                    StudentEnrollment.is_active == True)
+            .subquery())
+
+
+def student_stats_query(teacher_id):
+    """
+    Build the query for the teacher's students and their statistics.
+
+    Rows are (User, total_assignments, started_assignments, total_submissions,
+    correct_submissions). Assignments are those of the student's sections
+    among the teacher's, and only submissions to them are counted.
+    """
+    enrollments = _teacher_enrollments(teacher_id)
+
+    students = db.session.query(enrollments.c.student_id).distinct().subquery()
+
+    assignment_counts = (db.session.query(enrollments.c.student_id.label('student_id'),
+                                          func.count(SectionAssignment.id).label('total'))
+                         .join(SectionAssignment, SectionAssignment.section_id == enrollments.c.section_id)
+                         .group_by(enrollments.c.student_id)
+                         .subquery())
+
+    # Submissions count if their assignment is assigned to one of the student's sections;
+    # the gradebook keeps the number of attempts per question
+    assigned = (db.session.query(SectionAssignment.id)
+                .join(enrollments, enrollments.c.section_id == SectionAssignment.section_id)
+                .filter(enrollments.c.student_id == GradebookEntry.student_id,
+                        SectionAssignment.assignment_id == GradebookEntry.assignment_id)
+                .exists())
+    submission_counts = (db.session.query(GradebookEntry.student_id.label('student_id'),
+                                          func.count(func.distinct(GradebookEntry.assignment_id)).label('started'),
+                                          func.sum(GradebookEntry.attempts).label('submissions'),
+                                          func.sum(GradebookEntry.correct_attempts).label('correct'))
+                         .filter(assigned)
+                         .group_by(GradebookEntry.student_id)
+                         .subquery())
+
+    return (db.session.query(User,
+                             func.coalesce(assignment_counts.c.total, 0),
+                             func.coalesce(submission_counts.c.started, 0),
+                             func.coalesce(submission_counts.c.submissions, 0),
+                             func.coalesce(submission_counts.c.correct, 0))
+            .join(students, students.c.student_id == User.id)
+            .outerjoin(assignment_counts, assignment_counts.c.student_id == User.id)
+            .outerjoin(submission_counts, submission_counts.c.student_id == User.id)
+            .filter(User.role == 'student'))
+
+
+def get_student_page(teacher_id, search='', sort_field='last_name', sort_order='asc',
+                     after=None, before=None, per_page=None):
+    """
+    Load one page of the teacher's students with their statistics.
+
+    Args:
+        teacher_id (int): The teacher whose sections are listed
+        search (str): Matched against first name, last name and email
+        sort_field (str): One of SORT_FIELDS; unknown values sort by last name
+        sort_order (str): 'asc' or 'desc'
+        after (str, optional): Cursor of the last row of the previous page
+        before (str, optional): Cursor of the first row of the next page, to page backwards
+        per_page (int, optional): Page size (default TEACHER_STUDENTS_PAGE_SIZE)
+
+    Returns:
+        dict: 'students' (list of User), 'stats' (student_id -> counts),
+            'total' (matching students), and 'next_cursor' / 'prev_cursor'
+            (None on the last / first page)
+    """
+    per_page = per_page or PAGE_SIZE
+    column = SORT_FIELDS.get(sort_field, User.last_name)
+    descending = sort_order == 'desc'
+
+    query = student_stats_query(teacher_id)
+    if search:
+        pattern = f'%{search}%'
+        query = query.filter(or_(User.first_name.ilike(pattern),
+                                 User.last_name.ilike(pattern),
+                                 User.email.ilike(pattern)))
+    total = query.order_by(None).count()
+
+    after, before = decode_cursor(after), decode_cursor(before)
+    backwards = before is not None and after is None
+    boundary = before if backwards else after
+    # Walk in the display order, or against it when paging backwards
+    forward = descending == backwards
+    if boundary is not None:
+        value, student_id = boundary
+        if forward:
+            query = query.filter(or_(column > value, and_(column == value, User.id > student_id)))
+        else:
+            query = query.filter(or_(column < value, and_(column == value, User.id < student_id)))
+    if forward:
+        query = query.order_by(column.asc(), User.id.asc())
+    else:
+        query = query.order_by(column.desc(), User.id.desc())
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    students = [row[0] for row in rows]
+    stats = {
+        student.id: {
+            'total_assignments': total_assignments,
+            'started_assignments': started,
+            'total_submissions': submissions,
+            'correct_submissions': correct,
+        }
+        for student, total_assignments, started, submissions, correct in rows
+    }
+
+    def cursor_of(student):
+        return encode_cursor(getattr(student, column.key), student.id)
+
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, boundary is not None
+    return {
+        'students': students,
+        'stats': stats,
+        'total': total,
+        'next_cursor': cursor_of(students[-1]) if students and has_next else None,
+        'prev_cursor': cursor_of(students[0]) if students and has_prev else None,
+    }
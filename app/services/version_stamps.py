@@ -0,0 +1,136 @@
+"""
+Version stamps for conditional GETs on the student polling APIs.
+
+``/student/api/active-assignments`` and ``/student/api/check-assignment-status``
+are fetched repeatedly by every open student page. Their answers only change
+when a section's assignments change (toggled, reassigned, edited, past due)
+or when the student's own submissions or enrollment change. Each of those
+changes bumps a counter in ``version_stamps``; the APIs derive a strong ETag
+from the counters and answer a matching ``If-None-Match`` with 304 after a
+single indexed read, without building the payload.
+
+A section stamp also records the next upcoming due date of its active
+assignments. When that moment has passed, the stamp is bumped on the next
+read, so answers that depend on the clock are refreshed as well.
+"""
+
+import hashlib
+import logging
+from datetime import datetime
+
+from flask import Response, g, jsonify, request
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.assignment import Assignment
+from app.models.section_assignment import SectionAssignment
+from app.models.version_stamp import VersionStamp
+
+SECTION = 'section'
+STUDENT = 'student'
+
+
+def _next_due_at(section_id):
+    return (db.session.query(func.min(Assignment.due_date))
+            .join(SectionAssignment, SectionAssignment.assignment_id == Assignment.id)
+            .filter(SectionAssignment.section_id == section_id,
+                    SectionAssignment.is_active == True,
+                    Assignment.due_date > datetime.now())
+            .scalar())
+
+
+def _bump(scope, scope_id):
+    values = {'version': VersionStamp.version + 1, 'updated_at': datetime.utcnow()}
+    if scope == SECTION:
+        values['next_due_at'] = _next_due_at(scope_id)
+
+    updated = (VersionStamp.query
+               .filter_by(scope=scope, scope_id=scope_id)
+               .update(values, synchronize_session=False))
+    if not updated:
+        try:
+            db.session.add(VersionStamp(scope=scope, scope_id=scope_id, version=1,
+                                        next_due_at=values.get('next_due_at')))
+            db.session.flush()
+        except IntegrityError:
+            # Another request created the stamp first
+            db.session.rollback()
+            return _bump(scope, scope_id)
+
+
+def bump_versions(section_ids=(), student_ids=()):
+    """
+    Record that sections or students changed. Call after the change has been committed.
+
+    Failures are logged rather than raised; clients then keep revalidating
+    against the old stamp until the next successful bump.
+    """
+    try:
+        for section_id in set(section_ids):
+            _bump(SECTION, section_id)
+            db.session.commit()
+        for student_id in set(student_ids):
+            _bump(STUDENT, int(student_id))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not bump version stamps for sections {list(section_ids)}, "
+                      f"students {list(student_ids)}: {e}")
+
+
+def get_versions(section_id, student_id=None, _refreshed=False):
+    """
+    Read the current counters of a section and (optionally) a student.
+
+    A missing section stamp is created, and one whose next due date has
+    passed is bumped first.
+
+    Returns:
+        tuple: (section_version, student_version); student_version is 0 if
+            the student has no stamp yet or student_id is None
+    """
+    conditions = [and_(VersionStamp.scope == SECTION, VersionStamp.scope_id == section_id)]
+    if student_id is not None:
+        conditions.append(and_(VersionStamp.scope == STUDENT, VersionStamp.scope_id == student_id))
+    stamps = {stamp.scope: stamp for stamp in VersionStamp.query.filter(or_(*conditions))}
+
+    section_stamp = stamps.get(SECTION)
+    if not _refreshed and (section_stamp is None or
+                           (section_stamp.next_due_at and section_stamp.next_due_at <= datetime.now())):
+        bump_versions(section_ids=[section_id])
+        return get_versions(section_id, student_id, _refreshed=True)
+
+    student_stamp = stamps.get(STUDENT)
+    return (section_stamp.version if section_stamp else 0,
+            student_stamp.version if student_stamp else 0)
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the values that identify a response."""
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def conditional_json(etag, build):
+    """
+    Answer with 304 if the client already holds this version, otherwise with
+    the JSON payload from ``build()``.
+
+    The response may be stored by the browser but must be revalidated on
+    every use, so the usual no-store header is not applied to it.
+
+    Args:
+        etag (str): From make_etag()
+        build (callable): Returns the JSON-serialisable payload
+
+    Returns:
+        Response: A 304 or a 200 JSON response carrying the ETag
+    """
+    g.conditional_response = True
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
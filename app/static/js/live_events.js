@@ -0,0 +1,62 @@
+// Live updates for student pages: Server-Sent Events, with slow polling as a fallback
+
+/**
+ * Subscribe to the student event stream.
+ *
+ * options.url               the event stream endpoint
+ * options.refresh()         reloads the page state; called after a reconnect and by the fallback poll
+ * options.onEvent(name, data)  called for every event received
+ * options.fallbackInterval  polling interval in ms when the stream is unavailable (default 30000)
+ */
+function subscribeToStudentEvents(options) {
+    const fallbackInterval = options.fallbackInterval || 30000;
+    const eventNames = ['assignment_status', 'assignments_changed', 'assignment_due',
+                        'enrollment_removed', 'progress', 'resync'];
+    let fallbackTimer = null;
+    let failures = 0;
+    let opened = false;
+
+    function startFallback() {
+        if (fallbackTimer === null) {
+            fallbackTimer = setInterval(options.refresh, fallbackInterval);
+        }
+    }
+
+    if (!window.EventSource) {
+        startFallback();
+        return;
+    }
+
+    const source = new EventSource(options.url);
+
+    source.onopen = function() {
+        failures = 0;
+        // Catch up on anything that changed while the stream was reconnecting
+        if (opened) {
+            options.refresh();
+        }
+        opened = true;
+    };
+
+    eventNames.forEach(function(name) {
+        source.addEventListener(name, function(e) {
+            options.onEvent(name, JSON.parse(e.data || '{}'));
+        });
+    });
+
+    source.onerror = function() {
+        failures += 1;
+        // The server answers 204 when streaming is disabled, which closes the stream for good
+        if (source.readyState === EventSource.CLOSED || failures >= 3) {
+            source.close();
+            startFallback();
+        }
+    };
+
+    window.addEventListener('beforeunload', function() {
+        source.close();
+        if (fallbackTimer !== null) {
+            clearInterval(fallbackTimer);
+        }
+    });
+}
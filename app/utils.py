@@ -2,8 +2,12 @@
 Utility functions for the SQL Classroom application.
 """
 
+import io
 import logging
+import mmap
 import os
+import re
+from collections import namedtuple
 
 def validate_dql_only_query(query):
     """
@@ -193,13 +197,145 @@ def get_prefixed_table_name(prefix, table_name):
     return f"{prefix}{clean_table_name}"
 
 
+class SchemaStatement(namedtuple('SchemaStatement', ['text', 'start', 'end'])):
+    """
+    A statement yielded by iter_schema_statements.
+    
+    ``start`` and ``end`` are byte offsets of the statement (without its
+    delimiter) in the UTF-8 encoded source; ``text`` has comments removed.
+    """
+    __slots__ = ()
+
+
+# Whitespace and comments between statements
+_LEADING_RE = re.compile(rb'(?:\s+|--(?=\s|\Z)[^\n]*|#[^\n]*|/\*.*?(?:\*/|\Z))*', re.DOTALL)
+_DELIMITER_RE = re.compile(rb'DELIMITER[ \t]+(\S+)[^\n]*', re.IGNORECASE)
+_QUOTED_PATTERNS = (
+    rb"'(?:[^'\\]|\\.|'')*(?:'|\Z)",
+    rb'"(?:[^"\\]|\\.|"")*(?:"|\Z)',
+    rb'`(?:[^`]|``)*(?:`|\Z)',
+)
+_LINE_COMMENT_RE = re.compile(rb'[^\n]*')
+_BLOCK_COMMENT_RE = re.compile(rb'/\*.*?(?:\*/|\Z)', re.DOTALL)
+
+# Statements that only make sense when replaying a dump into its own database
+_SKIPPED_STATEMENT_RE = re.compile(
+    r'(?:SET|USE|COMMIT|START\s+TRANSACTION|CREATE\s+DATABASE|CREATE\s+SCHEMA)\b', re.IGNORECASE)
+
+
+def _statement_body_re(delimiter):
+    """
+    Build a regex that consumes statement text up to the next comment or
+    delimiter, skipping over quoted strings and identifiers as a whole.
+    """
+    # Characters that may start a comment or the delimiter, and what they must not be followed by
+    stops = {b'-': [rb'-(?=\s|\Z)'], b'/': [rb'\*']}
+    first, rest = delimiter[:1], delimiter[1:]
+    stops.setdefault(first, []).append(re.escape(rest) if rest else b'')
+    
+    alternatives = [rb"[^'\"`#" + b''.join(re.escape(c) for c in stops) + rb"]+"]
+    alternatives.extend(_QUOTED_PATTERNS)
+    for char, followers in stops.items():
+        if b'' in followers:
+            continue  # single-character delimiter: always a stop
+        alternatives.append(re.escape(char) + rb'(?!' + b'|'.join(followers) + rb')')
+    return re.compile(rb'(?:' + b'|'.join(alternatives) + rb')*', re.DOTALL)
+
+
+def _schema_buffer(source):
+    """Return a bytes-like view of a schema source and a cleanup callback."""
+    if source is None:
+        return b'', None
+    if isinstance(source, str):
+        return source.encode('utf-8'), None
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return source, None
+    
+    # File object: map real files into memory, read anything else
+    try:
+        fileno = source.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is not None and 'b' in getattr(source, 'mode', 'b'):
+        try:
+            mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            return mapped, mapped.close
+        except (ValueError, OSError):
+            pass  # empty or unmappable file
+    content = source.read()
+    return (content.encode('utf-8') if isinstance(content, str) else content), None
+
+
+def iter_schema_statements(source):
+    """
+    Lazily split a SQL dump into statements in a single linear pass.
+    
+    Understands single/double-quoted strings with backslash escapes,
+    backtick identifiers, ``--``, ``#`` and ``/* */`` comments (including
+    MySQL ``/*! */`` version comments, which are dropped) and ``DELIMITER``
+    directives as used around triggers and procedures. SET, USE, COMMIT,
+    START TRANSACTION and CREATE DATABASE/SCHEMA statements are skipped.
+    
+    Args:
+        source: SQL as str, bytes, memoryview or mmap, or a file object
+            (binary files are memory-mapped instead of read)
+        
+    Yields:
+        SchemaStatement: Each statement with its byte offsets in the source
+    """
+    buf, cleanup = _schema_buffer(source)
+    try:
+        length = len(buf)
+        delimiter = b';'
+        body = _statement_body_re(delimiter)
+        pos = 0
+        
+        while pos < length:
+            pos = _LEADING_RE.match(buf, pos).end()
+            if pos >= length:
+                break
+            
+            directive = _DELIMITER_RE.match(buf, pos)
+            if directive:
+                delimiter = bytes(directive.group(1))
+                body = _statement_body_re(delimiter)
+                pos = directive.end()
+                continue
+            
+            start = pos
+            segments = []
+            segment_start = pos
+            while True:
+                pos = body.match(buf, pos).end()
+                if pos >= length or buf[pos:pos + len(delimiter)] == delimiter:
+                    end = pos
+                    pos += len(delimiter)
+                    break
+                # Comment inside a statement: cut it out
+                segments.append(buf[segment_start:pos])
+                if buf[pos:pos + 2] == b'/*':
+                    pos = _BLOCK_COMMENT_RE.match(buf, pos).end()
+                else:
+                    pos = _LINE_COMMENT_RE.match(buf, pos).end()
+                segment_start = pos
+            segments.append(buf[segment_start:end])
+            
+            text = b' '.join(bytes(segment) for segment in segments).decode('utf-8', 'replace').strip()
+            if text and not _SKIPPED_STATEMENT_RE.match(text):
+                yield SchemaStatement(text, start, end)
+    finally:
+        if cleanup:
+            cleanup()
+
+
 def parse_schema_statements(schema_content):
     """
     Parse SQL schema content into individual statements.
     Handles phpMyAdmin dumps and complex SQL files with comments.
     
     Args:
-        schema_content (str): The raw SQL schema content
+        schema_content (str): The raw SQL schema content (or any source
+            accepted by iter_schema_statements)
         
     Returns:
         list: List of SQL statements
@@ -207,70 +343,7 @@ def parse_schema_statements(schema_content):
     if not schema_content:
         return []
     
-    # Remove MySQL-specific commands that we don't need
-    lines = schema_content.split('\n')
-    cleaned_lines = []
-    
-    for line in lines:
-        stripped = line.strip()
-        
-        # Skip comments and MySQL-specific commands
-        if (stripped.startswith('--') or 
-            stripped.startswith('/*') or
-            stripped.startswith('*/') or
-            stripped.startswith('SET ') or
-            stripped.startswith('START TRANSACTION') or
-            stripped.startswith('COMMIT') or
-            stripped.startswith('USE ') or
-            stripped.startswith('/*!') or
-            stripped == '' or
-            'phpMyAdmin' in stripped):
-            continue
-            
-        cleaned_lines.append(line)
-    
-    # Join back and split by semicolons
-    cleaned_content = '\n'.join(cleaned_lines)
-    
-    # Split by semicolon but be smarter about it
-    statements = []
-    current_statement = ""
-    in_string = False
-    
-    i = 0
-    while i < len(cleaned_content):
-        char = cleaned_content[i]
-        
-        if char == "'" and (i == 0 or cleaned_content[i-1] != '\\'):
-            in_string = not in_string
-        elif char == ';' and not in_string:
-            # End of statement
-            stmt = current_statement.strip()
-            if stmt and not stmt.startswith('--'):
-                # Filter out CREATE DATABASE and USE statements
-                stmt_upper = stmt.upper().strip()
-                if (not stmt_upper.startswith('CREATE DATABASE') and 
-                    not stmt_upper.startswith('CREATE SCHEMA') and
-                    not stmt_upper.startswith('USE ')):
-                    statements.append(stmt)
-            current_statement = ""
-            i += 1
-            continue
-            
-        current_statement += char
-        i += 1
-    
-    # Add final statement if it doesn't end with semicolon
-    final_stmt = current_statement.strip()
-    if final_stmt and not final_stmt.startswith('--'):
-        # Filter out CREATE DATABASE and USE statements for final statement too
-        stmt_upper = final_stmt.upper().strip()
-        if (not stmt_upper.startswith('CREATE DATABASE') and 
-            not stmt_upper.startswith('CREATE SCHEMA') and
-            not stmt_upper.startswith('USE ')):
-            statements.append(final_stmt)
-    
-    return statements
+    return [statement.text for statement in iter_schema_statements(schema_content)]
 
 
 def modify_create_table_statement(statement, table_prefix):
@@ -290,7 +363,7 @@ def modify_create_table_statement(statement, table_prefix):
     import re
     
     # Use regex to find and replace the table name after CREATE TABLE
-    pattern = r'CREATE\s+TABLE\s+`?([^`\s(]+)`?'
+    pattern = r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?([^`\s(]+)`?'
     match = re.search(pattern, statement, re.IGNORECASE)
     
     if match:
@@ -455,10 +528,196 @@ def is_show_tables_query(query):
     return query_upper.startswith('SHOW TABLES')
 
 
+def extract_table_names(schema_content):
+    """
+    Extract the names of the tables created by a schema script.
+    
+    Args:
+        schema_content (str): The raw SQL schema content
+        
+    Returns:
+        list: Table names in the order they are created
+    """
+    return [extract_create_table_name(stmt) for stmt in parse_schema_statements(schema_content)
+            if stmt.upper().strip().startswith('CREATE TABLE')]
+
+
+def extract_create_table_name(statement):
+    """
+    Get the table name created by a CREATE TABLE statement.
+    
+    Args:
+        statement (str): A CREATE TABLE statement
+        
+    Returns:
+        str: The table name without backticks
+    """
+    table_start = statement.upper().find('TABLE') + 5
+    table_part = statement[table_start:].strip()
+    if table_part.upper().startswith('IF NOT EXISTS'):
+        table_part = table_part[13:].strip()
+    return table_part.split()[0].strip('`').split('(')[0].strip('`')
+
+
+_SQL_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^'\\]|\\.|'')*(?:'|\Z)|"(?:[^"\\]|\\.|"")*(?:"|\Z))
+  | (?P<quoted>`(?:[^`]|``)*(?:`|\Z))
+  | (?P<word>[^\W]+|\$+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Keywords after which a table reference follows
+_TABLE_KEYWORDS = {'FROM', 'JOIN', 'STRAIGHT_JOIN', 'UPDATE', 'INTO', 'TABLE'}
+
+# Keywords that end a FROM clause's comma-separated table list
+_CLAUSE_KEYWORDS = {
+    'WHERE', 'ON', 'USING', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'UNION', 'EXCEPT',
+    'INTERSECT', 'WINDOW', 'SET', 'VALUES', 'VALUE', 'SELECT', 'FOR', 'LOCK', 'INTO',
+}
+
+# Words that can follow a table reference without being its alias
+_NON_ALIAS_KEYWORDS = _CLAUSE_KEYWORDS | _TABLE_KEYWORDS | {
+    'AS', 'INNER', 'CROSS', 'LEFT', 'RIGHT', 'FULL', 'OUTER', 'NATURAL', 'PARTITION',
+    'USE', 'FORCE', 'IGNORE', 'INDEX', 'KEY', 'WITH', 'AND', 'OR', 'NOT', 'LATERAL',
+    'STRAIGHT_JOIN', 'DUAL', 'ROWS', 'RANGE', 'OFFSET',
+}
+
+
+def _tokenize_sql(query):
+    """Split a query into (kind, text) tokens without losing any characters."""
+    return [(match.lastgroup, match.group()) for match in _SQL_TOKEN_RE.finditer(query)]
+
+
+def _identifier_name(kind, text):
+    if kind == 'quoted':
+        return text[1:-1].replace('``', '`') if text.endswith('`') and len(text) > 1 else None
+    if kind == 'word' and not text[0].isdigit():
+        return text
+    return None
+
+
+def rewrite_table_references(query, table_names, table_prefix):
+    """
+    Prefix the table names referenced by a query in a single tokenizer pass.
+    
+    Only identifiers in table positions are rewritten: the table list after
+    FROM/JOIN/UPDATE/INTO/TABLE (or a leading DESCRIBE), including
+    parenthesized lists such as ``JOIN (orders o JOIN payments p ON ...)``,
+    and qualifiers such as ``customers.name``. String literals, comments, column names and table
+    aliases are never touched.
+    
+    Args:
+        query (str): The original SQL query
+        table_names (iterable): Table names defined by the imported schema
+        table_prefix (str): The prefix to add to table names
+        
+    Returns:
+        str: The rewritten query with prefixed table names
+    """
+    if not query or not table_names or not table_prefix:
+        return query
+    
+    tables = {name.lower(): name for name in table_names}
+    tokens = _tokenize_sql(query)
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind not in ('space', 'comment')]
+    
+    replacements = {}  # token index -> canonical table name
+    qualifiers = []  # (token index, lowercase name) of "name." qualifiers
+    aliases = set()
+    from_clause = [False]  # per parenthesis depth
+    in_expression = [False]  # per parenthesis depth: EXTRACT(YEAR FROM ...) etc.
+    expect_table = False
+    
+    def upper_word(pos):
+        if 0 <= pos < len(significant):
+            kind, text = tokens[significant[pos]]
+            if kind == 'word':
+                return text.upper()
+        return None
+    
+    def text_at(pos):
+        return tokens[significant[pos]][1] if 0 <= pos < len(significant) else None
+    
+    pos = 0
+    if upper_word(0) in ('DESCRIBE', 'DESC', 'EXPLAIN'):
+        expect_table = True
+        pos = 1
+    
+    while pos < len(significant):
+        index = significant[pos]
+        kind, text = tokens[index]
+        word = text.upper() if kind == 'word' else None
+        
+        if text == '(' and expect_table and upper_word(pos + 1) not in ('SELECT', 'WITH'):
+            # FROM (a, b) / JOIN (a JOIN b ON ...): a parenthesized table list
+            from_clause.append(True)
+            in_expression.append(False)
+        elif text == '(':
+            from_clause.append(False)
+            in_expression.append(upper_word(pos + 1) not in ('SELECT', 'WITH', '('))
+            expect_table = False
+        elif text == ')':
+            if len(from_clause) > 1:
+                from_clause.pop()
+                in_expression.pop()
+            expect_table = False
+        elif text == ',':
+            expect_table = from_clause[-1]
+        elif word in _TABLE_KEYWORDS and not in_expression[-1]:
+            expect_table = True
+            from_clause[-1] = word in ('FROM', 'JOIN', 'STRAIGHT_JOIN', 'UPDATE')
+        elif word in _CLAUSE_KEYWORDS:
+            from_clause[-1] = False
+            expect_table = False
+        else:
+            name = _identifier_name(kind, text)
+            if name is not None and expect_table:
+                expect_table = False
+                if text_at(pos + 1) == '.':
+                    # database.table: the table belongs to another database
+                    pos += 3
+                    continue
+                if name.lower() in tables:
+                    replacements[index] = tables[name.lower()]
+                # An alias may follow the table reference, with or without AS
+                alias_pos = pos + 2 if upper_word(pos + 1) == 'AS' else pos + 1
+                if alias_pos < len(significant):
+                    alias_kind, alias_text = tokens[significant[alias_pos]]
+                    alias = _identifier_name(alias_kind, alias_text)
+                    if alias is not None and (alias_kind == 'quoted' or alias.upper() not in _NON_ALIAS_KEYWORDS):
+                        aliases.add(alias.lower())
+                        pos = alias_pos + 1
+                        continue
+            elif name is not None and text_at(pos + 1) == '.' and text_at(pos - 1) != '.':
+                qualifiers.append((index, name.lower()))
+        pos += 1
+    
+    for index, name in qualifiers:
+        if name in tables and name not in aliases:
+            replacements[index] = tables[name]
+    
+    if not replacements:
+        return query
+    
+    parts = []
+    for index, (kind, text) in enumerate(tokens):
+        if index in replacements:
+            parts.append(f"`{table_prefix}{replacements[index]}`")
+        else:
+            parts.append(text)
+    return ''.join(parts)
+
+
 def rewrite_query_for_schema(query, schema_content, table_prefix):
     """
     Rewrite a SQL query to use prefixed table names for imported schemas.
     
+    Parses the whole schema script to find its tables; callers holding a
+    SchemaImport should use app.services.query_rewrite instead, which keeps
+    the table index and rewritten queries cached.
+    
     Args:
         query (str): The original SQL query
         schema_content (str): The schema content to extract table names from
@@ -470,43 +729,7 @@ def rewrite_query_for_schema(query, schema_content, table_prefix):
     if not query or not schema_content or not table_prefix:
         return query
     
-    # Extract table names from schema content
-    table_names = []
-    statements = parse_schema_statements(schema_content)
-    
-    for stmt in statements:
-        if stmt.upper().strip().startswith('CREATE TABLE'):
-            # Extract table name using the same logic as in import
-            table_start = stmt.upper().find('TABLE') + 5
-            table_part = stmt[table_start:].strip()
-            table_name = table_part.split()[0].strip('`').rstrip('(').strip('`')
-            table_names.append(table_name)
-    
-    logging.debug(f"Query rewriting - Found table names: {table_names}")
-    logging.debug(f"Query rewriting - Original query: {query}")
-    
-    
-    # Apply query rewriting
-    import re
-    modified_query = query
-    for table_name in table_names:
-        # First replace backticked table names: `tablename`
-        backticked_pattern = r'`' + re.escape(table_name) + r'`'
-        prefixed_table = f"{table_prefix}{table_name}"
-        old_query = modified_query
-        modified_query = re.sub(backticked_pattern, f"`{prefixed_table}`", modified_query, flags=re.IGNORECASE)
-        if old_query != modified_query:
-            logging.debug(f"Query rewriting - Replaced backticked '{table_name}' with '{prefixed_table}'")
-
-        # Then replace non-backticked table names with word boundaries
-        word_boundary_pattern = r'\b' + re.escape(table_name) + r'\b'
-        old_query = modified_query
-        modified_query = re.sub(word_boundary_pattern, f"`{prefixed_table}`", modified_query, flags=re.IGNORECASE)
-        if old_query != modified_query:
-            logging.debug(f"Query rewriting - Replaced non-backticked '{table_name}' with '{prefixed_table}'")
-
-    logging.debug(f"Query rewriting - Final query: {modified_query}")
-    return modified_query
+    return rewrite_table_references(query, extract_table_names(schema_content), table_prefix)
 
 
 def is_show_databases_query(query):
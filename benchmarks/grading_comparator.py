@@ -0,0 +1,112 @@
+"""
+Benchmark: streaming fingerprint grading vs. the legacy pandas comparison.
+
+Builds an in-memory SQLite table, then grades a "student" query against a
+"teacher" query both ways and reports wall time and peak Python memory.
+
+Usage:
+    python benchmarks/grading_comparator.py [--rows 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+
+from app.services.grading import ResultComparator, ResultFingerprint
+
+
+def build_database(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, customer TEXT, amount REAL, status TEXT)')
+    conn.executemany(
+        'INSERT INTO orders VALUES (?, ?, ?, ?)',
+        ((i, f'customer_{i % 997}', (i * 7919 % 100000) / 100.0, 'shipped' if i % 3 else 'pending')
+         for i in range(rows))
+    )
+    conn.commit()
+    return conn
+
+
+def legacy_grade(conn, student_query, teacher_query):
+    """The pandas path submit_answer used before answer-key snapshots."""
+    def fetch(query):
+        cursor = conn.execute(query)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def ensure_serializable(data_list):
+        result = []
+        for item in data_list:
+            serializable_item = {}
+            for key, value in item.items():
+                if isinstance(value, (dict, list, str, int, float, bool, type(None))):
+                    serializable_item[key] = value
+                else:
+                    serializable_item[key] = str(value)
+            result.append(serializable_item)
+        return result
+
+    student_data = ensure_serializable(fetch(student_query))
+    teacher_data = ensure_serializable(fetch(teacher_query))
+    student_result = pd.DataFrame(student_data) if student_data else pd.DataFrame()
+    teacher_result = pd.DataFrame(teacher_data) if teacher_data else pd.DataFrame()
+    return student_result.equals(teacher_result)
+
+
+def streaming_grade(conn, student_query, teacher_query):
+    comparator = ResultComparator(ordered=True, float_places=6)
+    expected = ResultFingerprint.from_cursor(conn.execute(teacher_query), float_places=6)
+    actual = ResultFingerprint.from_cursor(conn.execute(student_query), float_places=6)
+    return comparator.matches(expected, actual)
+
+
+def snapshot_grade(conn, student_query, expected):
+    """Streaming comparison against a stored answer key, as submit_answer does."""
+    comparator = ResultComparator(ordered=True, float_places=6)
+    actual = ResultFingerprint.from_cursor(conn.execute(student_query), float_places=6)
+    return comparator.matches(expected, actual)
+
+
+def measure(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    conn = build_database(args.rows)
+    teacher_query = 'SELECT id, customer, amount, status FROM orders ORDER BY id'
+    student_query = 'SELECT o.id, o.customer, o.amount, o.status FROM orders o ORDER BY o.id'
+
+    answer_key = ResultFingerprint.from_cursor(conn.execute(teacher_query), float_places=6)
+
+    print(f"Grading a {args.rows}-row result (best of {args.repeat})")
+    for name, func, expected in (('pandas DataFrame.equals', legacy_grade, teacher_query),
+                                 ('streaming, both queries', streaming_grade, teacher_query),
+                                 ('streaming, stored key', snapshot_grade, answer_key)):
+        result, seconds, peak = measure(func, conn, student_query, expected, repeat=args.repeat)
+        print(f"  {name:<24} correct={result!s:<5} {seconds * 1000:9.1f} ms   peak {peak / 1024 / 1024:7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: login latency during a login storm, with and without a bound on concurrent hashing.
+
+Creates a throwaway SQLite database of synthetic students, then has all of
+them log in at once through the login view (one thread per student) while a
+few other threads keep running the kind of short queries student pages make.
+Each scenario installs a password hashing pool of a different size: one
+worker per login approximates the previous behaviour, where every request
+hashed on its own thread. Reports login and query latency percentiles and
+how many logins were turned away or upgraded their stored hash.
+
+Usage:
+    python benchmarks/login_storm.py [--students 120] [--workers 2,4] [--query-threads 4]
+                                     [--seed-method pbkdf2:sha256:100000]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'sql_classroom_login_benchmark.sqlite3')
+os.environ['DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import User
+from app.services import passwords
+
+PASSWORD = 'lab-password'
+
+
+def build_database(students, seed_method):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    db.create_all()
+    password_hash = generate_password_hash(PASSWORD, method=seed_method)
+    db.session.bulk_insert_mappings(User, [
+        {'username': f'student{number}', 'email': f'student{number}@example.com', 'role': 'student',
+         'first_name': f'First{number}', 'last_name': f'Last{number}', 'password_hash': password_hash}
+        for number in range(students)])
+    db.session.commit()
+    return password_hash
+
+
+def reset_hashes(password_hash):
+    User.query.update({'password_hash': password_hash})
+    db.session.commit()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_storm(app, students, query_threads):
+    start_line = threading.Barrier(students + 1)
+    done = threading.Event()
+    login_times, query_times, statuses = [], [], []
+    lock = threading.Lock()
+
+    def log_in(number):
+        client = app.test_client()
+        start_line.wait()
+        start = time.perf_counter()
+        response = client.post('/login', data={'username': f'student{number}', 'password': PASSWORD})
+        elapsed = time.perf_counter() - start
+        with lock:
+            login_times.append(elapsed)
+            statuses.append(response.status_code)
+
+    def query_traffic(number):
+        while not done.is_set():
+            with app.app_context():
+                start = time.perf_counter()
+                User.query.filter_by(username=f'student{number}').first()
+                elapsed = time.perf_counter() - start
+                db.session.remove()
+            with lock:
+                query_times.append(elapsed)
+
+    queries = [threading.Thread(target=query_traffic, args=(number,)) for number in range(query_threads)]
+    logins = [threading.Thread(target=log_in, args=(number,)) for number in range(students)]
+    for thread in queries + logins:
+        thread.start()
+    start_line.wait()
+    started = time.perf_counter()
+    for thread in logins:
+        thread.join()
+    wall = time.perf_counter() - started
+    done.set()
+    for thread in queries:
+        thread.join()
+    return wall, login_times, query_times, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=120)
+    parser.add_argument('--workers', default='2,4', help='comma-separated pool sizes to compare')
+    parser.add_argument('--query-threads', type=int, default=4)
+    parser.add_argument('--timeout', type=int, default=60, help='seconds a login waits for the pool')
+    parser.add_argument('--seed-method', default=passwords.hash_method(),
+                        help='hash method of the stored passwords (differs from PASSWORD_HASH_METHOD '
+                             'to measure upgrades on login)')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    # One "upgraded password hash" line per login would drown the results
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        password_hash = build_database(args.students, args.seed_method)
+        db.session.remove()
+
+    print(f"{args.students} simultaneous logins, {args.query_threads} query threads, "
+          f"stored {args.seed_method}, current {passwords.hash_method()}")
+    scenarios = [('one per login', args.students)]
+    scenarios += [(f'{workers} workers', workers) for workers in map(int, args.workers.split(','))]
+    for name, workers in scenarios:
+        with app.app_context():
+            reset_hashes(password_hash)
+            db.session.remove()
+        passwords._pool = passwords.HashingPool(workers=workers, timeout=args.timeout)
+        passwords._pool_pid = os.getpid()
+
+        wall, login_times, query_times, statuses = run_storm(app, args.students, args.query_threads)
+        with app.app_context():
+            upgraded = User.query.filter(User.password_hash != password_hash).count()
+            db.session.remove()
+        print(f"  {name:<14} wall {wall:6.2f} s   login p50 {statistics.median(login_times) * 1000:7.0f} ms "
+              f"p95 {percentile(login_times, 0.95) * 1000:7.0f} ms   "
+              f"query p50 {statistics.median(query_times or [0]) * 1000:6.1f} ms "
+              f"p95 {percentile(query_times, 0.95) * 1000:6.1f} ms   "
+              f"busy {statuses.count(503)}   upgraded {upgraded}")
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark: section result export, legacy in-memory workbook vs. the streaming engine.
+
+Creates a throwaway SQLite database with one section of synthetic students,
+assignments and submissions, then exports the section results the way
+export_section_results used to (a full openpyxl Workbook filled cell by cell,
+with two queries per student per assignment) and with app.services.exports
+as XLSX and CSV. Reports wall time and peak Python memory of each.
+
+Usage:
+    python benchmarks/result_export.py [--students 200] [--assignments 30] [--questions 10] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'sql_classroom_export_benchmark.sqlite3')
+os.environ['DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+
+from openpyxl import Workbook
+
+from app import create_app, db
+from app.models import (Assignment, AssignmentQuestion, Question, Section, SectionAssignment, StudentEnrollment,
+                        Submission, User)
+from app.services.exports import section_results, write_export
+from app.services.gradebook import rebuild_gradebook
+
+
+def build_database(students, assignments, questions):
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    db.create_all()
+    random.seed(42)
+
+    teacher = User(username='teacher', email='teacher@example.com', role='teacher', password_hash='x')
+    db.session.add(teacher)
+    db.session.flush()
+    section = Section(name='Benchmark section', creator_id=teacher.id)
+    db.session.add(section)
+    db.session.flush()
+
+    question_ids = []
+    for number in range(questions * 3):
+        question = Question(title=f'Question {number}', description='...', question_type='sql', difficulty=1,
+                            correct_answer='SELECT 1', author_id=teacher.id)
+        db.session.add(question)
+        db.session.flush()
+        question_ids.append(question.id)
+
+    assignment_questions = {}
+    for number in range(assignments):
+        assignment = Assignment(title=f'Assignment {number}', creator_id=teacher.id)
+        db.session.add(assignment)
+        db.session.flush()
+        db.session.add(SectionAssignment(section_id=section.id, assignment_id=assignment.id, is_active=True))
+        chosen = random.sample(question_ids, questions)
+        assignment_questions[assignment.id] = chosen
+        db.session.add_all(AssignmentQuestion(assignment_id=assignment.id, question_id=question_id,
+                                              order=order, score=10)
+                           for order, question_id in enumerate(chosen, 1))
+
+    now = datetime.utcnow()
+    submissions = []
+    for number in range(students):
+        student = User(username=f'student{number}', email=f'student{number}@example.com', role='student',
+                       first_name=f'First{number}', last_name=f'Last{number}', password_hash='x')
+        db.session.add(student)
+        db.session.flush()
+        db.session.add(StudentEnrollment(student_id=student.id, section_id=section.id, is_active=True))
+        for assignment_id, chosen in assignment_questions.items():
+            for question_id in chosen:
+                if random.random() < 0.8:
+                    submissions.append({'student_id': student.id, 'assignment_id': assignment_id,
+                                        'question_id': question_id, 'submitted_answer': 'SELECT 1',
+                                        'is_correct': random.random() < 0.6,
+                                        'submitted_at': now - timedelta(minutes=random.randint(0, 10000))})
+    db.session.bulk_insert_mappings(Submission, submissions)
+    db.session.commit()
+    rebuild_gradebook()
+    return section.id, len(submissions)
+
+
+def legacy_export(section_id, fileobj):
+    """The previous export_section_results body, without the Flask response."""
+    section = Section.query.get(section_id)
+    students = section.get_enrolled_students(active_only=True)
+    section_assignments = SectionAssignment.query.filter_by(section_id=section.id).all()
+    assignments = sorted((sa.assignment for sa in section_assignments), key=lambda a: a.id)
+
+    wb = Workbook()
+    ws = wb.active
+    headers = ["No.", "Last Name", "First Name", "Section"]
+    for assignment in assignments:
+        headers += [assignment.title, "Raw Score"]
+    headers += ["Total Score", "Raw Total"]
+    for col_num, header in enumerate(headers, 1):
+        ws.cell(row=1, column=col_num, value=header)
+
+    for idx, student in enumerate(students, 1):
+        row_num = idx + 1
+        student_total_score = student_total_possible = 0
+        ws.cell(row=row_num, column=1, value=idx)
+        ws.cell(row=row_num, column=2, value=str(student.last_name or ""))
+        ws.cell(row=row_num, column=3, value=str(student.first_name or ""))
+        ws.cell(row=row_num, column=4, value=str(section.name))
+        col_idx = 5
+        for assignment in assignments:
+            assignment_questions = AssignmentQuestion.query.filter_by(assignment_id=assignment.id).all()
+            question_ids = [aq.question_id for aq in assignment_questions]
+            question_scores = {aq.question_id: aq.score for aq in assignment_questions}
+            submissions = Submission.summary_query().filter_by(student_id=student.id,
+                                                               assignment_id=assignment.id).all()
+            latest_submissions = {}
+            for submission in submissions:
+                question_id = submission.question_id
+                if (question_id not in latest_submissions or
+                        submission.submitted_at > latest_submissions[question_id].submitted_at):
+                    latest_submissions[question_id] = submission
+            earned_points = sum(question_scores.get(question_id, 0) for question_id in question_ids
+                                if question_id in latest_submissions and latest_submissions[question_id].is_correct)
+            assignment_total_possible = sum(question_scores.values())
+            student_total_score += earned_points
+            student_total_possible += assignment_total_possible
+            ws.cell(row=row_num, column=col_idx, value=f"{earned_points}/{assignment_total_possible}")
+            ws.cell(row=row_num, column=col_idx + 1, value=float(earned_points))
+            col_idx += 2
+        ws.cell(row=row_num, column=col_idx, value=f"{student_total_score}/{student_total_possible}")
+        ws.cell(row=row_num, column=col_idx + 1, value=float(student_total_score))
+    wb.save(fileobj)
+
+
+def streaming_export(export_format):
+    def run(section_id, fileobj):
+        write_export(section_results(Section.query.get(section_id)), export_format, fileobj)
+    return run
+
+
+def measure(func, section_id, repeat=3):
+    best, size = float('inf'), 0
+    for _ in range(repeat):
+        db.session.expire_all()
+        with tempfile.TemporaryFile() as fileobj:
+            start = time.perf_counter()
+            func(section_id, fileobj)
+            best = min(best, time.perf_counter() - start)
+            size = fileobj.tell()
+
+    db.session.expire_all()
+    tracemalloc.start()
+    with tempfile.TemporaryFile() as fileobj:
+        func(section_id, fileobj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--assignments', type=int, default=30)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        section_id, submission_count = build_database(args.students, args.assignments, args.questions)
+        print(f"Exporting {args.students} students x {args.assignments} assignments "
+              f"({submission_count} submissions, best of {args.repeat})")
+        for name, func in (('legacy workbook', legacy_export),
+                           ('streaming xlsx', streaming_export('xlsx')),
+                           ('streaming csv', streaming_export('csv'))):
+            seconds, peak, size = measure(func, section_id, repeat=args.repeat)
+            print(f"  {name:<16} {seconds * 1000:9.1f} ms   peak {peak / 1024 / 1024:7.1f} MiB   "
+                  f"file {size / 1024:8.1f} KiB")
+        db.session.remove()
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
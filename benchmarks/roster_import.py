@@ -0,0 +1,101 @@
+"""
+Benchmark: enrolling a roster one registration at a time vs. the bulk roster import.
+
+Creates a throwaway SQLite database with one section, writes a CSV roster of
+synthetic students, then times:
+
+  * one by one: what registering through the invitation link does for each
+    student (hash the password, insert the user, flush, insert the
+    enrollment, commit), measured on --sample rows and extrapolated;
+  * roster import: app.services.roster_import on the whole file, once with
+    passwords in the file (hashed with PASSWORD_HASH_METHOD) and once
+    without (temporary passwords, hashed with ROSTER_TEMP_HASH_METHOD).
+
+Usage:
+    python benchmarks/roster_import.py [--students 2000] [--sample 50] [--processes 4]
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.gettempdir(), 'sql_classroom_roster_benchmark.sqlite3')
+os.environ['DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+
+from app import create_app, db
+from app.models import Section, StudentEnrollment, User
+from app.services.roster_import import import_roster
+
+
+def build_database():
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    db.create_all()
+    teacher = User(username='teacher', email='teacher@example.com', role='teacher', password_hash='x')
+    db.session.add(teacher)
+    db.session.flush()
+    section = Section(name='Benchmark section', creator_id=teacher.id)
+    db.session.add(section)
+    db.session.commit()
+    return section
+
+
+def roster_csv(prefix, students, with_passwords):
+    lines = ['username,email,first_name,last_name,password']
+    for number in range(students):
+        password = f'pass{number}word' if with_passwords else ''
+        lines.append(f'{prefix}{number},{prefix}{number}@example.com,First{number},Last{number},{password}')
+    return io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def one_by_one(section, prefix, students):
+    for number in range(students):
+        user = User(username=f'{prefix}{number}', email=f'{prefix}{number}@example.com',
+                    first_name=f'First{number}', last_name=f'Last{number}', role='student')
+        user.set_password(f'pass{number}word')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(StudentEnrollment(student_id=user.id, section_id=section.id, is_active=True))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--sample', type=int, default=50, help='rows registered one by one (extrapolated)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    os.environ['ROSTER_IMPORT_PROCESSES'] = str(args.processes)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    app = create_app()
+    with app.app_context():
+        section = build_database()
+        print(f"Enrolling {args.students} students ({args.processes} hashing processes)")
+
+        start = time.perf_counter()
+        one_by_one(section, 'single', args.sample)
+        seconds = (time.perf_counter() - start) / args.sample * args.students
+        print(f"  {'one by one (extrapolated)':<34} {seconds:8.1f} s")
+
+        for name, prefix, with_passwords in (('roster import, passwords in file', 'given', True),
+                                             ('roster import, temporary passwords', 'temp', False)):
+            fileobj = roster_csv(prefix, args.students, with_passwords)
+            start = time.perf_counter()
+            result = import_roster(section, fileobj, 'roster.csv')
+            seconds = time.perf_counter() - start
+            print(f"  {name:<34} {seconds:8.1f} s   created {len(result['created'])}   "
+                  f"errors {len(result['errors'])}")
+        db.session.remove()
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: streaming schema dump parser vs. the legacy character-by-character
+splitter that parse_schema_statements used to be.
+
+Parses the bundled classicmodels_db.sql, plus a larger synthetic dump built
+by repeating its INSERT statements, and reports the best wall time of each.
+
+Usage:
+    python benchmarks/schema_parser.py [--scale 50] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.utils import iter_schema_statements
+
+
+def legacy_parse_schema_statements(schema_content):
+    """The previous implementation, kept verbatim for comparison."""
+    if not schema_content:
+        return []
+    
+    # Remove MySQL-specific commands that we don't need
+    lines = schema_content.split('\n')
+    cleaned_lines = []
+    
+    for line in lines:
+        stripped = line.strip()
+        
+        # Skip comments and MySQL-specific commands
+        if (stripped.startswith('--') or 
+            stripped.startswith('/*') or
+            stripped.startswith('*/') or
+            stripped.startswith('SET ') or
+            stripped.startswith('START TRANSACTION') or
+            stripped.startswith('COMMIT') or
+            stripped.startswith('USE ') or
+            stripped.startswith('/*!') or
+            stripped == '' or
+            'phpMyAdmin' in stripped):
+            continue
+            
+        cleaned_lines.append(line)
+    
+    # Join back and split by semicolons
+    cleaned_content = '\n'.join(cleaned_lines)
+    
+    # Split by semicolon but be smarter about it
+    statements = []
+    current_statement = ""
+    in_string = False
+    
+    i = 0
+    while i < len(cleaned_content):
+        char = cleaned_content[i]
+        
+        if char == "'" and (i == 0 or cleaned_content[i-1] != '\\'):
+            in_string = not in_string
+        elif char == ';' and not in_string:
+            # End of statement
+            stmt = current_statement.strip()
+            if stmt and not stmt.startswith('--'):
+                # Filter out CREATE DATABASE and USE statements
+                stmt_upper = stmt.upper().strip()
+                if (not stmt_upper.startswith('CREATE DATABASE') and 
+                    not stmt_upper.startswith('CREATE SCHEMA') and
+                    not stmt_upper.startswith('USE ')):
+                    statements.append(stmt)
+            current_statement = ""
+            i += 1
+            continue
+            
+        current_statement += char
+        i += 1
+    
+    # Add final statement if it doesn't end with semicolon
+    final_stmt = current_statement.strip()
+    if final_stmt and not final_stmt.startswith('--'):
+        # Filter out CREATE DATABASE and USE statements for final statement too
+        stmt_upper = final_stmt.upper().strip()
+        if (not stmt_upper.startswith('CREATE DATABASE') and 
+            not stmt_upper.startswith('CREATE SCHEMA') and
+            not stmt_upper.startswith('USE ')):
+            statements.append(final_stmt)
+    
+    return statements
+
+
+def streaming_parse(content):
+    return [statement.text for statement in iter_schema_statements(content)]
+
+
+def best_of(func, content, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(content)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=50, help='copies of the INSERT data in the large dump')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, 'classicmodels_db.sql'), encoding='utf-8') as f:
+        classicmodels = f.read()
+    inserts = classicmodels[classicmodels.index('insert'):]
+    large = classicmodels + '\n' + '\n'.join([inserts] * args.scale)
+
+    for name, content in (('classicmodels_db.sql', classicmodels), (f'synthetic x{args.scale}', large)):
+        print(f"{name}: {len(content.encode('utf-8')) / 1024 / 1024:.1f} MiB (best of {args.repeat})")
+        for label, func in (('legacy', legacy_parse_schema_statements), ('streaming', streaming_parse)):
+            statements, seconds = best_of(func, content, args.repeat)
+            print(f"  {label:<10} {len(statements):6d} statements  {seconds * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Add answer_key_snapshots table
+
+Revision ID: answer_key_snapshots
+Revises: upgrade_schema_content
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'answer_key_snapshots'
+down_revision = 'upgrade_schema_content'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Store the precomputed result of each question's correct answer so
+    submissions no longer re-run the teacher query.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'answer_key_snapshots' not in inspector.get_table_names():
+        op.create_table('answer_key_snapshots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('question_id', sa.Integer(), nullable=False),
+            sa.Column('source_hash', sa.String(length=64), nullable=False),
+            sa.Column('column_names', sa.Text(), nullable=False),
+            sa.Column('column_types', sa.Text(), nullable=True),
+            sa.Column('row_count', sa.Integer(), nullable=False),
+            sa.Column('ordered_hash', sa.String(length=64), nullable=False),
+            sa.Column('unordered_hash', sa.String(length=64), nullable=False),
+            sa.Column('rows_json', sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('question_id'),
+            mysql_auto_increment=100000
+        )
+
+
+def downgrade():
+    op.drop_table('answer_key_snapshots')
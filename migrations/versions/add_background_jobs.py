@@ -0,0 +1,51 @@
+"""Add background_jobs table
+
+Revision ID: background_jobs
+Revises: schema_table_names
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'background_jobs'
+down_revision = 'schema_table_names'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Persist background jobs (schema deployments and table drops) so their
+    progress can be polled from any worker process.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'background_jobs' not in inspector.get_table_names():
+        op.create_table('background_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('job_type', sa.String(length=50), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('phase', sa.String(length=50), nullable=True),
+            sa.Column('progress', sa.Text(), nullable=True),
+            sa.Column('result', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('target_id', sa.Integer(), nullable=True),
+            sa.Column('created_by', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            mysql_auto_increment=100000
+        )
+        op.create_index('ix_background_jobs_type_target_status', 'background_jobs',
+                        ['job_type', 'target_id', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_background_jobs_type_target_status', table_name='background_jobs')
+    op.drop_table('background_jobs')
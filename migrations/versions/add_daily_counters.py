@@ -0,0 +1,41 @@
+"""Add daily_counters table
+
+Revision ID: daily_counters
+Revises: gradebook_entries
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'daily_counters'
+down_revision = 'gradebook_entries'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Per-day event counters for the admin dashboard. A day's row is seeded
+    from the submissions table the first time it is used, so no backfill is
+    needed.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'daily_counters' not in inspector.get_table_names():
+        op.create_table('daily_counters',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name', 'day', name='unique_daily_counter'),
+            mysql_auto_increment=100000
+        )
+
+
+def downgrade():
+    op.drop_table('daily_counters')
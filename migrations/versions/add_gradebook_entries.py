@@ -0,0 +1,89 @@
+"""Add gradebook_entries table
+
+Revision ID: gradebook_entries
+Revises: version_stamps
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+# One entry per (student, assignment, question), from its latest submission:
+# the newest submitted_at, ties broken by the highest id (as rebuild_gradebook() does)
+BACKFILL_SQL = """
+INSERT INTO gradebook_entries
+    (student_id, assignment_id, question_id, submission_id, is_correct, points_earned,
+     attempts, correct_attempts, submitted_at, updated_at)
+SELECT s.student_id, s.assignment_id, s.question_id, s.id, s.is_correct,
+       CASE WHEN s.is_correct THEN COALESCE(
+           (SELECT MAX(aq.score) FROM assignment_questions aq
+            WHERE aq.assignment_id = s.assignment_id AND aq.question_id = s.question_id), 0)
+       ELSE 0 END,
+       latest.attempts, latest.correct_attempts, s.submitted_at, :now
+FROM (
+    SELECT m.student_id, m.assignment_id, m.question_id, m.attempts, m.correct_attempts,
+           MAX(s2.id) AS submission_id
+    FROM (
+        SELECT student_id, assignment_id, question_id, MAX(submitted_at) AS latest_at,
+               COUNT(*) AS attempts, SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct_attempts
+        FROM submissions
+        GROUP BY student_id, assignment_id, question_id
+    ) m
+    JOIN submissions s2
+      ON s2.student_id = m.student_id AND s2.assignment_id = m.assignment_id
+     AND s2.question_id = m.question_id
+     AND (s2.submitted_at = m.latest_at OR m.latest_at IS NULL)
+    GROUP BY m.student_id, m.assignment_id, m.question_id, m.attempts, m.correct_attempts
+) latest
+JOIN submissions s ON s.id = latest.submission_id
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'gradebook_entries'
+down_revision = 'version_stamps'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Keep each student's latest result per assignment question in its own
+    table, and fill it from the existing submissions so reports of an
+    upgraded installation are complete from the start.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'gradebook_entries' not in inspector.get_table_names():
+        op.create_table('gradebook_entries',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=False),
+            sa.Column('assignment_id', sa.Integer(), nullable=False),
+            sa.Column('question_id', sa.Integer(), nullable=False),
+            sa.Column('submission_id', sa.Integer(), nullable=False),
+            sa.Column('is_correct', sa.Boolean(), nullable=False),
+            sa.Column('points_earned', sa.Integer(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('correct_attempts', sa.Integer(), nullable=False),
+            sa.Column('submitted_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['student_id'], ['users.id'], ),
+            sa.ForeignKeyConstraint(['assignment_id'], ['assignments.id'], ),
+            sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('student_id', 'assignment_id', 'question_id', name='unique_gradebook_entry'),
+            mysql_auto_increment=100000
+        )
+        op.create_index('ix_gradebook_entries_assignment_student', 'gradebook_entries',
+                        ['assignment_id', 'student_id'])
+
+    # Also covers a table created empty by db.create_all() before this migration ran
+    gradebook_entries = sa.table('gradebook_entries', sa.column('id', sa.Integer))
+    if conn.execute(sa.select(gradebook_entries.c.id).limit(1)).first() is None:
+        conn.execute(sa.text(BACKFILL_SQL), {'now': datetime.utcnow()})
+
+
+def downgrade():
+    op.drop_index('ix_gradebook_entries_assignment_student', table_name='gradebook_entries')
+    op.drop_table('gradebook_entries')
@@ -0,0 +1,70 @@
+"""Add composite indexes for the submission and enrollment hot paths
+
+Revision ID: hot_path_indexes
+Revises: daily_counters
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'hot_path_indexes'
+down_revision = 'daily_counters'
+branch_labels = None
+depends_on = None
+
+# table -> [(index name, columns)]; check them with ``flask check-query-plans``
+INDEXES = {
+    'submissions': [
+        ('ix_submissions_student_assignment', ['student_id', 'assignment_id', 'question_id', 'submitted_at']),
+        ('ix_submissions_assignment_student', ['assignment_id', 'student_id', 'question_id']),
+        ('ix_submissions_question', ['question_id']),
+        ('ix_submissions_submitted_at', ['submitted_at']),
+    ],
+    'student_enrollments': [
+        ('ix_student_enrollments_student_active', ['student_id', 'is_active', 'section_id']),
+        ('ix_student_enrollments_section_active', ['section_id', 'is_active', 'student_id']),
+    ],
+    'section_assignments': [
+        ('ix_section_assignments_section_active', ['section_id', 'is_active', 'assignment_id']),
+    ],
+    'assignment_questions': [
+        ('ix_assignment_questions_assignment_order', ['assignment_id', 'order', 'question_id', 'score']),
+    ],
+}
+
+
+def upgrade():
+    """
+    Index the lookups every student and teacher page makes: submissions by
+    student and assignment, by assignment, by question and by time;
+    enrollments by student and by section; a section's active assignments;
+    and an assignment's questions in order. The trailing columns let the
+    usual reads be answered from the index alone.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table)}
+        for name, columns in indexes:
+            if name not in existing:
+                op.create_index(name, table, columns)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table)}
+        for name, _ in reversed(indexes):
+            if name in existing:
+                op.drop_index(name, table_name=table)
@@ -0,0 +1,84 @@
+"""Store imported schema content compressed
+
+Revision ID: schema_content_compression
+Revises: schema_table_hashes
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import hashlib
+import zlib
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'schema_content_compression'
+down_revision = 'schema_table_hashes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Add the compressed content column with its size and hash, then move the
+    existing uncompressed dumps into it one row at a time.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('schema_imports')]
+
+    if 'content_compressed' not in columns:
+        op.add_column('schema_imports', sa.Column('content_compressed',
+                                                  sa.LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql'),
+                                                  nullable=True))
+    if 'content_size' not in columns:
+        op.add_column('schema_imports', sa.Column('content_size', sa.BigInteger(), nullable=True))
+    if 'content_hash' not in columns:
+        op.add_column('schema_imports', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    # New rows only fill the compressed column
+    with op.batch_alter_table('schema_imports') as batch_op:
+        batch_op.alter_column('schema_content', existing_type=mysql.LONGTEXT(), nullable=True)
+
+    schema_imports = sa.table('schema_imports',
+                              sa.column('id', sa.Integer),
+                              sa.column('schema_content', sa.Text),
+                              sa.column('content_compressed', sa.LargeBinary),
+                              sa.column('content_size', sa.BigInteger),
+                              sa.column('content_hash', sa.String))
+    ids = [row[0] for row in conn.execute(
+        sa.select(schema_imports.c.id).where(schema_imports.c.content_compressed.is_(None)))]
+    for schema_id in ids:
+        content = conn.execute(sa.select(schema_imports.c.schema_content)
+                               .where(schema_imports.c.id == schema_id)).scalar()
+        if content is None:
+            continue
+        data = content.encode('utf-8')
+        conn.execute(schema_imports.update()
+                     .where(schema_imports.c.id == schema_id)
+                     .values(content_compressed=zlib.compress(data, 6),
+                             content_size=len(data),
+                             content_hash=hashlib.sha256(data).hexdigest(),
+                             schema_content=None))
+
+
+def downgrade():
+    conn = op.get_bind()
+    schema_imports = sa.table('schema_imports',
+                              sa.column('id', sa.Integer),
+                              sa.column('schema_content', sa.Text),
+                              sa.column('content_compressed', sa.LargeBinary))
+    ids = [row[0] for row in conn.execute(
+        sa.select(schema_imports.c.id).where(schema_imports.c.content_compressed.isnot(None)))]
+    for schema_id in ids:
+        compressed = conn.execute(sa.select(schema_imports.c.content_compressed)
+                                  .where(schema_imports.c.id == schema_id)).scalar()
+        conn.execute(schema_imports.update()
+                     .where(schema_imports.c.id == schema_id)
+                     .values(schema_content=zlib.decompress(compressed).decode('utf-8')))
+
+    with op.batch_alter_table('schema_imports') as batch_op:
+        batch_op.alter_column('schema_content', existing_type=mysql.LONGTEXT(), nullable=False)
+    op.drop_column('schema_imports', 'content_hash')
+    op.drop_column('schema_imports', 'content_size')
+    op.drop_column('schema_imports', 'content_compressed')
@@ -0,0 +1,32 @@
+"""Add table_hashes column to schema_imports
+
+Revision ID: schema_table_hashes
+Revises: background_jobs
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'schema_table_hashes'
+down_revision = 'background_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Record a content hash per deployed table, so redeploying a schema only
+    rebuilds the tables whose statements changed.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('schema_imports')]
+
+    if 'table_hashes' not in columns:
+        op.add_column('schema_imports', sa.Column('table_hashes', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('schema_imports', 'table_hashes')
@@ -0,0 +1,32 @@
+"""Add table_names column to schema_imports
+
+Revision ID: schema_table_names
+Revises: answer_key_snapshots
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'schema_table_names'
+down_revision = 'answer_key_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Record the table names of each imported schema when it is deployed, so
+    query rewriting does not have to re-parse schema_content.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('schema_imports')]
+
+    if 'table_names' not in columns:
+        op.add_column('schema_imports', sa.Column('table_names', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('schema_imports', 'table_names')
@@ -0,0 +1,41 @@
+"""Add version_stamps table
+
+Revision ID: version_stamps
+Revises: schema_content_compression
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'version_stamps'
+down_revision = 'schema_content_compression'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Keep a change counter per section and per student, so the student polling
+    APIs can answer conditional requests without recomputing their payload.
+    """
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'version_stamps' not in inspector.get_table_names():
+        op.create_table('version_stamps',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('scope', sa.String(length=20), nullable=False),
+            sa.Column('scope_id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('next_due_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('scope', 'scope_id', name='unique_version_stamp'),
+            mysql_auto_increment=100000
+        )
+
+
+def downgrade():
+    op.drop_table('version_stamps')